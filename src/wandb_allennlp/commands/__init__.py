@@ -1 +1,9 @@
-from wandb_allennlp.commands import parser_base, train_with_wandb, download_from_wandb
+from wandb_allennlp.commands import (
+    parser_base,
+    train_with_wandb,
+    download_from_wandb,
+    sweep_worker,
+    launch_sweep,
+    query_run_index,
+    apply_retention,
+)
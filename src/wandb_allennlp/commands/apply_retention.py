@@ -0,0 +1,114 @@
+from typing import List, Dict, Any, Optional
+from .parser_base import WandbParserBase
+from allennlp.commands import Subcommand
+from wandb_allennlp.config import ALLENNLP_CONTENT_STORE
+from wandb_allennlp.content_store import ContentStore
+from wandb_allennlp.retention import RetentionPolicy, apply_retention
+from wandb_allennlp.run_index import RunIndex
+import argparse
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def main(args: argparse.Namespace) -> None:
+    policy = RetentionPolicy(
+        metric=args.metric,
+        keep_top_k=args.keep_top_k,
+        keep_days=args.keep_days,
+        archives_only=args.archives_only,
+    )
+    deleted, reclaimed = apply_retention(
+        RunIndex(args.index),
+        policy,
+        sweep_id=args.sweep_id,
+        num_workers=args.num_workers,
+        dry_run=args.dry_run,
+    )
+
+    if not args.dry_run and os.path.isdir(ALLENNLP_CONTENT_STORE):
+        # the files that were only kept for the deleted runs
+        reclaimed += ContentStore().collect_garbage()
+
+    for run_id, paths in sorted(deleted.items()):
+        for path in paths:
+            print(f"{run_id}\t{path}")
+    print(
+        f"{'Would reclaim' if args.dry_run else 'Reclaimed'} "
+        f"{reclaimed / 2**30:.2f} GiB from {len(deleted)} runs"
+    )
+
+
+@Subcommand.register("wandb-retention")
+class ApplyRetention(WandbParserBase):
+    description = "Delete the checkpoints and archives of runs that are not worth keeping"
+    help_message = (
+        "Use `allennlp wandb-retention --metric=+best_validation_accuracy --keep-top-k=3"
+        " --keep-days=7` to keep only the checkpoints of the 3 best runs of every sweep"
+        " and of the runs of the last week. The other runs keep their config, metrics and"
+        " logs. The runs are taken from the run index (see `wandb-index`)."
+    )
+    require_run_id = False
+    entry_point = main
+
+    def add_arguments(
+        self, subparser: argparse.ArgumentParser
+    ) -> argparse.ArgumentParser:
+        subparser.add_argument(
+            "--metric",
+            type=str,
+            default=None,
+            help=(
+                "Key of metrics.json to rank the runs of a sweep by."
+                " Prefix it with - if lower is better."
+            ),
+        )
+        subparser.add_argument(
+            "--keep-top-k",
+            type=int,
+            default=None,
+            help="Number of best runs per sweep to keep.",
+        )
+        subparser.add_argument(
+            "--keep-days",
+            type=float,
+            default=None,
+            help="Keep the runs updated in the last N days.",
+        )
+        subparser.add_argument(
+            "--archives-only",
+            action="store_true",
+            default=False,
+            help=(
+                "Keep only the archive (model.tar.gz) of the runs that are kept,"
+                " and delete their checkpoints."
+            ),
+        )
+        subparser.add_argument(
+            "--sweep-id",
+            type=str,
+            default=None,
+            help="Only consider the runs of this sweep.",
+        )
+        subparser.add_argument(
+            "--num-workers",
+            type=int,
+            default=8,
+            help="Number of files deleted concurrently.",
+        )
+        subparser.add_argument(
+            "--dry-run",
+            action="store_true",
+            default=False,
+            help="Only show what would be deleted.",
+        )
+        subparser.add_argument(
+            "--index",
+            type=str,
+            default=None,
+            help="Path to the index. Default: ALLENNLP_RUN_INDEX",
+        )
+        subparser.set_defaults(func=main)
+
+        return subparser
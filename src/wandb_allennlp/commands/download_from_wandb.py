@@ -1,5 +1,5 @@
-from typing import Tuple, List, Dict
-from .parser_base import WandbParserBase
+from typing import Tuple, List, Dict, Optional
+from .parser_base import WandbParserBase, read_from_env
 from allennlp.commands import Subcommand
 import argparse
 import wandb
@@ -10,17 +10,67 @@ from pathlib import Path
 logger = logging.getLogger(__name__)
 
 
-def main(args: argparse.Namespace) -> None:
+def run_path(
+    run_id: str, entity: Optional[str] = None, project: Optional[str] = None
+) -> str:
+    """
+    The path of a run for `wandb.Api().run()`. A missing entity or project
+    is read from `WANDB_ENTITY` or `WANDB_PROJECT`, and otherwise left to
+    the defaults of the API.
+    """
+    entity = entity or read_from_env("WANDB_ENTITY")
+    project = project or read_from_env("WANDB_PROJECT")
+
+    if project is None:
+        return run_id
+
+    if entity is None:
+        return f"{project}/{run_id}"
+
+    return f"{entity}/{project}/{run_id}"
+
+
+def download_run_files(
+    run_path: str,
+    output_folder: Path,
+    replace: bool = False,
+    only_missing: bool = False,
+) -> List[str]:
+    """
+    Downloads the files of a run.
+
+    Args:
+        run_path: entity/project/run_id of the run. See :func:`run_path`.
+        output_folder: Where to put the files.
+        replace: Whether to overwrite existing files.
+        only_missing: Only download the files that do not exist locally.
+
+    Returns:
+        The names of the downloaded files.
+    """
     api = wandb.Api()  # type: ignore
-    run = api.run(
-        f"{args.wandb_entity}/{args.wandb_project}/{args.wandb_run_id}"
-    )
-    args.output_folder.mkdir(parents=True, exist_ok=True)
-    pbar = tqdm.tqdm(run.files(), desc="Downloading files")
+    run = api.run(run_path)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    files = [
+        file_
+        for file_ in run.files()
+        if not (only_missing and (output_folder / file_.name).exists())
+    ]
+    pbar = tqdm.tqdm(files, desc="Downloading files")
 
     for file_ in pbar:
         pbar.set_description(f"Downloading: {file_.name}")
-        file_.download(args.output_folder, replace=args.replace)
+        file_.download(str(output_folder), replace=replace)
+
+    return [file_.name for file_ in files]
+
+
+def main(args: argparse.Namespace) -> None:
+    download_run_files(
+        run_path(args.wandb_run_id, args.wandb_entity, args.wandb_project),
+        args.output_folder,
+        replace=args.replace,
+    )
 
     logger.info(f"Downloaded all files to {args.output_folder}")
 
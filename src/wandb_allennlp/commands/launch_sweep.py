@@ -0,0 +1,171 @@
+from typing import List, Dict, Any, Optional
+from .parser_base import WandbParserBase
+from allennlp.commands import Subcommand
+from wandb_allennlp.config import ALLENNLP_SERIALIZATION_DIR
+from wandb_allennlp.sweep.controller import LocalSweepController
+from wandb_allennlp.sweep.scheduler import (
+    SweepScheduler,
+    TrialSource,
+    WandbAgentTrialSource,
+    ParameterSetTrialSource,
+    device_slots,
+)
+import argparse
+import json
+import logging
+import os
+import sys
+import yaml
+
+logger = logging.getLogger(__name__)
+
+
+def read_parameter_sets(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def create_trial_source(
+    args: argparse.Namespace, num_slots: int
+) -> TrialSource:
+    if not os.path.isfile(args.sweep):
+        return WandbAgentTrialSource(
+            args.sweep, num_agents=num_slots, count=args.count
+        )
+    with open(args.sweep) as f:
+        sweep_config = yaml.safe_load(f)
+
+    if args.parameter_sets is None:
+        name = sweep_config.get("name") or os.path.splitext(
+            os.path.basename(args.sweep)
+        )[0]
+
+        return LocalSweepController(
+            sweep_config,
+            store=args.store
+            or os.path.join(ALLENNLP_SERIALIZATION_DIR, "sweeps", f"{name}.jsonl"),
+            seed=args.seed,
+            count=args.count,
+        )
+
+    return ParameterSetTrialSource(
+        read_parameter_sets(args.parameter_sets),
+        command=sweep_config.get("command"),
+        program=sweep_config.get("program", "allennlp"),
+        count=args.count,
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    devices = args.devices.split(",") if args.devices else None
+    slots = device_slots(
+        devices,
+        cpu_slots=args.cpu_slots,
+        slots_per_device=args.slots_per_device,
+    )
+    scheduler = SweepScheduler(
+        create_trial_source(args, len(slots)),
+        slots,
+        max_restarts=args.max_restarts,
+        log_dir=args.log_dir,
+    )
+    returncodes = scheduler.run()
+
+    if any(returncodes.values()):
+        sys.exit(1)
+
+
+@Subcommand.register("wandb-sweep-launcher")
+class LaunchSweep(WandbParserBase):
+    description = "Run the trials of a sweep concurrently on the devices of a node"
+    help_message = (
+        "Use `allennlp wandb-sweep-launcher <sweep_id> --devices=0,1,2,3` instead of "
+        "starting one `wandb agent <sweep_id>` per GPU by hand. "
+        "Every trial is pinned to its device through CUDA_VISIBLE_DEVICES, "
+        "so the config should use `cuda_device: 0` (or -1 with --cpu-slots). "
+        "With a sweep id, every slot runs one `wandb agent` until the sweep is over. "
+        "Otherwise, failed trials are restarted and a new trial is started as soon "
+        "as a slot is free. "
+        "If <sweep_id> is the path to a sweep config, the trials are proposed locally "
+        "without the wandb sweep server."
+    )
+    require_run_id = False
+    entry_point = main
+
+    def add_arguments(
+        self, subparser: argparse.ArgumentParser
+    ) -> argparse.ArgumentParser:
+        subparser.add_argument(
+            "sweep",
+            type=str,
+            help=(
+                "Sweep id in the form entity/project/sweep_id, or the path "
+                "to a sweep config to run the sweep without the wandb sweep server."
+            ),
+        )
+        subparser.add_argument(
+            "--devices",
+            type=str,
+            default=None,
+            help="Comma separated list of CUDA devices to use.",
+        )
+        subparser.add_argument(
+            "--cpu-slots",
+            type=int,
+            default=0,
+            help="Number of concurrent trials to run on the CPU.",
+        )
+        subparser.add_argument(
+            "--slots-per-device",
+            type=int,
+            default=1,
+            help="Number of concurrent trials on each device in --devices.",
+        )
+        subparser.add_argument(
+            "--count",
+            type=int,
+            default=None,
+            help="Total number of trials to run. Default: until the sweep is over.",
+        )
+        subparser.add_argument(
+            "--max-restarts",
+            type=int,
+            default=2,
+            help=(
+                "Number of times a failed trial of a local sweep is restarted. "
+                "The trials run by `wandb agent` are not restarted."
+            ),
+        )
+        subparser.add_argument(
+            "--parameter-sets",
+            type=str,
+            default=None,
+            help=(
+                "Path to a JSON lines file with one set of parameters per line. "
+                "The trials use these instead of the parameters in the sweep config."
+            ),
+        )
+        subparser.add_argument(
+            "--store",
+            type=str,
+            default=None,
+            help=(
+                "JSON lines file to record the results of a local sweep in. "
+                "Default: ALLENNLP_SERIALIZATION_DIR/sweeps/<sweep name>.jsonl"
+            ),
+        )
+        subparser.add_argument(
+            "--seed",
+            type=int,
+            default=None,
+            help="Seed for the parameters proposed by a local sweep.",
+        )
+        subparser.add_argument(
+            "--log-dir",
+            type=str,
+            default=None,
+            help="Directory to write the output of every trial to.",
+        )
+        subparser.set_defaults(func=main)
+
+        return subparser
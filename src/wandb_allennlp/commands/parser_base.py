@@ -152,13 +152,19 @@ class WandbParserBase(Subcommand):
             "--wandb-config-exclude-keys",
             type=str,
             action=SetWandbEnvVar,
-            help="Comma seperated list.",
+            help=(
+                "Comma seperated list of glob patterns of config keys, like"
+                " dataset_reader or *.pretrained_file, not to log."
+            ),
         )
         subparser.add_argument(
             "--wandb-config-include-keys",
             type=str,
             action=SetWandbEnvVar,
-            help="Comma seperated list.",
+            help=(
+                "Comma seperated list of glob patterns of config keys, like"
+                " model.* or trainer.optimizer.lr, to log. Default: all."
+            ),
         )
         subparser.add_argument(
             "--wandb-mode",
@@ -0,0 +1,187 @@
+from typing import List, Dict, Any, Optional
+from .parser_base import WandbParserBase
+from allennlp.commands import Subcommand
+from wandb_allennlp.config import ALLENNLP_SERIALIZATION_DIR
+from wandb_allennlp.run_index import RunIndex, RUN_FIELDS, parse_filter
+from wandb_allennlp.training.callbacks.utils import (
+    flatten_dict,
+    get_config_from_serialization_dir,
+)
+import argparse
+import glob
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def index_serialization_dirs(index: RunIndex, root: str) -> int:
+    """
+    Adds the serialization dirs in `root` that are not in the index, e.g.,
+    the ones of runs from before the index was used.
+
+    Returns:
+        The number of runs added.
+    """
+    known = {run["serialization_dir"] for run in index.query()}
+    added = 0
+
+    for path in sorted(glob.glob(os.path.join(root, "run-*"))):
+        path = os.path.abspath(path)
+
+        if path in known or not os.path.isdir(path):
+            continue
+        run_id = os.path.basename(path).rsplit("-", 1)[-1]
+        metrics_path = os.path.join(path, "metrics.json")
+        metrics: Optional[Dict[str, Any]] = None
+
+        if os.path.isfile(metrics_path):
+            with open(metrics_path) as f:
+                metrics = flatten_dict(json.load(f))
+        try:
+            config = get_config_from_serialization_dir(path)
+        except (OSError, ValueError):
+            config = None
+        index.add_run(run_id, path, config=config)
+        index.finish_run(
+            run_id, "finished" if metrics is not None else "unknown", metrics
+        )
+        added += 1
+
+    return added
+
+
+def prune_index(index: RunIndex) -> int:
+    """
+    Removes the runs whose serialization dir does not exist anymore.
+
+    Returns:
+        The number of runs removed.
+    """
+    removed = 0
+
+    for run in index.query():
+        if not os.path.isdir(run["serialization_dir"]):
+            index.remove_run(run["run_id"])
+            removed += 1
+
+    return removed
+
+
+def format_table(runs: List[Dict[str, Any]], fields: List[str]) -> str:
+    lines = ["\t".join(fields)]
+
+    for run in runs:
+        lines.append(
+            "\t".join("" if run[f] is None else str(run[f]) for f in fields)
+        )
+
+    return "\n".join(lines)
+
+
+def main(args: argparse.Namespace) -> None:
+    index = RunIndex(args.index)
+
+    if args.update:
+        logger.info(
+            f"Added {index_serialization_dirs(index, args.root)} runs to the index"
+        )
+
+    if args.prune:
+        logger.info(f"Removed {prune_index(index)} runs from the index")
+    extra_fields = args.fields.split(",") if args.fields else []
+    runs = index.query(
+        [parse_filter(f) for f in args.filters],
+        fields=extra_fields,
+        order_by=args.order_by,
+        limit=args.limit,
+    )
+
+    if args.json:
+        for run in runs:
+            print(json.dumps(run))
+    else:
+        fields = ["run_id", "status", "serialization_dir"] + [
+            f for f in extra_fields if f not in ["run_id", "status"]
+        ]
+        print(format_table(runs, fields))
+
+
+@Subcommand.register("wandb-index")
+class QueryRunIndex(WandbParserBase):
+    description = "Find runs through the local index of serialization dirs"
+    help_message = (
+        "Use `allennlp wandb-index sweep_id=<sweep id> 'metrics.best_validation_accuracy>0.9'"
+        " --fields=config.trainer.optimizer.lr --order-by=-metrics.best_validation_accuracy`"
+        " to find the serialization dirs of runs without listing ALLENNLP_SERIALIZATION_DIR."
+        " The index is kept up to date by the wandb_allennlp callback."
+    )
+    require_run_id = False
+    entry_point = main
+
+    def add_arguments(
+        self, subparser: argparse.ArgumentParser
+    ) -> argparse.ArgumentParser:
+        subparser.add_argument(
+            "filters",
+            nargs="*",
+            default=[],
+            help=(
+                "Conditions like <field><operator><value>, e.g., status=finished"
+                " or config.model.dropout>=0.1. The field is one of "
+                f"{', '.join(RUN_FIELDS)} or a config or metrics key prefixed"
+                " with config. or metrics. The value is read as JSON if possible."
+            ),
+        )
+        subparser.add_argument(
+            "--fields",
+            type=str,
+            default=None,
+            help="Comma separated list of fields to show besides the serialization dir.",
+        )
+        subparser.add_argument(
+            "--order-by",
+            type=str,
+            default=None,
+            help="Field to sort by. Prefix it with - for descending order.",
+        )
+        subparser.add_argument(
+            "--limit", type=int, default=None, help="Number of runs to show."
+        )
+        subparser.add_argument(
+            "--json",
+            action="store_true",
+            default=False,
+            help="Print one JSON object per run.",
+        )
+        subparser.add_argument(
+            "--update",
+            action="store_true",
+            default=False,
+            help=(
+                "Add the serialization dirs in --root that are not in the index."
+                " This lists the directory once."
+            ),
+        )
+        subparser.add_argument(
+            "--prune",
+            action="store_true",
+            default=False,
+            help="Remove the runs whose serialization dir was deleted.",
+        )
+        subparser.add_argument(
+            "--root",
+            type=str,
+            default=ALLENNLP_SERIALIZATION_DIR,
+            help="Directory with the serialization dirs for --update.",
+        )
+        subparser.add_argument(
+            "--index",
+            type=str,
+            default=None,
+            help="Path to the index. Default: ALLENNLP_RUN_INDEX",
+        )
+        subparser.set_defaults(func=main)
+
+        return subparser
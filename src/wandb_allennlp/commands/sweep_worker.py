@@ -0,0 +1,181 @@
+from typing import List, Dict, Any, Optional
+from .parser_base import WandbParserBase, read_from_env
+from .train_with_wandb import translate, generate_serialization_dir
+from allennlp.commands import Subcommand
+from wandb_allennlp.config import ALLENNLP_DATA_CACHE_DIR
+from wandb_allennlp.overrides import load_params
+from wandb_allennlp.utils import environment_variables
+from wandb_allennlp.training.data_cache import (
+    DATA_CACHE,
+    train_model_with_cache,
+)
+import argparse
+import gc
+import logging
+import multiprocessing
+import os
+import yaml
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def read_sweep_params_from_env() -> List[str]:
+    """Reads the parameters that `wandb agent` assigned to the current trial.
+
+    Returns:
+        The parameters in the same ``--key=value`` form that `wandb agent`
+        uses for ``${args}`` in the command of a sweep.
+    """
+    import wandb
+
+    with open(os.environ[wandb.env.SWEEP_PARAM_PATH]) as f:
+        config = yaml.safe_load(f)
+
+    return [
+        f"--{k}={v['value']}"
+        for k, v in config.items()
+        if k != "wandb_version"
+    ]
+
+
+def run_trial(args: argparse.Namespace) -> None:
+    hyperparams = read_sweep_params_from_env()
+    _, hparams_for_overrides, env_vars = translate(hyperparams)
+
+    # the jsonnet reads the env vars while the params are being loaded. They
+    # must not leak into the later trials of this process.
+    with environment_variables(env_vars):
+        _run_trial(args, hparams_for_overrides, env_vars)
+
+
+def _run_trial(
+    args: argparse.Namespace,
+    hparams_for_overrides: Dict[str, Any],
+    env_vars: Dict[str, str],
+) -> None:
+    # the jsonnet is evaluated once for all the trials with the same env vars
+    params = load_params(args.param_path, hparams_for_overrides, env_vars)
+    serialization_dir = str(
+        generate_serialization_dir(read_from_env("WANDB_RUN_ID"))
+    )
+    train_kwargs: Dict[str, Any] = dict(
+        include_package=args.include_package,
+        file_friendly_logging=args.file_friendly_logging,
+    )
+
+    if args.fork_trials or args.data_cache:
+        # Load the data in this process so that forked children
+        # inherit it instead of loading it themselves.
+        DATA_CACHE.warm(params.duplicate())
+
+    if args.fork_trials:
+        process = multiprocessing.get_context("fork").Process(
+            target=train_model_with_cache,
+            args=(params, serialization_dir),
+            kwargs=train_kwargs,
+        )
+        process.start()
+        process.join()
+
+        if process.exitcode != 0:
+            raise RuntimeError(
+                f"Trial process exited with code {process.exitcode}"
+            )
+    else:
+        train_model_with_cache(params, serialization_dir, **train_kwargs)
+        gc.collect()
+
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+def main(args: argparse.Namespace) -> None:
+    import wandb
+
+    DATA_CACHE.max_entries = args.max_cached_datasets
+
+    if args.data_cache:
+        DATA_CACHE.cache_dir = ALLENNLP_DATA_CACHE_DIR
+    wandb.agent(
+        args.sweep_id,
+        function=lambda: run_trial(args),
+        count=args.count,
+    )
+
+
+@Subcommand.register("wandb-sweep-worker")
+class SweepWorker(WandbParserBase):
+    description = "Run the trials of a wandb sweep in a single long-lived process"
+    help_message = (
+        "Use `allennlp wandb-sweep-worker <sweep_id> <param_path>` instead of "
+        "`wandb agent <sweep_id>` to run the trials of a sweep without "
+        "restarting python for every trial. The instances and the vocabulary are "
+        "cached in memory and reused by all the trials that share the "
+        "data related part of the config. "
+        "The parameters of the sweep are interpreted just like the arguments of "
+        "`allennlp train-with-wandb`."
+    )
+    require_run_id = False
+    entry_point = main
+
+    def add_arguments(
+        self, subparser: argparse.ArgumentParser
+    ) -> argparse.ArgumentParser:
+        subparser.add_argument(
+            "sweep_id",
+            type=str,
+            help="Sweep id in the form entity/project/sweep_id or just sweep_id.",
+        )
+        subparser.add_argument(
+            "param_path",
+            type=str,
+            help="path to parameter file describing the model to be trained",
+        )
+        subparser.add_argument(
+            "--count",
+            type=int,
+            default=None,
+            help="Number of trials to run. Default: run until the sweep is over.",
+        )
+        subparser.add_argument(
+            "--fork-trials",
+            action="store_true",
+            default=False,
+            help=(
+                "Run every trial in a forked child process. The data is loaded once in the"
+                " worker and inherited by the children while the model, optimizer and"
+                " CUDA state are released at the end of every trial."
+            ),
+        )
+        subparser.add_argument(
+            "--max-cached-datasets",
+            type=int,
+            default=2,
+            help="Number of distinct data configs to keep in memory.",
+        )
+        subparser.add_argument(
+            "--data-cache",
+            action="store_true",
+            default=False,
+            help=(
+                "Also share the cached data with other processes on this node"
+                " through ALLENNLP_DATA_CACHE_DIR."
+            ),
+        )
+        subparser.add_argument(
+            "--file-friendly-logging",
+            action="store_true",
+            default=False,
+            help="outputs tqdm status on separate lines and slows tqdm refresh rate",
+        )
+        subparser.add_argument(
+            "--include-package",
+            type=str,
+            action="append",
+            default=[],
+            help="additional packages to include",
+        )
+        subparser.set_defaults(func=main)
+
+        return subparser
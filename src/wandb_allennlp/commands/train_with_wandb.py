@@ -1,6 +1,7 @@
 from typing import Tuple, List, Dict, Any, Optional
 from .parser_base import WandbParserBase, read_from_env
-from allennlp.commands.train import train_model_from_args
+from wandb_allennlp.utils import generate_run_id
+from allennlp.commands.train import train_model
 from allennlp.commands import Subcommand
 import argparse
 import logging
@@ -11,8 +12,23 @@ import os
 import sys
 from datetime import datetime
 from pathlib import Path
-from wandb_allennlp.config import ALLENNLP_SERIALIZATION_DIR
-import shortuuid
+from wandb_allennlp.config import (
+    ALLENNLP_SERIALIZATION_DIR,
+    ALLENNLP_DATA_CACHE_DIR,
+)
+from wandb_allennlp.training.data_cache import (
+    DATA_CACHE,
+    train_model_with_cache,
+)
+from wandb_allennlp.training.callbacks.live_sync import LiveFileSync
+from wandb_allennlp.training.resume import (
+    find_serialization_dir,
+    verify_checkpoints,
+)
+from wandb_allennlp.run_index import RunIndex
+from wandb_allennlp.content_store import unshare
+from wandb_allennlp.overrides import load_params
+import atexit
 import signal
 
 logger = logging.getLogger(__name__)
@@ -25,38 +41,79 @@ def generate_serialization_dir(wandb_run_id: Optional[str] = None) -> Path:
     datetime_now: datetime = datetime.now()
 
     if wandb_run_id is None:
-        # ref: wandb/sdk/lib/runid.py
-        run_gen = shortuuid.ShortUUID(
-            alphabet=list("0123456789abcdefghijklmnopqrstuvwxyz")
-        )
-        wandb_run_id = run_gen.random(8)  # type: ignore[no-untyped-call]
+        wandb_run_id = generate_run_id()
     s = f'run-{datetime.strftime(datetime_now, "%Y%m%d_%H%M%S")}-{wandb_run_id}'
 
     return root_dir / s
 
 
-def create_dict_for_numbers(k: str, value: Any) -> Dict:
-    for ki in k.split("."):
-        if ki.isdigit:
-            logger.warning(
-                "Using something like "
-                "--key.0.something.1=value to index into a list is not"
-                " supported while overriding hyperparams."
-                "If you are trying this, you should consider using env"
-                "variable to achive this."
-            )
+def prepare_resume(args: argparse.Namespace) -> None:
+    """
+    Points `args` to the existing serialization dir of `args.wandb_run_id`
+    and sets it up for `--recover`.
+
+    The directory is looked up in the local run index. Only if it cannot be
+    found or lacks the config, the missing files are downloaded from wandb.
+    Broken checkpoints are moved out of the way and files shared through the
+    content store get private copies.
+    """
+    from .download_from_wandb import download_run_files, run_path
+
+    run_id = args.wandb_run_id
+
+    if run_id is None:
+        raise ValueError("--resume needs --wandb-run-id or WANDB_RUN_ID.")
+    index = RunIndex()
+    serialization_dir = (
+        str(args.serialization_dir)
+        if args.serialization_dir is not None
+        else find_serialization_dir(run_id, index)
+    )
 
-    return None
+    if serialization_dir is None or not os.path.isfile(
+        os.path.join(serialization_dir, "config.json")
+    ):
+        serialization_dir = serialization_dir or str(
+            generate_serialization_dir(run_id)
+        )
+        logger.info(
+            f"Downloading the missing files of run {run_id} to {serialization_dir}"
+        )
+        download_run_files(
+            run_path(run_id, args.wandb_entity, args.wandb_project),
+            Path(serialization_dir),
+            only_missing=True,
+        )
+        index.add_run(run_id, serialization_dir)
+    verify_checkpoints(serialization_dir, run_id, index)
+    # allennlp writes the vocabulary again, which must not change other runs
+    unshare(serialization_dir)
+    logger.info(f"Resuming run {run_id} from {serialization_dir}")
+    args.serialization_dir = serialization_dir
+    args.recover = True
+    args.force = False
+    # the callback calls wandb.init(), which resumes the run
+    os.environ.update({"WANDB_RUN_ID": run_id, "WANDB_RESUME": "allow"})
 
 
 def translate(
     hyperparams: List[str],
 ) -> Tuple[List[str], Dict[str, Any], Dict[str, Any]]:
+    """
+    Splits the unknown arguments into the overrides of the config and the
+    env vars (`--env.<name>=value`).
+
+    The keys of the overrides are dotted paths (see
+    `wandb_allennlp.overrides.compile_path`) that can index into lists,
+    e.g., `model.encoder.layers.0.dropout`, `model.encoder.layers.-1.dropout`
+    or `trainer.callbacks.+` to append.
+    """
     hparams = {}  #: temporary variable
     env = {}  #: params that start with env.
     all_args: List[str] = []  #: raw strings of all the unknown arguments
-    # patter for starting -- or - in --key=value
-    pattern = re.compile(r"-{1,2}")
+    # patter for starting -- or - in --key=value, but not for negative
+    # list indices inside the key
+    pattern = re.compile(r"^-{1,2}")
 
     for possible_kwarg in hyperparams:
         kw_val = possible_kwarg.split("=")
@@ -138,6 +195,11 @@ class TrainWithWandb(WandbParserBase):
         import wandb
 
         wandb_args_dict = cls.get_wandb_run_args(args)
+        # not an argument of wandb.init()
+        wandb_args_dict.pop("allennlp_files_to_save", None)
+        # patterns that the callback applies to the config
+        wandb_args_dict.pop("config_include_keys", None)
+        wandb_args_dict.pop("config_exclude_keys", None)
 
         logger.info(
             f"Early init is ON. Initializing wandb with the following args."
@@ -155,12 +217,29 @@ class TrainWithWandb(WandbParserBase):
         # syncs the tensorboard log folder along with the other folders.
         # wandb.tensorboard.patch(save=True, tensorboardX=False)
 
-        for fpath in args.wandb_files_to_save:
-            self.wandb.save(  # type: ignore
-                os.path.join(args.serialization_dir, fpath),
-                base_path=args.serialization_dir,
-                policy="live",
+        files_to_save = args.wandb_allennlp_files_to_save or [
+            "config.json",
+            "out.log",
+        ]
+
+        if args.live_sync:
+            live_file_sync = LiveFileSync(
+                str(args.serialization_dir),
+                files_to_save,
+                os.path.join(run.dir, "live"),
+                min_interval=args.live_sync_interval,
+                max_bytes_per_second=args.live_sync_max_bytes_per_second,
             )
+            live_file_sync.start()
+            # runs before the exit handler of wandb, which is registered earlier
+            atexit.register(live_file_sync.stop)
+        else:
+            for fpath in files_to_save:
+                wandb.save(
+                    os.path.join(args.serialization_dir, fpath),
+                    base_path=args.serialization_dir,
+                    policy="live",
+                )
 
         return run
 
@@ -255,6 +334,58 @@ class TrainWithWandb(WandbParserBase):
                 "Default: ['config.json', 'out.log']"
             ),
         )
+        subparser.add_argument(
+            "--resume",
+            action="store_true",
+            default=False,
+            help=(
+                "Resume the run given by --wandb-run-id (or WANDB_RUN_ID) from its"
+                " serialization dir, which is found through the local run index."
+                " Broken checkpoints are moved aside and only missing files are"
+                " downloaded from wandb."
+            ),
+        )
+        subparser.add_argument(
+            "--live-sync",
+            action="store_true",
+            default=False,
+            help=(
+                "With --early-init, upload only what is appended to the files to save"
+                " instead of uploading the whole files whenever they change."
+            ),
+        )
+        subparser.add_argument(
+            "--live-sync-interval",
+            type=float,
+            default=30.0,
+            help="Minimum number of seconds between two uploads with --live-sync.",
+        )
+        subparser.add_argument(
+            "--live-sync-max-bytes-per-second",
+            type=float,
+            default=None,
+            help="Upload bandwidth limit with --live-sync. Default: no limit.",
+        )
+        subparser.add_argument(
+            "--data-cache",
+            action="store_true",
+            default=False,
+            help=(
+                "Reuse the indexed instances and the vocabulary of earlier runs "
+                "with the same dataset_reader, data paths and vocabulary. "
+                "The cache is kept in ALLENNLP_DATA_CACHE_DIR, which defaults to "
+                "'.allennlp_data_cache' next to ALLENNLP_SERIALIZATION_DIR."
+            ),
+        )
+        subparser.add_argument(
+            "--skip-override-type-check",
+            action="store_true",
+            default=False,
+            help=(
+                "Only check that the overrides point into the config, not that"
+                " their values have the types of the values they replace."
+            ),
+        )
         ######## End: Specific keyword arguments for `allennlp train_with_wandb`##########
 
         # we will not do anything if the subcommand is not train_with_wandb
@@ -299,7 +430,7 @@ class TrainWithWandb(WandbParserBase):
         # set env vars
         os.environ.update(env_vars)
 
-        subparser.set_defaults(func=main)
+        subparser.set_defaults(func=main, env_overrides=env_vars)
 
         return subparser
 
@@ -314,6 +445,17 @@ def main(args: argparse.Namespace) -> None:
     #   2. If run_id cannot be obtained, we will generate a random id and treat
     #       it as run_id to generate a serialization-dir in ALLENNLP_SERIALIZATION_DIR
 
+    # Fail on overrides that do not fit the config before anything is
+    # created. The evaluated jsonnet is cached for the next trials.
+    params = load_params(
+        args.param_path,
+        args.overrides,
+        getattr(args, "env_overrides", None),
+        check_types=not args.skip_override_type_check,
+    )
+
+    if args.resume:
+        prepare_resume(args)
 
     if args.serialization_dir is None:
         logging.info(f"Set set serialization_dir as {args.serialization_dir}")
@@ -321,4 +463,27 @@ def main(args: argparse.Namespace) -> None:
 
     if args.early_init:
         wandb_run = TrainWithWandb.init_wandb_run(args)
-    train_model_from_args(args)
+
+    if args.data_cache:
+        DATA_CACHE.cache_dir = ALLENNLP_DATA_CACHE_DIR
+        DATA_CACHE.warm(params.duplicate())
+        train_model_with_cache(
+            params,
+            args.serialization_dir,
+            recover=args.recover,
+            force=args.force,
+            include_package=args.include_package,
+            dry_run=args.dry_run,
+            file_friendly_logging=args.file_friendly_logging,
+        )
+    else:
+        train_model(
+            params,
+            args.serialization_dir,
+            recover=args.recover,
+            force=args.force,
+            node_rank=args.node_rank,
+            include_package=args.include_package,
+            dry_run=args.dry_run,
+            file_friendly_logging=args.file_friendly_logging,
+        )
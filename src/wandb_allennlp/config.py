@@ -3,3 +3,30 @@ import os
 ALLENNLP_SERIALIZATION_DIR = os.environ.get(
     "ALLENNLP_SERIALIZATION_DIR", ".allennlp_models"
 )
+
+# shared by all the runs that use ALLENNLP_SERIALIZATION_DIR
+ALLENNLP_DATA_CACHE_DIR = os.environ.get(
+    "ALLENNLP_DATA_CACHE_DIR",
+    os.path.join(
+        os.path.dirname(os.path.abspath(ALLENNLP_SERIALIZATION_DIR)),
+        ".allennlp_data_cache",
+    ),
+)
+
+# index of the serialization dirs in ALLENNLP_SERIALIZATION_DIR
+ALLENNLP_RUN_INDEX = os.environ.get(
+    "ALLENNLP_RUN_INDEX",
+    os.path.join(ALLENNLP_SERIALIZATION_DIR, "index.sqlite"),
+)
+
+# files with the same content in different serialization dirs are stored once
+ALLENNLP_CONTENT_STORE = os.environ.get(
+    "ALLENNLP_CONTENT_STORE",
+    os.path.join(ALLENNLP_SERIALIZATION_DIR, ".content_store"),
+)
+
+# configs resolved from jsonnet, shared by all the trials of a sweep
+ALLENNLP_CONFIG_CACHE_DIR = os.environ.get(
+    "ALLENNLP_CONFIG_CACHE_DIR",
+    os.path.join(ALLENNLP_DATA_CACHE_DIR, "configs"),
+)
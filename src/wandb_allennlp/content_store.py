@@ -0,0 +1,219 @@
+"""Store files with identical content, like vocabularies, once for all runs.
+
+The trials of a sweep usually write the same vocabulary, and often the same
+pretrained embeddings, to their serialization directories. A
+:class:`ContentStore` keeps one copy of each content, addressed by its sha256,
+and replaces the files in the serialization directories by reflinks
+(copy-on-write clones) of it or, where the file system has no reflinks, by
+hardlinks.
+"""
+from typing import List, Tuple, Union, Dict, Any, Optional, Iterable
+import glob
+import logging
+import os
+import shutil
+import stat
+from wandb_allennlp.config import ALLENNLP_CONTENT_STORE
+from wandb_allennlp.run_index import hash_file
+
+logger = logging.getLogger(__name__)
+
+# from linux/fs.h
+FICLONE = 0x40049409
+
+
+def reflink(source: str, target: str) -> None:
+    """Creates `target` as a copy-on-write clone of `source`."""
+    import fcntl
+
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            os.remove(target)
+            raise
+
+
+def _temporary_path(path: str) -> str:
+    return f"{path}.{os.getpid()}.tmp"
+
+
+class ContentStore:
+    """
+    Content addressed store of files in `root`.
+
+    Hardlinked files share the inode with the store, so they are made read
+    only. Writing to such a file in place would change it in every run.
+    :func:`unshare` gives a directory private copies again, e.g., before
+    training is resumed in it.
+
+    Args:
+        root: The directory of the store. Defaults to `ALLENNLP_CONTENT_STORE`.
+        use_hardlinks: Fall back to hardlinks if reflinks are not supported.
+    """
+
+    def __init__(
+        self, root: Optional[str] = None, use_hardlinks: bool = True
+    ) -> None:
+        self.root = root or ALLENNLP_CONTENT_STORE
+        self.use_hardlinks = use_hardlinks
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def _link(self, source: str, target: str) -> str:
+        """
+        Atomically replaces (or creates) `target` by a reflink or hardlink
+        of `source`.
+
+        Returns:
+            `"reflink"` or `"hardlink"`.
+        """
+        temporary = _temporary_path(target)
+
+        try:
+            reflink(source, temporary)
+            method = "reflink"
+        except (OSError, ImportError):
+            if not self.use_hardlinks:
+                raise
+            os.link(source, temporary)
+            method = "hardlink"
+        os.replace(temporary, target)
+
+        return method
+
+    def _add(self, path: str, sha256: str) -> str:
+        stored = self.path(sha256)
+
+        if os.path.exists(stored):
+            return stored
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+
+        try:
+            self._link(path, stored)
+        except OSError:
+            # e.g., the store is on another file system
+            temporary = _temporary_path(stored)
+            shutil.copyfile(path, temporary)
+            os.replace(temporary, stored)
+        # written once, never modified
+        os.chmod(stored, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+        return stored
+
+    def share(self, path: str) -> int:
+        """
+        Adds the content of `path` to the store and replaces `path` by a
+        link to it.
+
+        Returns:
+            The number of bytes that are no longer stored twice.
+        """
+        status = os.stat(path)
+        sha256 = hash_file(path)
+        stored = self._add(path, sha256)
+        stored_status = os.stat(stored)
+
+        if (stored_status.st_dev, stored_status.st_ino) == (
+            status.st_dev,
+            status.st_ino,
+        ):
+            return 0
+
+        try:
+            self._link(stored, path)
+        except OSError as e:
+            logger.debug(f"Cannot link {path} to the content store: {e}")
+
+            return 0
+
+        return status.st_size
+
+    def share_files(self, directory: str, patterns: Iterable[str]) -> int:
+        """
+        Shares the files in `directory` matching the `patterns`.
+
+        Returns:
+            The number of bytes that are no longer stored twice.
+        """
+        paths = {
+            path
+            for pattern in patterns
+            for path in glob.glob(os.path.join(directory, pattern))
+            if os.path.isfile(path) and not os.path.islink(path)
+        }
+        saved = 0
+
+        for path in sorted(paths):
+            try:
+                saved += self.share(path)
+            except OSError as e:
+                logger.warning(f"Could not add {path} to the content store: {e}")
+
+        return saved
+
+    def collect_garbage(self) -> int:
+        """
+        Removes the contents that no run links to anymore. Contents that are
+        only reflinked look unused too, but removing them does not affect
+        the clones. Only later runs will store them again.
+
+        Returns:
+            The number of bytes reclaimed.
+        """
+        reclaimed = 0
+
+        for path in glob.glob(os.path.join(self.root, "*", "*")):
+            status = os.stat(path)
+
+            if status.st_nlink == 1 and not path.endswith(".tmp"):
+                os.remove(path)
+                reclaimed += status.st_size
+
+        return reclaimed
+
+
+def unshare(directory: str, root: Optional[str] = None) -> int:
+    """
+    Replaces the files in `directory` that are hardlinked into the content
+    store in `root` by private, writable copies.
+
+    Other hardlinks are kept, e.g., `best.th`, which allennlp links to the
+    last checkpoint, so resuming does not copy the checkpoints.
+
+    Args:
+        root: The directory of the store. Defaults to `ALLENNLP_CONTENT_STORE`.
+
+    Returns:
+        The number of files copied.
+    """
+    root = root or ALLENNLP_CONTENT_STORE
+    stored = set()
+
+    for store_root, _, files in os.walk(root):
+        for name in files:
+            status = os.stat(os.path.join(store_root, name))
+            stored.add((status.st_dev, status.st_ino))
+    copied = 0
+
+    for dir_root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(dir_root, name)
+
+            if os.path.islink(path):
+                continue
+            status = os.stat(path)
+
+            if (
+                status.st_nlink == 1
+                or (status.st_dev, status.st_ino) not in stored
+            ):
+                continue
+            temporary = _temporary_path(path)
+            shutil.copyfile(path, temporary)
+            os.replace(temporary, path)
+            copied += 1
+
+    return copied
@@ -0,0 +1,265 @@
+"""Uncompressed model archive that is loaded without extraction.
+
+Loading `model.tar.gz` means decompressing it into a temporary directory and
+reading the whole weights file with `torch.load`. A memory-mapped archive is
+a directory instead::
+
+    model.mmap/
+        config.json
+        vocabulary/...
+        weights.bin       the tensors, each aligned to ALIGNMENT bytes
+        weights.json      name, dtype, shape and offset of every tensor
+        <include_in_archive files>
+
+`weights.bin` is memory-mapped, so loading the weights costs no decompression,
+no copy and no extraction, and only the pages that are used are read.
+"""
+from typing import List, Tuple, Union, Dict, Any, Optional
+import glob
+import json
+import logging
+import os
+import shutil
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+MMAP_ARCHIVE_NAME = "model.mmap"
+WEIGHTS_NAME = "weights.bin"
+WEIGHTS_INDEX_NAME = "weights.json"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+
+def _dtype_name(dtype: torch.dtype) -> str:
+    return str(dtype).replace("torch.", "")
+
+
+def write_tensors(tensors: Dict[str, torch.Tensor], directory: str) -> int:
+    """
+    Writes `WEIGHTS_NAME` and `WEIGHTS_INDEX_NAME` to `directory`.
+
+    Returns:
+        The size of `WEIGHTS_NAME` in bytes.
+    """
+    index: Dict[str, Any] = {}
+    offset = 0
+    with open(os.path.join(directory, WEIGHTS_NAME), "wb") as f:
+        for name, tensor in tensors.items():
+            tensor = tensor.detach().cpu().contiguous()
+            padding = -offset % ALIGNMENT
+            f.write(b"\0" * padding)
+            offset += padding
+            data = tensor.reshape(-1).view(torch.uint8).numpy()
+            f.write(data.tobytes())
+            index[name] = {
+                "dtype": _dtype_name(tensor.dtype),
+                "shape": list(tensor.shape),
+                "offset": offset,
+                "nbytes": data.nbytes,
+            }
+            offset += data.nbytes
+    with open(os.path.join(directory, WEIGHTS_INDEX_NAME), "w") as f:
+        json.dump(
+            {
+                "format_version": FORMAT_VERSION,
+                "alignment": ALIGNMENT,
+                "tensors": index,
+            },
+            f,
+        )
+
+    return offset
+
+
+def read_tensors(directory: str) -> Dict[str, torch.Tensor]:
+    """
+    Memory-maps the tensors written by :func:`write_tensors`.
+
+    The tensors share the pages of the file copy-on-write, so they can be
+    modified without changing the archive.
+    """
+    with open(os.path.join(directory, WEIGHTS_INDEX_NAME)) as f:
+        index = json.load(f)
+
+    if index["format_version"] != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported archive format {index['format_version']} in {directory}"
+        )
+    path = os.path.join(directory, WEIGHTS_NAME)
+
+    if os.path.getsize(path) == 0:
+        data = torch.zeros(0, dtype=torch.uint8)
+    else:
+        data = torch.from_numpy(np.memmap(path, dtype=np.uint8, mode="c"))
+    tensors = {}
+
+    for name, entry in index["tensors"].items():
+        dtype = getattr(torch, entry["dtype"])
+        start = entry["offset"]
+        tensors[name] = (
+            data[start : start + entry["nbytes"]]
+            .view(dtype)
+            .reshape(entry["shape"])
+        )
+
+    return tensors
+
+
+def _link_or_copy(source: str, target: str) -> None:
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def write_mmap_archive(
+    serialization_dir: str,
+    weights: str = "best.th",
+    include_in_archive: Optional[List[str]] = None,
+    archive_dir: Optional[str] = None,
+) -> str:
+    """
+    Writes a memory-mapped archive of the model in `serialization_dir`,
+    with the same content as the one `archive_model` writes.
+
+    Args:
+        weights: The weights file in `serialization_dir`.
+        include_in_archive: Globs of further files to include.
+        archive_dir: Where to write the archive. Default:
+            `<serialization_dir>/MMAP_ARCHIVE_NAME`.
+
+    Returns:
+        The archive directory.
+    """
+    archive_dir = archive_dir or os.path.join(
+        serialization_dir, MMAP_ARCHIVE_NAME
+    )
+    weights_file = os.path.join(serialization_dir, weights)
+
+    if not os.path.exists(weights_file):
+        raise FileNotFoundError(f"weights file {weights_file} does not exist")
+    temporary = f"{archive_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+
+    try:
+        write_tensors(
+            torch.load(weights_file, map_location="cpu"), temporary
+        )
+        # the files are never modified, so they can be shared
+        shutil.copytree(
+            os.path.join(serialization_dir, "vocabulary"),
+            os.path.join(temporary, "vocabulary"),
+            copy_function=_link_or_copy,
+        )
+        names = ["config.json"] + [
+            os.path.relpath(path, serialization_dir)
+            for pattern in include_in_archive or []
+            for path in glob.glob(os.path.join(serialization_dir, pattern))
+            if os.path.isfile(path)
+        ]
+
+        for name in names:
+            target = os.path.join(temporary, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _link_or_copy(os.path.join(serialization_dir, name), target)
+        shutil.rmtree(archive_dir, ignore_errors=True)
+        os.replace(temporary, archive_dir)
+    except BaseException:
+        shutil.rmtree(temporary, ignore_errors=True)
+        raise
+
+    return archive_dir
+
+
+def load_mmap_archive(
+    archive_dir: str,
+    cuda_device: int = -1,
+    overrides: Union[str, Dict[str, Any]] = "",
+) -> Any:
+    """
+    Loads a memory-mapped archive like `allennlp.models.load_archive` loads
+    `model.tar.gz`.
+
+    On the CPU, the parameters of the model are the memory-mapped tensors.
+
+    Returns:
+        An `allennlp.models.archival.Archive`.
+    """
+    from allennlp.common import Params
+    from allennlp.data import DatasetReader, Vocabulary
+    from allennlp.models import Model
+    from allennlp.models.archival import Archive, CONFIG_NAME
+
+    try:
+        from allennlp.models.model import (
+            remove_weights_related_keys_from_params as remove_keys_from_params,
+        )
+    except ImportError:  # older allennlp
+        from allennlp.models.model import (
+            remove_pretrained_embedding_params as remove_keys_from_params,
+        )
+
+    config = Params.from_file(
+        os.path.join(archive_dir, CONFIG_NAME), overrides
+    )
+    vocab_params = config.get("vocabulary", Params({}))
+    vocab_choice = vocab_params.pop_choice(
+        "type", Vocabulary.list_available(), True
+    )
+    vocab_class, _ = Vocabulary.resolve_class_name(vocab_choice)
+    vocab = vocab_class.from_files(
+        os.path.join(archive_dir, "vocabulary"),
+        vocab_params.get("padding_token"),
+        vocab_params.get("oov_token"),
+    )
+    model_params = config.get("model").duplicate()
+    # the weights are in the archive, pretrained files are not needed
+    remove_keys_from_params(model_params)
+    model = Model.from_params(
+        vocab=vocab, params=model_params, serialization_dir=archive_dir
+    )
+    # as in Model._load(): move the model first, then extend the embedders
+
+    if cuda_device >= 0:
+        model.cuda(cuda_device)
+    else:
+        model.cpu()
+    model.extend_embedder_vocab()
+    state = read_tensors(archive_dir)
+
+    if cuda_device >= 0:
+        missing, unexpected = model.load_state_dict(state, strict=False)
+    else:
+        try:
+            # use the memory-mapped tensors instead of copying them
+            missing, unexpected = model.load_state_dict(
+                state, strict=False, assign=True
+            )
+        except TypeError:  # torch < 2.1
+            missing, unexpected = model.load_state_dict(state, strict=False)
+
+    if unexpected or missing:
+        raise RuntimeError(
+            f"Error loading state dict for {model.__class__.__name__}\n\t"
+            f"Missing keys: {missing}\n\tUnexpected keys: {unexpected}"
+        )
+    dataset_reader_params = config.get("dataset_reader")
+    validation_params = config.get(
+        "validation_dataset_reader", dataset_reader_params.duplicate()
+    )
+    fields = {
+        "model": model,
+        "config": config,
+        "dataset_reader": DatasetReader.from_params(
+            dataset_reader_params.duplicate(), serialization_dir=archive_dir
+        ),
+        "validation_dataset_reader": DatasetReader.from_params(
+            validation_params.duplicate(), serialization_dir=archive_dir
+        ),
+        "meta": None,
+    }
+
+    return Archive(**{k: v for k, v in fields.items() if k in Archive._fields})
@@ -0,0 +1,498 @@
+"""Check the overrides of a trial against its config before training.
+
+`translate` turns the `--model.embedder.type=...` arguments of a trial into an
+overrides dict. A key with a typo, or a value of the wrong type, is only
+noticed by allennlp deep into building the objects of the config. Here, the
+jsonnet config is evaluated once, cached, and every override is checked
+against it, so that a bad trial fails before anything is loaded and good
+trials do not evaluate the jsonnet again.
+"""
+from typing import List, Tuple, Union, Dict, Any, Optional
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+from wandb_allennlp.config import ALLENNLP_CONFIG_CACHE_DIR
+from wandb_allennlp.run_index import hash_file
+
+logger = logging.getLogger(__name__)
+
+
+def _environment_variables() -> Dict[str, str]:
+    # as allennlp does, leave out what jsonnet cannot encode
+    return {
+        key: value
+        for key, value in os.environ.items()
+        if value == "" or value.encode("utf-8", "ignore") != b""
+    }
+
+
+#: `std.extVar` calls with a literal name.
+EXT_VAR_PATTERN = re.compile(r"""extVar\(\s*['"]([^'"]+)['"]\s*\)""")
+UNDEFINED_EXT_VAR_PATTERN = re.compile(r"undefined external variable: (\S+)")
+
+
+def _imports_as_bytes(version: str) -> bool:
+    # jsonnet >= 0.19 expects the content of imports as bytes
+    major, minor = version.lstrip("v").split(".")[:2]
+
+    return (int(major), int(minor)) >= (0, 19)
+
+
+def evaluate_config(
+    param_path: str, environment: Dict[str, str]
+) -> Tuple[Any, Dict[str, List[str]]]:
+    """
+    Evaluates the jsonnet file `param_path` like `Params.from_file`, and
+    records what the result depends on.
+
+    Only the variables of `environment` that the config reads are passed to
+    jsonnet: the ones named in `std.extVar('...')` in the config or in the
+    files it imports, and those jsonnet reports as undefined. So the result
+    depends on the values of these variables only.
+
+    Returns:
+        The config as plain python objects, and its dependencies: the
+        absolute paths of the imported files (`imports`) and the names of
+        the variables (`env_vars`).
+    """
+    try:
+        import _jsonnet
+    except ImportError:  # allennlp reads the file as plain json too
+        with open(param_path) as f:
+            return json.load(f), {"imports": [], "env_vars": []}
+    as_bytes = _imports_as_bytes(getattr(_jsonnet, "version", "v0.0"))
+    imports: Dict[str, bytes] = {}
+
+    def import_callback(directory: str, relative: str) -> Tuple[str, Any]:
+        path = os.path.abspath(os.path.join(directory, relative))
+
+        with open(path, "rb") as f:
+            content = f.read()
+        imports[path] = content
+
+        return path, content if as_bytes else content.decode()
+
+    with open(param_path) as f:
+        names = set(EXT_VAR_PATTERN.findall(f.read()))
+
+    while True:
+        for content in imports.values():
+            names.update(
+                EXT_VAR_PATTERN.findall(content.decode(errors="ignore"))
+            )
+        ext_vars = {n: environment[n] for n in names if n in environment}
+
+        try:
+            result = _jsonnet.evaluate_file(
+                param_path, ext_vars=ext_vars, import_callback=import_callback
+            )
+
+            break
+        except RuntimeError as e:
+            # e.g., a name that is not a literal
+            undefined = UNDEFINED_EXT_VAR_PATTERN.search(str(e))
+
+            if (
+                undefined is None
+                or undefined.group(1) in names
+                or undefined.group(1) not in environment
+            ):
+                raise
+            names.add(undefined.group(1))
+
+    return json.loads(result), {
+        "imports": sorted(imports),
+        "env_vars": sorted(names),
+    }
+
+
+class ResolvedConfigCache:
+    """
+    Configs evaluated from jsonnet, in memory and in `cache_dir`.
+
+    The first evaluation of a config file records its dependencies (see
+    :func:`evaluate_config`). Its result is keyed by the sha256 of the file
+    and of the files it imports, and by the values of the environment
+    variables it reads, e.g., the `--env.*` arguments of a trial. So trials
+    and agents that read the same values reuse the evaluation, while any
+    change to them evaluates the config again.
+
+    Args:
+        cache_dir: Directory shared by the processes of a node. Default:
+            `ALLENNLP_CONFIG_CACHE_DIR`. `None` keeps the configs in memory
+            only.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = ALLENNLP_CONFIG_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._memory: Dict[str, Any] = {}
+
+    @staticmethod
+    def file_key(param_path: str) -> str:
+        # relative imports depend on the location of the file too
+        return hashlib.sha256(
+            f"{os.path.abspath(param_path)}:{hash_file(param_path)}".encode()
+        ).hexdigest()
+
+    @staticmethod
+    def config_key(
+        file_key: str,
+        dependencies: Dict[str, List[str]],
+        environment: Dict[str, str],
+    ) -> Optional[str]:
+        """
+        Returns:
+            The key of the config, or `None` if an import is gone.
+        """
+        try:
+            imports = {p: hash_file(p) for p in dependencies["imports"]}
+        except OSError:
+            return None
+        env_vars = {n: environment.get(n) for n in dependencies["env_vars"]}
+        key = {"file": file_key, "imports": imports, "env_vars": env_vars}
+
+        return hashlib.sha256(
+            json.dumps(key, sort_keys=True).encode()
+        ).hexdigest()
+
+    def _disk_path(self, name: str) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+
+        return os.path.join(self.cache_dir, f"{name}.json")
+
+    def _load(self, name: str) -> Any:
+        if name in self._memory:
+            return self._memory[name]
+        path = self._disk_path(name)
+
+        if path is None or not os.path.isfile(path):
+            return None
+        try:
+            with open(path) as f:
+                self._memory[name] = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring the broken cache entry {path}: {e}")
+
+            return None
+
+        return self._memory[name]
+
+    def _save(self, name: str, value: Any) -> None:
+        self._memory[name] = value
+        path = self._disk_path(name)
+
+        if path is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)  # type: ignore
+            temporary = f"{path}.{os.getpid()}.tmp"
+
+            with open(temporary, "w") as f:
+                json.dump(value, f)
+            os.replace(temporary, path)
+        except OSError as e:
+            logger.warning(f"Could not write the cache entry {path}: {e}")
+
+    def get(
+        self, param_path: str, env_vars: Optional[Dict[str, str]] = None
+    ) -> Any:
+        """
+        Args:
+            env_vars: Variables that take precedence over the environment.
+
+        Returns:
+            A copy of the evaluated config, which the caller can modify.
+        """
+        if not os.path.isfile(param_path):
+            from allennlp.common.file_utils import cached_path
+
+            param_path = str(cached_path(param_path))
+        environment = {**_environment_variables(), **(env_vars or {})}
+        file_key = self.file_key(param_path)
+        dependencies = self._load(f"{file_key}.deps")
+        key = (
+            self.config_key(file_key, dependencies, environment)
+            if dependencies is not None
+            else None
+        )
+        config = self._load(key) if key is not None else None
+
+        if config is None:
+            config, dependencies = evaluate_config(param_path, environment)
+            key = self.config_key(file_key, dependencies, environment)
+            self._save(f"{file_key}.deps", dependencies)
+
+            if key is not None:
+                self._save(key, config)
+        else:
+            logger.info(f"Using the cached evaluation of {param_path}")
+
+        return copy.deepcopy(config)
+
+    def clear(self) -> None:
+        self._memory.clear()
+
+
+#: Shared by the trials that run in the same process.
+CONFIG_CACHE = ResolvedConfigCache()
+
+
+def _type_name(value: Any) -> str:
+    return "null" if value is None else type(value).__name__
+
+
+def compatible_types(original: Any, value: Any) -> bool:
+    """
+    Whether `value` can replace `original` in a config.
+
+    `null` goes with everything, ints with floats, and strings with dicts
+    because allennlp reads a string as `{"type": <string>}`.
+    """
+    if original is None or value is None:
+        return True
+
+    if isinstance(original, bool) or isinstance(value, bool):
+        return isinstance(original, bool) and isinstance(value, bool)
+
+    if isinstance(original, (int, float)):
+        return isinstance(value, (int, float))
+
+    if isinstance(original, (str, dict)):
+        return isinstance(value, (str, dict))
+
+    return type(original) == type(value)
+
+
+#: Last part of an override key that appends the value to a list.
+APPEND = "+"
+
+OverridePath = Tuple[Union[str, int], ...]
+
+
+def compile_path(key: str) -> OverridePath:
+    """
+    Splits a dotted override key into its parts, e.g.,
+    `model.encoder.layers.-1.dropout` into
+    `("model", "encoder", "layers", -1, "dropout")`.
+
+    Numbers index into lists, negative ones from the end. `APPEND` adds a
+    new element at the end of a list.
+    """
+    return tuple(
+        int(part) if part.lstrip("-").isdigit() else part
+        for part in key.split(".")
+    )
+
+
+#: What :func:`_replaced_value` returns for a new key of a dict.
+_NEW_KEY = object()
+
+
+def _replaced_value(config: Any, key: str, path: OverridePath) -> Any:
+    """
+    Returns:
+        The value of `config` at `path`, the last element for `APPEND`, or
+        `_NEW_KEY`.
+
+    Raises:
+        ValueError: If `path` does not fit `config`.
+    """
+    node = config
+
+    for depth, part in enumerate(path):
+        location = ".".join(map(str, path[:depth])) or "the config"
+        last = depth == len(path) - 1
+
+        if part == APPEND:
+            if not last:
+                raise ValueError(f"{key}: '{APPEND}' must be the last part")
+
+            if not isinstance(node, list):
+                raise ValueError(
+                    f"{key}: {location} is of type {_type_name(node)},"
+                    " so it cannot be appended to"
+                )
+
+            return node[-1] if node else None
+
+        if isinstance(node, dict):
+            if str(part) not in node:
+                if last:
+                    return _NEW_KEY
+
+                raise ValueError(f"{key}: {location} has no key '{part}'")
+            node = node[str(part)]
+        elif isinstance(node, list):
+            if not isinstance(part, int) or not -len(node) <= part < len(node):
+                raise ValueError(
+                    f"{key}: '{part}' is not an index of {location},"
+                    f" a list of length {len(node)}"
+                )
+            node = node[part]
+        else:
+            raise ValueError(
+                f"{key}: {location} is of type {_type_name(node)},"
+                " not a dict or list"
+            )
+
+    return node
+
+
+def validate_overrides(
+    config: Any, overrides: Dict[str, Any], check_types: bool = True
+) -> List[str]:
+    """
+    Checks that every key of `overrides` points into `config`.
+
+    Every part of a dotted key but the last has to exist, and has to be a
+    dict or a list indexed by a number in range (see :func:`compile_path`).
+    The last part may add a new key to a dict, which is only reported, or
+    be `APPEND`. One key cannot be a prefix of another one.
+
+    Args:
+        config: The evaluated config.
+        overrides: Dotted keys and their values, e.g., the output of
+            :func:`translate`.
+        check_types: Also require the values to have the type of the ones
+            they replace (see :func:`compatible_types`).
+
+    Returns:
+        The keys that are added to the config.
+
+    Raises:
+        ValueError: Listing all the overrides that do not fit the config.
+    """
+    errors = []
+    new_keys = []
+    paths = {compile_path(key): key for key in overrides}
+
+    for path, key in paths.items():
+        # a nested dict is a value, as for with_overrides()
+        value = overrides[key]
+        prefixes = [
+            paths[path[:depth]]
+            for depth in range(1, len(path))
+            if path[:depth] in paths
+        ]
+
+        if prefixes:
+            errors.append(f"{key}: {prefixes[0]} is overridden as a whole")
+
+            continue
+        try:
+            original = _replaced_value(config, key, path)
+        except ValueError as e:
+            errors.append(str(e))
+
+            continue
+
+        if original is _NEW_KEY:
+            new_keys.append(key)
+        elif check_types and not compatible_types(original, value):
+            errors.append(
+                f"{key}: a value of type {_type_name(value)} cannot"
+                f" replace {json.dumps(original)[:50]}"
+                f" of type {_type_name(original)}"
+            )
+
+    if errors:
+        raise ValueError(
+            "The overrides do not fit the config:\n  " + "\n  ".join(errors)
+        )
+
+    for key in new_keys:
+        logger.warning(f"Override {key} adds a key that is not in the config")
+
+    return new_keys
+
+
+def apply_overrides(config: Any, overrides: Dict[str, Any]) -> Any:
+    """
+    Sets the values of `overrides`, which :func:`validate_overrides`
+    accepted, in `config`.
+
+    Unlike `with_overrides` of allennlp, which matches every key of the
+    config against every override, each override only walks its own path.
+    Negative indices refer to the lists before anything is appended.
+
+    Returns:
+        `config`, which is modified in place.
+    """
+    compiled = [(compile_path(key), value) for key, value in overrides.items()]
+    # appends last, so that they do not move the negative indices
+    compiled.sort(key=lambda item: item[0][-1] == APPEND)
+
+    for path, value in compiled:
+        node = config
+
+        for part in path[:-1]:
+            node = node[str(part)] if isinstance(node, dict) else node[part]
+        value = copy.deepcopy(value)
+
+        if isinstance(node, dict):
+            node[str(path[-1])] = value
+        elif path[-1] == APPEND:
+            node.append(value)
+        else:
+            node[path[-1]] = value
+
+    return config
+
+
+def parse_overrides(
+    overrides: Union[str, Dict[str, Any]], ext_vars: Dict[str, str]
+) -> Dict[str, Any]:
+    if isinstance(overrides, dict):
+        return overrides
+
+    if not overrides:
+        return {}
+    try:
+        # translate() writes json, which needs no jsonnet
+        return json.loads(overrides)
+    except ValueError:
+        from allennlp.common.params import parse_overrides
+
+        return parse_overrides(overrides, ext_vars=ext_vars)
+
+
+def load_params(
+    param_path: str,
+    overrides: Union[str, Dict[str, Any]] = "",
+    env_vars: Optional[Dict[str, str]] = None,
+    check_types: bool = True,
+    cache: Optional[ResolvedConfigCache] = None,
+) -> Any:
+    """
+    `Params.from_file` with validated overrides and a cached config.
+
+    Args:
+        env_vars: The `env.*` arguments of the trial, which the jsonnet
+            reads with `std.extVar`. They take precedence over the
+            environment.
+        check_types: See :func:`validate_overrides`.
+        cache: Default: `CONFIG_CACHE`.
+
+    Raises:
+        ValueError: If the overrides do not fit the config.
+
+    Returns:
+        The `allennlp.common.Params`.
+    """
+    from allennlp.common import Params
+
+    cache = cache or CONFIG_CACHE
+    config = cache.get(param_path, env_vars)
+    overrides_dict = parse_overrides(
+        overrides, {**_environment_variables(), **(env_vars or {})}
+    )
+
+    if overrides_dict:
+        validate_overrides(config, overrides_dict, check_types=check_types)
+        config = apply_overrides(config, overrides_dict)
+
+    return Params(config)
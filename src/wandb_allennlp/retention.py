@@ -0,0 +1,291 @@
+"""Free the disk space taken by the serialization directories of old runs.
+
+Every trial of a sweep writes checkpoints, an archive and a vocabulary to its
+serialization directory. :func:`apply_retention` selects the runs worth
+keeping according to a :class:`RetentionPolicy` and deletes the large files of
+the other ones, keeping the config and metrics so that they can still be
+found through the :class:`RunIndex`.
+"""
+from typing import List, Tuple, Union, Dict, Any, Optional, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+import json
+import logging
+import os
+import shutil
+import time
+from wandb_allennlp.run_index import RunIndex
+
+logger = logging.getLogger(__name__)
+
+#: Files that are never deleted.
+METADATA_PATTERNS = ["config.json", "metrics*.json", "*.log", "scalars.*"]
+#: Files that are kept for the runs that keep their archive.
+ARCHIVE_PATTERNS = ["model.tar.gz", "model.mmap"]
+#: Kept instead of the archive by runs that have none.
+BEST_WEIGHTS_PATTERNS = ["best.th"]
+#: Runs in these states may still be writing to their serialization dir.
+ACTIVE_STATUSES = ["running", "unknown", None]
+
+#: Nothing is deleted.
+KEEP = "keep"
+#: Everything but the archive (or the best weights) and the metadata.
+KEEP_ARCHIVE = "archive"
+#: Everything but the metadata.
+KEEP_METADATA = "metadata"
+
+
+class RetentionPolicy:
+    """
+    Decides what to keep of each run.
+
+    A run is retained if it is among the `keep_top_k` best runs of its sweep
+    according to `metric` or if it was last updated less than `keep_days`
+    ago. Runs that are retained keep everything, or only their archive if
+    `archives_only`. The other runs keep only their config, metrics and logs.
+    Runs that may still be running (see `ACTIVE_STATUSES`) are never
+    touched.
+
+    Args:
+        metric: Key of the metrics summary (`metrics.json`) to rank the runs
+            of a sweep by, e.g., `+best_validation_accuracy`. A leading `-`
+            means lower is better.
+        keep_top_k: Number of best runs to retain per sweep. Runs that are
+            not part of a sweep are not ranked.
+        keep_days: Retain the runs updated in the last `keep_days` days.
+        archives_only: Delete the checkpoints of retained runs too, if they
+            have an archive.
+    """
+
+    def __init__(
+        self,
+        metric: Optional[str] = None,
+        keep_top_k: Optional[int] = None,
+        keep_days: Optional[float] = None,
+        archives_only: bool = False,
+    ) -> None:
+        if keep_top_k is not None and metric is None:
+            raise ValueError("keep_top_k needs a metric to rank the runs by")
+
+        if keep_top_k is None and keep_days is None and not archives_only:
+            raise ValueError(
+                "Set at least one of keep_top_k, keep_days or archives_only"
+            )
+        self.higher_is_better = not (metric or "").startswith("-")
+        self.metric = metric.lstrip("+-") if metric is not None else None
+        self.keep_top_k = keep_top_k
+        self.keep_days = keep_days
+        self.archives_only = archives_only
+
+    def _retained(self, runs: List[Dict[str, Any]], now: float) -> set:
+        if self.keep_top_k is None and self.keep_days is None:
+            # only archives_only, which applies to all the runs
+            return {run["run_id"] for run in runs}
+        retained = set()
+
+        if self.keep_days is not None:
+            retained.update(
+                run["run_id"]
+                for run in runs
+                if now - (run["updated"] or 0) < self.keep_days * 86400
+            )
+
+        if self.keep_top_k is not None:
+            sweeps: Dict[str, List[Dict[str, Any]]] = {}
+
+            for run in runs:
+                if run["sweep_id"] is None:
+                    retained.add(run["run_id"])
+                else:
+                    sweeps.setdefault(run["sweep_id"], []).append(run)
+
+            for sweep_runs in sweeps.values():
+                # the metrics of active runs are not final
+                scored = [
+                    run
+                    for run in sweep_runs
+                    if isinstance(run["metric"], (int, float))
+                    and run["status"] not in ACTIVE_STATUSES
+                ]
+                scored.sort(
+                    key=lambda run: run["metric"],
+                    reverse=self.higher_is_better,
+                )
+                retained.update(
+                    run["run_id"] for run in scored[: self.keep_top_k]
+                )
+
+        return retained
+
+    def plan(
+        self, runs: List[Dict[str, Any]], now: Optional[float] = None
+    ) -> Dict[str, str]:
+        """
+        Args:
+            runs: Runs as returned by :meth:`RunIndex.query`, with the value
+                of the metric as `metric`.
+
+        Returns:
+            What to keep (`KEEP`, `KEEP_ARCHIVE` or `KEEP_METADATA`) of each
+            run.
+        """
+        now = time.time() if now is None else now
+        retained = self._retained(runs, now)
+        plan = {}
+
+        for run in runs:
+            if run["status"] in ACTIVE_STATUSES:
+                plan[run["run_id"]] = KEEP
+            elif run["run_id"] not in retained:
+                plan[run["run_id"]] = KEEP_METADATA
+            elif self.archives_only:
+                plan[run["run_id"]] = KEEP_ARCHIVE
+            else:
+                plan[run["run_id"]] = KEEP
+
+        return plan
+
+
+def paths_to_delete(serialization_dir: str, keep: str) -> List[str]:
+    """
+    Returns:
+        The files and directories at the top of `serialization_dir` that
+        are not kept.
+    """
+    if keep == KEEP or not os.path.isdir(serialization_dir):
+        return []
+    names = os.listdir(serialization_dir)
+    patterns = list(METADATA_PATTERNS)
+
+    if keep == KEEP_ARCHIVE:
+        patterns += ARCHIVE_PATTERNS
+
+        if not any(fnmatch(n, p) for n in names for p in ARCHIVE_PATTERNS):
+            patterns += BEST_WEIGHTS_PATTERNS
+
+    return [
+        os.path.join(serialization_dir, name)
+        for name in sorted(names)
+        if not any(fnmatch(name, pattern) for pattern in patterns)
+    ]
+
+
+def _unshared_size(path: str) -> int:
+    status = os.lstat(path)
+
+    # hardlinked files, e.g., from the content store, stay on the disk
+    return status.st_size if status.st_nlink == 1 else 0
+
+
+def disk_usage(path: str) -> int:
+    """Returns the bytes that deleting `path` frees."""
+
+    if not os.path.isdir(path) or os.path.islink(path):
+        return _unshared_size(path)
+    total = 0
+
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += _unshared_size(os.path.join(root, name))
+            except OSError:
+                pass
+
+    return total
+
+
+def _delete(path: str) -> int:
+    try:
+        size = disk_usage(path)
+
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except OSError as e:
+        logger.warning(f"Could not delete {path}: {e}")
+
+        return 0
+
+    return size
+
+
+def delete_paths(
+    paths: Iterable[str], num_workers: int = 8, dry_run: bool = False
+) -> int:
+    """
+    Deletes files and directories in parallel, which is much faster than
+    one by one on network file systems.
+
+    Returns:
+        The number of bytes reclaimed, or that would be reclaimed.
+    """
+    paths = list(paths)
+
+    if dry_run:
+        return sum(disk_usage(path) for path in paths if os.path.lexists(path))
+    with ThreadPoolExecutor(
+        max_workers=num_workers, thread_name_prefix="retention"
+    ) as executor:
+        return sum(executor.map(_delete, paths))
+
+
+def _read_metric(serialization_dir: str, metric: str) -> Any:
+    try:
+        with open(os.path.join(serialization_dir, "metrics.json")) as f:
+            return json.load(f).get(metric)
+    except (OSError, ValueError):
+        return None
+
+
+def apply_retention(
+    index: RunIndex,
+    policy: RetentionPolicy,
+    sweep_id: Optional[str] = None,
+    exclude: Iterable[str] = (),
+    num_workers: int = 8,
+    dry_run: bool = False,
+) -> Tuple[Dict[str, List[str]], int]:
+    """
+    Applies the policy to the runs in the index.
+
+    Args:
+        sweep_id: Only consider the runs of this sweep.
+        exclude: Ids of runs that are not touched.
+        num_workers: Number of files deleted concurrently.
+        dry_run: Only report what would be deleted.
+
+    Returns:
+        The deleted paths of every run, and the number of bytes reclaimed.
+    """
+    field = f"metrics.{policy.metric}"
+    runs = index.query(
+        [("sweep_id", "=", sweep_id)] if sweep_id is not None else None,
+        fields=[field] if policy.metric is not None else None,
+    )
+
+    for run in runs:
+        run["metric"] = run.get(field)
+
+        if policy.metric is not None and run["metric"] is None:
+            # runs indexed before their metrics were known
+            run["metric"] = _read_metric(
+                run["serialization_dir"], policy.metric
+            )
+    plan = policy.plan(runs)
+    excluded = set(exclude)
+    deleted = {
+        run["run_id"]: paths_to_delete(
+            run["serialization_dir"], plan[run["run_id"]]
+        )
+        for run in runs
+        if run["run_id"] not in excluded
+    }
+    deleted = {run_id: paths for run_id, paths in deleted.items() if paths}
+    reclaimed = delete_paths(
+        [path for paths in deleted.values() for path in paths],
+        num_workers=num_workers,
+        dry_run=dry_run,
+    )
+
+    return deleted, reclaimed
@@ -0,0 +1,358 @@
+"""SQLite index of the serialization directories in ALLENNLP_SERIALIZATION_DIR.
+
+Finding the directory of a run otherwise means listing
+ALLENNLP_SERIALIZATION_DIR, which is slow on shared storage with many runs.
+Besides the directory, the index keeps the sweep, group and status of every
+run, its flattened config and the summary of its metrics, so that runs can
+be selected with :meth:`RunIndex.query` without opening any of their files.
+"""
+from typing import List, Tuple, Union, Dict, Any, Optional, Iterable
+from contextlib import closing
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from wandb_allennlp.config import ALLENNLP_RUN_INDEX
+
+logger = logging.getLogger(__name__)
+
+#: Fields of :meth:`RunIndex.query` and their columns in the runs table.
+RUN_FIELDS = {
+    "run_id": "run_id",
+    "serialization_dir": "serialization_dir",
+    "sweep_id": "sweep_id",
+    "group": "run_group",
+    "status": "status",
+    "created": "created",
+    "updated": "updated",
+}
+#: Prefixes of the config and metrics fields, e.g., `config.model.type`.
+VALUE_TABLES = {"config.": "config", "metrics.": "metrics"}
+OPERATORS = ["<=", ">=", "!=", "=", "<", ">"]
+_FILTER = re.compile(
+    "^(.+?)(" + "|".join(re.escape(op) for op in OPERATORS) + ")(.*)$"
+)
+Filter = Tuple[str, str, Any]
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def _parse_value(value: str) -> Any:
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def parse_filter(expression: str) -> Filter:
+    """
+    Parses a filter like `status=finished` or `config.trainer.optimizer.lr<0.01`.
+    The value is read as JSON if possible and as a string otherwise.
+    """
+    match = _FILTER.match(expression)
+
+    if match is None:
+        raise ValueError(
+            f"Cannot parse the filter {expression!r}. "
+            f"Use <field><operator><value> with one of {OPERATORS}."
+        )
+    field, operator, value = match.groups()
+
+    return field.strip(), operator, _parse_value(value.strip())
+
+
+def _sql_value(value: Any) -> Any:
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+
+    return value
+
+
+class RunIndex:
+    """
+    Maps wandb run ids to serialization directories and keeps the size,
+    modification time and sha256 of their checkpoint files.
+
+    Args:
+        path: The SQLite file. Defaults to `ALLENNLP_RUN_INDEX`.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path or ALLENNLP_RUN_INDEX
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "run_id TEXT PRIMARY KEY, serialization_dir TEXT, "
+                "created REAL, updated REAL)"
+            )
+            columns = {
+                row[1] for row in connection.execute("PRAGMA table_info(runs)")
+            }
+
+            # indexes written before the sweep, group and status were kept
+            for column in ["sweep_id", "run_group", "status"]:
+                if column not in columns:
+                    connection.execute(
+                        f"ALTER TABLE runs ADD COLUMN {column} TEXT"
+                    )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "run_id TEXT, name TEXT, size INTEGER, mtime REAL, "
+                "sha256 TEXT, PRIMARY KEY (run_id, name))"
+            )
+
+            for table in VALUE_TABLES.values():
+                # no type for value, so numbers compare as numbers
+                connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    "run_id TEXT, key TEXT, value, PRIMARY KEY (run_id, key))"
+                )
+                connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {table}_key_value "
+                    f"ON {table} (key, value)"
+                )
+
+            for column in ["serialization_dir", "sweep_id", "run_group"]:
+                connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS runs_{column} ON runs ({column})"
+                )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60)
+
+    def add_run(
+        self,
+        run_id: str,
+        serialization_dir: str,
+        sweep_id: Optional[str] = None,
+        group: Optional[str] = None,
+        status: Optional[str] = None,
+        config: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Adds or updates a run. The fields that are `None` keep their value.
+
+        Args:
+            config: The flattened config of the run. Replaces the old one.
+        """
+        now = time.time()
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT INTO runs (run_id, serialization_dir, created, updated, "
+                "sweep_id, run_group, status) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(run_id) DO UPDATE SET "
+                "serialization_dir = excluded.serialization_dir, "
+                "updated = excluded.updated, "
+                "sweep_id = coalesce(excluded.sweep_id, sweep_id), "
+                "run_group = coalesce(excluded.run_group, run_group), "
+                "status = coalesce(excluded.status, status)",
+                (
+                    run_id,
+                    os.path.abspath(serialization_dir),
+                    now,
+                    now,
+                    sweep_id,
+                    group,
+                    status,
+                ),
+            )
+
+            if config is not None:
+                self._replace_values(connection, "config", run_id, config)
+
+    def finish_run(
+        self,
+        run_id: str,
+        status: str,
+        metrics: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Sets the status of a run and, if given, replaces the summary of its
+        metrics.
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "UPDATE runs SET status = ?, updated = ? WHERE run_id = ?",
+                (status, time.time(), run_id),
+            )
+
+            if metrics is not None:
+                self._replace_values(connection, "metrics", run_id, metrics)
+
+    def remove_run(self, run_id: str) -> None:
+        with closing(self._connect()) as connection, connection:
+            for table in ["runs", "files"] + list(VALUE_TABLES.values()):
+                connection.execute(
+                    f"DELETE FROM {table} WHERE run_id = ?", (run_id,)
+                )
+
+    @staticmethod
+    def _replace_values(
+        connection: sqlite3.Connection,
+        table: str,
+        run_id: str,
+        values: Dict[str, Any],
+    ) -> None:
+        connection.execute(f"DELETE FROM {table} WHERE run_id = ?", (run_id,))
+        connection.executemany(
+            f"INSERT INTO {table} VALUES (?, ?, ?)",
+            [(run_id, key, _sql_value(value)) for key, value in values.items()],
+        )
+
+    @staticmethod
+    def _field(field: str, parameters: List[Any]) -> str:
+        if field in RUN_FIELDS:
+            return f"runs.{RUN_FIELDS[field]}"
+
+        for prefix, table in VALUE_TABLES.items():
+            if field.startswith(prefix):
+                parameters.append(field[len(prefix) :])
+
+                return (
+                    f"(SELECT value FROM {table} WHERE "
+                    f"{table}.run_id = runs.run_id AND key = ?)"
+                )
+
+        raise ValueError(
+            f"Unknown field {field!r}. Use one of {list(RUN_FIELDS)} "
+            f"or a key prefixed with one of {list(VALUE_TABLES)}."
+        )
+
+    def query(
+        self,
+        filters: Optional[List[Filter]] = None,
+        fields: Optional[List[str]] = None,
+        order_by: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Selects runs without touching their serialization directories.
+
+        Args:
+            filters: `(field, operator, value)` triples that all have to
+                hold, see :func:`parse_filter`. A field is one of
+                `RUN_FIELDS` or a config or metrics key prefixed with
+                `config.` or `metrics.`.
+            fields: The fields to return besides the `RUN_FIELDS`.
+            order_by: Field to sort by. Prefix it with `-` for descending
+                order. Runs without the field come last.
+            limit: Maximum number of runs to return.
+
+        Returns:
+            One dict per run.
+        """
+        fields = list(RUN_FIELDS) + [
+            field for field in fields or [] if field not in RUN_FIELDS
+        ]
+        parameters: List[Any] = []
+        selected = [
+            f"{self._field(field, parameters)} AS {json.dumps(field)}"
+            for field in fields
+        ]
+        conditions = []
+
+        for field, operator, value in filters or []:
+            if operator not in OPERATORS:
+                raise ValueError(f"Unknown operator {operator!r}")
+
+            if value is None and operator in ["=", "!="]:
+                operator = "IS" if operator == "=" else "IS NOT"
+            conditions.append(f"{self._field(field, parameters)} {operator} ?")
+            parameters.append(_sql_value(value))
+        sql = f"SELECT {', '.join(selected)} FROM runs"
+
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+
+        if order_by is not None:
+            field = order_by.lstrip("-")
+            direction = "DESC" if order_by.startswith("-") else "ASC"
+            sql += (
+                f" ORDER BY {self._field(field, parameters)} IS NULL, "
+                f"{self._field(field, parameters)} {direction}"
+            )
+
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+        with closing(self._connect()) as connection:
+            rows = connection.execute(sql, parameters).fetchall()
+
+        return [dict(zip(fields, row)) for row in rows]
+
+    def find(self, run_id: str) -> Optional[str]:
+        """
+        Returns:
+            The serialization directory of the run, if it is in the index
+            and still exists.
+        """
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT serialization_dir FROM runs WHERE run_id = ?",
+                (run_id,),
+            ).fetchone()
+
+        if row is None or not os.path.isdir(row[0]):
+            return None
+
+        return row[0]
+
+    def file_hashes(self, run_id: str) -> Dict[str, Tuple[int, float, str]]:
+        """
+        Returns:
+            The size, modification time and sha256 of every recorded file.
+        """
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT name, size, mtime, sha256 FROM files WHERE run_id = ?",
+                (run_id,),
+            ).fetchall()
+
+        return {name: (size, mtime, sha) for name, size, mtime, sha in rows}
+
+    def record_files(
+        self, run_id: str, directory: str, names: Iterable[str]
+    ) -> int:
+        """
+        Hashes the files that changed since they were last recorded.
+
+        Returns:
+            The number of files hashed.
+        """
+        known = self.file_hashes(run_id)
+        rows = []
+
+        for name in names:
+            path = os.path.join(directory, name)
+
+            if not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            previous = known.get(name)
+
+            if previous is not None and previous[:2] == (
+                stat.st_size,
+                stat.st_mtime,
+            ):
+                continue
+            rows.append(
+                (run_id, name, stat.st_size, stat.st_mtime, hash_file(path))
+            )
+        with closing(self._connect()) as connection, connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+        return len(rows)
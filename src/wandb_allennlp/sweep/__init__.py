@@ -0,0 +1 @@
+from wandb_allennlp.sweep import scheduler, controller, asha
@@ -0,0 +1,113 @@
+"""Asynchronous successive halving (ASHA) across the trials of a sweep.
+
+Every trial reports the value of its tracked validation metric at a few
+rung epochs to a SQLite file shared by all the trials. A trial continues
+past a rung only if its value is in the top `1/reduction_factor` of the
+values reported at that rung so far.
+"""
+from typing import List, Tuple, Union, Dict, Any, Optional
+from contextlib import closing
+from pathlib import Path
+import logging
+import math
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+def geometric_rungs(
+    min_epochs: int, max_epochs: int, reduction_factor: int
+) -> List[int]:
+    """
+    Rung epochs `min_epochs * reduction_factor**k` that are smaller than
+    `max_epochs`.
+    """
+    rungs = []
+    rung = min_epochs
+
+    while rung < max_epochs:
+        rungs.append(rung)
+        rung *= reduction_factor
+
+    return rungs
+
+
+class ASHACoordinator:
+    """
+    Keeps the values reported at each rung in a SQLite file.
+
+    Args:
+        store: Path to the SQLite file shared by all the trials.
+        reduction_factor: Only the top `1/reduction_factor` of the trials
+            continue past a rung.
+        min_trials_per_rung: Number of values needed at a rung before any
+            trial is stopped there. Defaults to `reduction_factor`.
+    """
+
+    def __init__(
+        self,
+        store: str,
+        reduction_factor: int = 3,
+        min_trials_per_rung: Optional[int] = None,
+    ) -> None:
+        if reduction_factor < 2:
+            raise ValueError("reduction_factor should be at least 2")
+        self.store = store
+        self.reduction_factor = reduction_factor
+        self.min_trials_per_rung = (
+            reduction_factor
+            if min_trials_per_rung is None
+            else min_trials_per_rung
+        )
+        Path(store).parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rungs ("
+                "trial_id TEXT, rung INTEGER, value REAL, "
+                "PRIMARY KEY (trial_id, rung))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # long timeout because many trials may report at the same time
+        return sqlite3.connect(self.store, timeout=60)
+
+    def report(self, trial_id: str, rung: int, value: float) -> bool:
+        """
+        Records the value of a trial at a rung.
+
+        Args:
+            trial_id: Id of the trial, usually the wandb run id.
+            rung: The number of epochs completed.
+            value: The value of the metric. Higher is better.
+
+        Returns:
+            Whether the trial should continue.
+        """
+
+        if not math.isfinite(value):
+            value = -math.inf
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO rungs VALUES (?, ?, ?)",
+                (trial_id, rung, value),
+            )
+            values = sorted(
+                (
+                    row[0]
+                    for row in connection.execute(
+                        "SELECT value FROM rungs WHERE rung = ?", (rung,)
+                    )
+                ),
+                reverse=True,
+            )
+
+        if len(values) < self.min_trials_per_rung:
+            return True
+        num_to_keep = max(1, len(values) // self.reduction_factor)
+        cutoff = values[num_to_keep - 1]
+        logger.info(
+            f"ASHA rung {rung}: value {value:.5g}, cutoff {cutoff:.5g}"
+            f" ({len(values)} trials)"
+        )
+
+        return value >= cutoff
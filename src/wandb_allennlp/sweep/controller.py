@@ -0,0 +1,346 @@
+"""Offline replacement for the wandb sweep controller.
+
+Reads the same sweep config that is used with `wandb sweep`, proposes the
+parameters of each trial using the grid, random or bayes method and records
+the outcome of every trial in a local JSON lines file.
+"""
+from typing import List, Tuple, Union, Dict, Any, Optional, Iterator
+from pathlib import Path
+import glob
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import sqlite3
+import numpy as np
+from wandb_allennlp.config import (
+    ALLENNLP_SERIALIZATION_DIR,
+    ALLENNLP_RUN_INDEX,
+)
+from wandb_allennlp.run_index import RunIndex
+from wandb_allennlp.sweep.scheduler import ParameterSetTrialSource, Trial
+
+logger = logging.getLogger(__name__)
+
+
+def _normal_cdf(x: float) -> float:
+    return 0.5 * (1.0 + math.erf(x / math.sqrt(2.0)))
+
+
+class Parameter:
+    """
+    One entry of the `parameters` section of a sweep config.
+
+    Supports `value`, `values` (with optional `probabilities`) and `min`/`max`
+    ranges with the `uniform`, `int_uniform`, `q_uniform`, `log_uniform`,
+    `log_uniform_values`, `q_log_uniform_values`, `normal`, `q_normal` and
+    `log_normal` distributions, with the same meaning as in wandb.
+    """
+
+    def __init__(self, name: str, spec: Dict[str, Any]) -> None:
+        self.name = name
+        self.spec = spec
+
+        if "value" in spec:
+            self.distribution = "constant"
+        elif "values" in spec:
+            self.distribution = "categorical"
+        elif "distribution" in spec:
+            self.distribution = spec["distribution"]
+        elif isinstance(spec.get("min"), int) and isinstance(
+            spec.get("max"), int
+        ):
+            self.distribution = "int_uniform"
+        elif "min" in spec and "max" in spec:
+            self.distribution = "uniform"
+        else:
+            raise ValueError(f"Cannot interpret parameter {name}: {spec}")
+
+    @property
+    def is_constant(self) -> bool:
+        return self.distribution == "constant"
+
+    def _quantize(self, x: float) -> float:
+        q = self.spec.get("q", 1.0)
+
+        return round(x / q) * q
+
+    def sample(self, rng: random.Random) -> Any:
+        spec, d = self.spec, self.distribution
+
+        if d == "constant":
+            return spec["value"]
+
+        if d == "categorical":
+            return rng.choices(
+                spec["values"], weights=spec.get("probabilities")
+            )[0]
+
+        if d == "int_uniform":
+            return rng.randint(spec["min"], spec["max"])
+
+        if d in ("uniform", "q_uniform"):
+            x = rng.uniform(spec["min"], spec["max"])
+
+            return self._quantize(x) if d == "q_uniform" else x
+
+        if d == "log_uniform":
+            return math.exp(rng.uniform(spec["min"], spec["max"]))
+
+        if d in ("log_uniform_values", "q_log_uniform_values"):
+            x = math.exp(
+                rng.uniform(math.log(spec["min"]), math.log(spec["max"]))
+            )
+
+            return self._quantize(x) if d.startswith("q_") else x
+
+        if d in ("normal", "q_normal"):
+            x = rng.gauss(spec.get("mu", 0.0), spec.get("sigma", 1.0))
+
+            return self._quantize(x) if d == "q_normal" else x
+
+        if d == "log_normal":
+            return math.exp(rng.gauss(spec.get("mu", 0.0), spec.get("sigma", 1.0)))
+        raise ValueError(f"Unsupported distribution {d} for {self.name}")
+
+    def grid_values(self) -> List[Any]:
+        if self.distribution == "constant":
+            return [self.spec["value"]]
+
+        if self.distribution == "categorical":
+            return list(self.spec["values"])
+
+        if self.distribution == "int_uniform":
+            return list(range(self.spec["min"], self.spec["max"] + 1))
+        raise ValueError(
+            f"Grid search needs 'value' or 'values' for {self.name}"
+        )
+
+    def encode(self, x: Any) -> float:
+        """Maps a value of the parameter to [0, 1] for the bayes method."""
+        spec, d = self.spec, self.distribution
+
+        if d == "categorical":
+            return spec["values"].index(x) / max(1, len(spec["values"]) - 1)
+
+        if d in ("uniform", "q_uniform", "int_uniform"):
+            return (x - spec["min"]) / (spec["max"] - spec["min"])
+
+        if d == "log_uniform":
+            return (math.log(x) - spec["min"]) / (spec["max"] - spec["min"])
+
+        if d in ("log_uniform_values", "q_log_uniform_values"):
+            low, high = math.log(spec["min"]), math.log(spec["max"])
+
+            return (math.log(x) - low) / (high - low)
+        mu, sigma = spec.get("mu", 0.0), spec.get("sigma", 1.0)
+
+        if d in ("normal", "q_normal"):
+            return _normal_cdf((x - mu) / sigma)
+
+        if d == "log_normal":
+            return _normal_cdf((math.log(x) - mu) / sigma)
+
+        return 0.0
+
+
+class LocalSweepController(ParameterSetTrialSource):
+    """
+    Proposes the parameters of the trials of a sweep config without the
+    wandb sweep server.
+
+    The outcome of every trial is appended to `store` as a JSON line. The
+    metric of a trial is read from the :class:`RunIndex` or, if it is not
+    there, from the `metrics.json` in its serialization directory. An
+    existing `store` is read at start up, so an interrupted sweep can be
+    continued.
+
+    Args:
+        sweep_config: The content of the sweep config.
+        store: Path to the JSON lines file with the results.
+        seed: Seed for the random and bayes methods.
+        count: Maximum number of trials to start.
+        num_initial_random: Number of trials with random parameters before
+            the bayes method starts to use the results.
+        num_candidates: Number of random candidates scored by the bayes
+            method for each proposal.
+    """
+
+    def __init__(
+        self,
+        sweep_config: Dict[str, Any],
+        store: str,
+        seed: Optional[int] = None,
+        count: Optional[int] = None,
+        num_initial_random: int = 5,
+        num_candidates: int = 1000,
+    ) -> None:
+        super().__init__(
+            [],
+            command=sweep_config.get("command"),
+            program=sweep_config.get("program", "allennlp"),
+            count=count,
+        )
+        self.method = sweep_config.get("method", "random")
+
+        if self.method not in ("grid", "random", "bayes"):
+            raise ValueError(f"Unsupported sweep method {self.method}")
+        self.parameters = [
+            Parameter(name, spec)
+            for name, spec in sweep_config["parameters"].items()
+        ]
+        metric = sweep_config.get("metric", {})
+        self.metric_name: Optional[str] = metric.get("name")
+        self.sign = -1.0 if metric.get("goal", "minimize") == "maximize" else 1.0
+        self.store = store
+        self.rng = random.Random(seed)
+        self.num_initial_random = num_initial_random
+        self.num_candidates = num_candidates
+        self.history: List[Dict[str, Any]] = self._read_store()
+        self._grid: Optional[Iterator[Tuple[Any, ...]]] = None
+
+    def _read_store(self) -> List[Dict[str, Any]]:
+        if not os.path.isfile(self.store):
+            return []
+        with open(self.store) as f:
+            history = [json.loads(line) for line in f if line.strip()]
+        logger.info(f"Read {len(history)} trials from {self.store}")
+
+        return history
+
+    def sample_random(self) -> Dict[str, Any]:
+        return {p.name: p.sample(self.rng) for p in self.parameters}
+
+    def next_params(self) -> Optional[Dict[str, Any]]:
+        if self.method == "grid":
+            return self._next_grid()
+
+        if self.method == "bayes":
+            return self._next_bayes()
+
+        return self.sample_random()
+
+    def _next_grid(self) -> Optional[Dict[str, Any]]:
+        names = [p.name for p in self.parameters]
+
+        if self._grid is None:
+            self._grid = itertools.product(
+                *[p.grid_values() for p in self.parameters]
+            )
+        done = [trial["params"] for trial in self.history]
+
+        for values in self._grid:
+            params = dict(zip(names, values))
+
+            if params not in done:
+                return params
+
+        return None
+
+    def _next_bayes(self) -> Dict[str, Any]:
+        varying = [p for p in self.parameters if not p.is_constant]
+        observed = [
+            trial
+            for trial in self.history
+            if trial.get("metric") is not None
+            and math.isfinite(trial["metric"])
+        ]
+
+        if not varying or len(observed) < self.num_initial_random:
+            return self.sample_random()
+        x = np.array(
+            [[p.encode(t["params"][p.name]) for p in varying] for t in observed]
+        )
+        y = self.sign * np.array([t["metric"] for t in observed])
+        y = (y - y.mean()) / (y.std() or 1.0)
+        candidates = [self.sample_random() for _ in range(self.num_candidates)]
+        x_candidates = np.array(
+            [[p.encode(c[p.name]) for p in varying] for c in candidates]
+        )
+        mean, std = _gaussian_process(x, y, x_candidates)
+        # expected improvement over the best observation (we minimize y)
+        z = (y.min() - mean) / std
+        cdf = np.array([_normal_cdf(v) for v in z])
+        pdf = np.exp(-0.5 * z ** 2) / math.sqrt(2 * math.pi)
+        expected_improvement = (y.min() - mean) * cdf + std * pdf
+
+        return candidates[int(np.argmax(expected_improvement))]
+
+    def next_trial(self) -> Optional[Trial]:
+        trial = super().next_trial()
+
+        if trial is not None:
+            logger.info(f"Trial {trial.trial_id}: {trial.params}")
+
+        return trial
+
+    def read_metric(self, trial_id: str) -> Optional[float]:
+        if self.metric_name is None:
+            return None
+        field = f"metrics.{self.metric_name}"
+        runs: List[Dict[str, Any]] = []
+
+        if os.path.isfile(ALLENNLP_RUN_INDEX):
+            try:
+                runs = RunIndex().query(
+                    [("run_id", "=", trial_id)], fields=[field]
+                )
+            except sqlite3.Error as e:
+                logger.warning(f"Could not read the run index: {e}")
+
+        if runs and isinstance(runs[0][field], (int, float)):
+            return float(runs[0][field])
+        # runs that were not recorded in the index
+        pattern = os.path.join(
+            ALLENNLP_SERIALIZATION_DIR, f"run-*-{trial_id}", "metrics.json"
+        )
+
+        for path in sorted(glob.glob(pattern), reverse=True):
+            with open(path) as f:
+                value = json.load(f).get(self.metric_name)
+
+            if isinstance(value, (int, float)):
+                return float(value)
+
+        return None
+
+    def on_trial_end(self, trial: Trial, returncode: int) -> None:
+        super().on_trial_end(trial, returncode)
+        record = {
+            "trial_id": trial.trial_id,
+            "params": trial.params,
+            "returncode": returncode,
+            "metric": self.read_metric(trial.trial_id),
+        }
+        self.history.append(record)
+        Path(self.store).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.store, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def _gaussian_process(
+    x: np.ndarray,
+    y: np.ndarray,
+    x_new: np.ndarray,
+    length_scale: float = 0.25,
+    noise: float = 1e-3,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Posterior mean and std of a GP with an RBF kernel at `x_new`."""
+
+    def kernel(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        sq_dist = ((a[:, None, :] - b[None, :, :]) ** 2).sum(-1)
+
+        return np.exp(-0.5 * sq_dist / length_scale ** 2)
+
+    cholesky = np.linalg.cholesky(kernel(x, x) + noise * np.eye(len(x)))
+    alpha = np.linalg.solve(
+        cholesky.T, np.linalg.solve(cholesky, y)
+    )
+    k_new = kernel(x_new, x)
+    mean = k_new @ alpha
+    v = np.linalg.solve(cholesky, k_new.T)
+    var = np.clip(1.0 - (v ** 2).sum(0), 1e-12, None)
+
+    return mean, np.sqrt(var)
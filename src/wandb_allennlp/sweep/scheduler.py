@@ -0,0 +1,360 @@
+"""Run the trials of a sweep as concurrent processes on a single node."""
+from typing import (
+    List,
+    Tuple,
+    Union,
+    Dict,
+    Any,
+    Optional,
+    Iterable,
+    Iterator,
+    NamedTuple,
+)
+from collections import deque
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from wandb_allennlp.utils import generate_run_id
+
+logger = logging.getLogger(__name__)
+
+#: Command used by wandb when the sweep config does not specify one.
+DEFAULT_COMMAND = ["${env}", "${interpreter}", "${program}", "${args}"]
+
+
+class Trial(NamedTuple):
+    trial_id: str
+    command: List[str]
+    params: Dict[str, Any]
+    env: Dict[str, str]
+
+
+def build_command(
+    template: List[str], params: Dict[str, Any], program: str = "allennlp"
+) -> List[str]:
+    """
+    Expands the macros of the `command` section of a wandb sweep config.
+
+    Args:
+        template: The `command` from the sweep config.
+        params: The parameters of the trial.
+        program: Value for ``${program}``.
+
+    Returns:
+        The command for :class:`subprocess.Popen`.
+    """
+    args = [f"--{k}={v}" for k, v in params.items()]
+    macros: Dict[str, List[str]] = {
+        "${env}": ["/usr/bin/env"],
+        "${interpreter}": [sys.executable],
+        "${program}": [program],
+        "${args}": args,
+        "${args_no_hyphens}": [f"{k}={v}" for k, v in params.items()],
+        "${args_json}": [json.dumps(params)],
+    }
+    command: List[str] = []
+
+    for part in template:
+        command.extend(macros.get(part, [part]))
+
+    return command
+
+
+class TrialSource:
+    """
+    Hands out trials to a :class:`SweepScheduler`.
+    """
+
+    #: Whether a trial that failed can be run again.
+    restartable = True
+
+    def next_trial(self) -> Optional[Trial]:
+        """
+        Returns:
+            The next trial to run or `None` if there are no more trials.
+        """
+        raise NotImplementedError
+
+    def on_trial_end(self, trial: Trial, returncode: int) -> None:
+        """Called once the trial finished for good, i.e., after retries."""
+        pass
+
+
+class WandbAgentTrialSource(TrialSource):
+    """
+    Runs one long-lived `wandb agent` per slot, which gets the trials from
+    the wandb sweep server and exits when the sweep is over or after its
+    share of `count` trials.
+
+    The "trials" of the scheduler are the agents. They are not restarted:
+    running an agent again would fetch a new trial rather than retry the
+    failed one, and its exit code does not tell whether a trial failed.
+
+    Args:
+        sweep_id: The sweep id in the form entity/project/sweep_id.
+        num_agents: Number of agents, usually the number of slots.
+        count: Total number of trials of all the agents. Default: until the
+            sweep is over.
+    """
+
+    restartable = False
+
+    def __init__(
+        self, sweep_id: str, num_agents: int = 1, count: Optional[int] = None
+    ) -> None:
+        if count is not None:
+            num_agents = min(num_agents, count)
+        self.sweep_id = sweep_id
+        self.num_agents = num_agents
+        self.count = count
+        self.num_started = 0
+
+    def next_trial(self) -> Optional[Trial]:
+        if self.num_started >= self.num_agents:
+            return None
+        command = ["wandb", "agent"]
+
+        if self.count is not None:
+            # split the trials evenly between the agents
+            share = self.count // self.num_agents + (
+                self.num_started < self.count % self.num_agents
+            )
+            command.append(f"--count={share}")
+        self.num_started += 1
+
+        return Trial(
+            trial_id=f"agent-{self.num_started}",
+            command=command + [self.sweep_id],
+            params={},
+            env={},
+        )
+
+
+class ParameterSetTrialSource(TrialSource):
+    """
+    Local stand-in for the wandb sweep controller that hands out a
+    given sequence of parameter sets.
+
+    Every trial gets a fresh `WANDB_RUN_ID`, so the serialization
+    directory created by `train-with-wandb` can be traced back to it.
+    """
+
+    def __init__(
+        self,
+        parameter_sets: Iterable[Dict[str, Any]],
+        command: Optional[List[str]] = None,
+        program: str = "allennlp",
+        count: Optional[int] = None,
+    ) -> None:
+        self.parameter_sets: Iterator[Dict[str, Any]] = iter(parameter_sets)
+        self.command = command or DEFAULT_COMMAND
+        self.program = program
+        self.count = count
+        self.num_started = 0
+        self.results: Dict[str, int] = {}
+
+    def next_params(self) -> Optional[Dict[str, Any]]:
+        return next(self.parameter_sets, None)
+
+    def next_trial(self) -> Optional[Trial]:
+        if self.count is not None and self.num_started >= self.count:
+            return None
+        params = self.next_params()
+
+        if params is None:
+            return None
+        self.num_started += 1
+        run_id = generate_run_id()
+
+        return Trial(
+            trial_id=run_id,
+            command=build_command(self.command, params, self.program),
+            params=params,
+            env={"WANDB_RUN_ID": run_id},
+        )
+
+    def on_trial_end(self, trial: Trial, returncode: int) -> None:
+        self.results[trial.trial_id] = returncode
+
+
+def device_slots(
+    devices: Optional[List[str]] = None,
+    cpu_slots: int = 0,
+    slots_per_device: int = 1,
+) -> List[Dict[str, str]]:
+    """
+    Creates the environment for each slot of the scheduler.
+
+    Args:
+        devices: CUDA device ids. Each trial only sees its own device as
+            ``cuda:0``.
+        cpu_slots: Number of CPU-only slots. The available cores are split
+            evenly between them.
+        slots_per_device: Number of concurrent trials on each device.
+
+    Returns:
+        One dict of environment variables per slot.
+    """
+    slots = [
+        {"CUDA_VISIBLE_DEVICES": str(device)}
+        for device in devices or []
+        for _ in range(slots_per_device)
+    ]
+
+    if cpu_slots > 0:
+        threads = str(max(1, (os.cpu_count() or 1) // cpu_slots))
+        slots += [
+            {"CUDA_VISIBLE_DEVICES": "", "OMP_NUM_THREADS": threads}
+            for _ in range(cpu_slots)
+        ]
+
+    return slots
+
+
+class SweepScheduler:
+    """
+    Keeps one trial running in each slot until the source runs out of
+    trials.
+
+    A trial that exits with a non-zero code is started again, in the next
+    free slot, up to `max_restarts` times, unless the source is not
+    :attr:`TrialSource.restartable`.
+
+    Args:
+        source: Hands out the trials.
+        slots: Environment variables for each slot, see :func:`device_slots`.
+        max_restarts: Number of times a failed trial is restarted.
+        poll_interval: Seconds between checks of the running processes.
+        log_dir: If given, the output of each trial goes to
+            `log_dir/<trial_id>.log` instead of the output of the scheduler.
+    """
+
+    def __init__(
+        self,
+        source: TrialSource,
+        slots: List[Dict[str, str]],
+        max_restarts: int = 2,
+        poll_interval: float = 1.0,
+        log_dir: Optional[str] = None,
+    ) -> None:
+        if not slots:
+            raise ValueError("At least one slot is required.")
+        self.source = source
+        self.slots = slots
+        self.max_restarts = max_restarts
+        self.poll_interval = poll_interval
+        self.log_dir = log_dir
+        self.restarts: Dict[str, int] = {}
+        self.returncodes: Dict[str, int] = {}
+
+    def _start(self, trial: Trial, slot: int) -> subprocess.Popen:
+        env = dict(os.environ)
+        env.update(self.slots[slot])
+        env.update(trial.env)
+        output = None
+
+        if self.log_dir is not None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            output = open(
+                os.path.join(self.log_dir, f"{trial.trial_id}.log"), "a"
+            )
+        logger.info(
+            f"Starting trial {trial.trial_id} in slot {slot}: "
+            f"{' '.join(trial.command)}"
+        )
+
+        try:
+            return subprocess.Popen(
+                trial.command,
+                env=env,
+                stdout=output,
+                stderr=subprocess.STDOUT if output else None,
+            )
+        finally:
+            if output is not None:
+                output.close()
+
+    def run(self) -> Dict[str, int]:
+        """
+        Runs all the trials.
+
+        Returns:
+            The final exit code of each trial.
+        """
+        free_slots = deque(range(len(self.slots)))
+        retries: "deque[Trial]" = deque()
+        running: Dict[int, Tuple[Trial, subprocess.Popen]] = {}
+        start_time = time.time()
+        exhausted = False
+
+        try:
+            while True:
+                while free_slots and (retries or not exhausted):
+                    trial = retries.popleft() if retries else None
+
+                    if trial is None:
+                        trial = self.source.next_trial()
+
+                    if trial is None:
+                        exhausted = True
+
+                        break
+                    slot = free_slots.popleft()
+                    running[slot] = (trial, self._start(trial, slot))
+
+                if not running:
+                    break
+                time.sleep(self.poll_interval)
+
+                for slot, (trial, process) in list(running.items()):
+                    returncode = process.poll()
+
+                    if returncode is None:
+                        continue
+                    del running[slot]
+                    free_slots.append(slot)
+                    self._finish(trial, returncode, retries)
+        finally:
+            for trial, process in running.values():
+                logger.warning(f"Terminating trial {trial.trial_id}")
+                process.terminate()
+
+            for trial, process in running.values():
+                process.wait()
+
+        elapsed = time.time() - start_time
+        logger.info(
+            f"Finished {len(self.returncodes)} trials in {elapsed:.1f}s "
+            f"({3600 * len(self.returncodes) / max(elapsed, 1e-6):.1f} trials/hour)."
+        )
+
+        return self.returncodes
+
+    def _finish(
+        self, trial: Trial, returncode: int, retries: "deque[Trial]"
+    ) -> None:
+        restarts = self.restarts.get(trial.trial_id, 0)
+
+        if (
+            returncode != 0
+            and self.source.restartable
+            and restarts < self.max_restarts
+        ):
+            logger.warning(
+                f"Trial {trial.trial_id} exited with code {returncode}."
+                f" Restarting ({restarts + 1}/{self.max_restarts})."
+            )
+            self.restarts[trial.trial_id] = restarts + 1
+            retries.append(trial)
+
+            return
+
+        if returncode != 0:
+            logger.error(
+                f"Trial {trial.trial_id} failed with code {returncode}."
+            )
+        self.returncodes[trial.trial_id] = returncode
+        self.source.on_trial_end(trial, returncode)
@@ -1,2 +1,3 @@
 from wandb_allennlp.training import train_and_test 
 from wandb_allennlp.training import callbacks
+from wandb_allennlp.training import data_cache
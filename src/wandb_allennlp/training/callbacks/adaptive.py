@@ -0,0 +1,91 @@
+"""Adapt the logging intervals to the measured cost of logging."""
+from typing import List, Tuple, Union, Dict, Any, Optional
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveIntervals:
+    """
+    Keeps the time spent on logging under a fraction of the training time.
+
+    The cost of every logging category (e.g., the scalar summaries or the
+    histograms) and the time of a training step are tracked with an
+    exponential moving average. The budget is split evenly between the
+    categories and the interval of each category is the smallest one whose
+    cost per step fits its share.
+
+    Args:
+        intervals: Initial interval of each category.
+        max_overhead: Fraction of the step time that may be spent on logging.
+        min_points_per_epoch: Each category is logged at least this many
+            times per epoch, even if that exceeds the budget.
+        smoothing: Weight of a new measurement in the moving averages.
+    """
+
+    def __init__(
+        self,
+        intervals: Dict[str, int],
+        max_overhead: float = 0.05,
+        min_points_per_epoch: int = 10,
+        smoothing: float = 0.1,
+    ) -> None:
+        if not 0 < max_overhead < 1:
+            raise ValueError("max_overhead should be in (0, 1)")
+        self.intervals = dict(intervals)
+        self.max_overhead = max_overhead
+        self.min_points_per_epoch = min_points_per_epoch
+        self.smoothing = smoothing
+        self.max_interval: Optional[int] = None
+        self._costs: Dict[str, float] = {}
+        self._step_time: Optional[float] = None
+
+    def _average(self, old: Optional[float], new: float) -> float:
+        if old is None:
+            return new
+
+        return (1 - self.smoothing) * old + self.smoothing * new
+
+    def set_steps_per_epoch(self, steps: Optional[int]) -> None:
+        if steps is None:
+            self.max_interval = None
+        else:
+            self.max_interval = max(1, steps // self.min_points_per_epoch)
+
+    def record_step(self, seconds: float) -> None:
+        """Records the time of a training step, without the logging."""
+        self._step_time = self._average(self._step_time, seconds)
+
+    def record_logging(self, categories: List[str], seconds: float) -> None:
+        """
+        Records the time spent logging the `categories` that were due
+        on the same step. The time is split evenly between them.
+        """
+
+        if not categories:
+            return
+
+        for category in categories:
+            self._costs[category] = self._average(
+                self._costs.get(category), seconds / len(categories)
+            )
+        self._update()
+
+    def _update(self) -> None:
+        if not self._step_time:
+            return
+        budget = self.max_overhead * self._step_time / len(self.intervals)
+
+        for category, cost in self._costs.items():
+            interval = max(1, math.ceil(cost / budget))
+
+            if self.max_interval is not None:
+                interval = min(interval, self.max_interval)
+
+            if interval != self.intervals[category]:
+                logger.debug(
+                    f"Logging interval of {category}: "
+                    f"{self.intervals[category]} -> {interval}"
+                )
+                self.intervals[category] = interval
@@ -0,0 +1,75 @@
+"""Keep the weights of the best epoch in host memory."""
+from typing import List, Tuple, Union, Dict, Any, Optional
+import logging
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class HostWeightsSnapshot:
+    """
+    Copy of the state dict of a model in host memory.
+
+    The buffers are allocated on the first :meth:`save` and reused, so
+    taking a snapshot after every new best epoch does not allocate.
+
+    Args:
+        pin_memory: Use pinned memory, so that the copies from and to the GPU
+            are faster.
+        dtype: Store the floating point tensors with this dtype, e.g.,
+            `torch.float16` to halve the memory. They are cast back on
+            :meth:`restore`.
+    """
+
+    def __init__(
+        self, pin_memory: bool = False, dtype: Optional[torch.dtype] = None
+    ) -> None:
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self.dtype = dtype
+        self.state: Dict[str, torch.Tensor] = {}
+
+    def _buffer(self, name: str, tensor: torch.Tensor) -> torch.Tensor:
+        dtype = (
+            self.dtype
+            if self.dtype is not None and tensor.is_floating_point()
+            else tensor.dtype
+        )
+        buffer = self.state.get(name)
+
+        if (
+            buffer is None
+            or buffer.shape != tensor.shape
+            or buffer.dtype != dtype
+        ):
+            buffer = torch.empty(
+                tensor.shape, dtype=dtype, pin_memory=self.pin_memory
+            )
+            self.state[name] = buffer
+
+        return buffer
+
+    def save(self, module: torch.nn.Module) -> None:
+        state = module.state_dict()
+
+        with torch.no_grad():
+            for name, tensor in state.items():
+                self._buffer(name, tensor).copy_(
+                    tensor, non_blocking=self.pin_memory
+                )
+
+        for name in set(self.state) - set(state):
+            del self.state[name]
+
+        if self.pin_memory:
+            # the copies to pinned memory are asynchronous
+            torch.cuda.synchronize()
+
+    def restore(self, module: torch.nn.Module) -> None:
+        if not self.state:
+            raise RuntimeError("There is no snapshot to restore.")
+        # load_state_dict() copies, and casts, into the existing parameters
+        module.load_state_dict(self.state)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(t.numel() * t.element_size() for t in self.state.values())
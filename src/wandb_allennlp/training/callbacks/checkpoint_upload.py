@@ -0,0 +1,176 @@
+"""Upload the checkpoints of every epoch in the background."""
+from typing import List, Tuple, Union, Dict, Any, Optional, Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+import glob
+import logging
+import os
+import shutil
+import threading
+from wandb_allennlp.training.resume import CHECKPOINT_PATTERNS
+
+logger = logging.getLogger(__name__)
+
+
+class _Uploaded:
+    def __init__(self, epoch: int, handle: Any, is_best: bool) -> None:
+        self.epoch = epoch
+        self.handle = handle
+        self.is_best = is_best
+
+
+class CheckpointUploader:
+    """
+    Snapshots the checkpoint files that changed since the last call and
+    uploads them on a background thread.
+
+    A new file is hardlinked into the snapshot. A file that was already
+    there before (like `best.th`) may be overwritten in place, so it is
+    copied instead. The snapshot is deleted once it is uploaded.
+
+    Args:
+        directory: The serialization directory.
+        staging_dir: Where the snapshots are kept until they are uploaded.
+        upload: Uploads a snapshot directory for an epoch with the given
+            aliases and returns a handle for `delete`.
+        delete: Deletes an uploaded snapshot given its handle. Without it,
+            all the snapshots are kept.
+        patterns: Globs of the checkpoint files in `directory`.
+        max_in_flight: Number of snapshots being uploaded or waiting for it.
+            Taking another snapshot blocks until one of them is done.
+        keep_last: Number of most recent snapshots kept remotely, besides
+            the best one.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        staging_dir: str,
+        upload: Callable[[str, int, List[str]], Any],
+        delete: Optional[Callable[[Any], None]] = None,
+        patterns: Optional[List[str]] = None,
+        max_in_flight: int = 1,
+        keep_last: int = 1,
+    ) -> None:
+        self.directory = directory
+        self.staging_dir = staging_dir
+        self.upload = upload
+        self.delete = delete
+        self.patterns = patterns or CHECKPOINT_PATTERNS
+        self.keep_last = keep_last
+        self.uploaded: List[_Uploaded] = []
+        self.errors: List[BaseException] = []
+        self._seen: Dict[str, Tuple[float, int]] = {}
+        self._num_snapshots = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix="checkpoint-upload"
+        )
+
+    def _changed_files(self) -> List[Tuple[str, bool]]:
+        changed = []
+
+        for pattern in self.patterns:
+            for path in glob.glob(os.path.join(self.directory, pattern)):
+                stat = os.stat(path)
+                key = (stat.st_mtime, stat.st_size)
+                name = os.path.basename(path)
+
+                if self._seen.get(name) != key:
+                    changed.append((name, name not in self._seen))
+                    self._seen[name] = key
+
+        return changed
+
+    def snapshot(self, epoch: int) -> Optional[str]:
+        """
+        Returns:
+            The snapshot directory or `None` if no checkpoint changed.
+        """
+        changed = self._changed_files()
+
+        if not changed:
+            return None
+        snapshot_dir = os.path.join(
+            self.staging_dir, f"{self._num_snapshots}-epoch-{epoch}"
+        )
+        self._num_snapshots += 1
+        os.makedirs(snapshot_dir)
+
+        for name, is_new in changed:
+            source = os.path.join(self.directory, name)
+            target = os.path.join(snapshot_dir, name)
+
+            if is_new:
+                try:
+                    os.link(source, target)
+
+                    continue
+                except OSError:
+                    pass
+            shutil.copy2(source, target)
+
+        return snapshot_dir
+
+    def submit(self, epoch: int) -> Optional[Future]:
+        """
+        Snapshots the changed checkpoints and queues their upload. The
+        snapshot is the best one if `best.th` changed.
+        """
+        snapshot_dir = self.snapshot(epoch)
+
+        if snapshot_dir is None:
+            return None
+        is_best = os.path.exists(os.path.join(snapshot_dir, "best.th"))
+        aliases = ["latest", f"epoch-{epoch}"] + (["best"] if is_best else [])
+        self._slots.acquire()
+
+        try:
+            return self._executor.submit(
+                self._upload, snapshot_dir, epoch, aliases, is_best
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _upload(
+        self, snapshot_dir: str, epoch: int, aliases: List[str], is_best: bool
+    ) -> None:
+        try:
+            handle = self.upload(snapshot_dir, epoch, aliases)
+            self._retain(_Uploaded(epoch, handle, is_best))
+        except BaseException as e:
+            logger.warning(f"Uploading the checkpoint of epoch {epoch} failed: {e}")
+            self.errors.append(e)
+        finally:
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+            self._slots.release()
+
+    def _retain(self, uploaded: _Uploaded) -> None:
+        with self._lock:
+            if uploaded.is_best:
+                for other in self.uploaded:
+                    other.is_best = False
+            self.uploaded.append(uploaded)
+            self.uploaded.sort(key=lambda u: u.epoch)
+
+            if self.delete is None:
+                return
+            recent = self.uploaded[-self.keep_last :] if self.keep_last else []
+            to_delete = [
+                u for u in self.uploaded if u not in recent and not u.is_best
+            ]
+            self.uploaded = [u for u in self.uploaded if u not in to_delete]
+
+        for old in to_delete:
+            try:
+                self.delete(old.handle)
+            except Exception as e:
+                logger.warning(
+                    f"Deleting the checkpoint of epoch {old.epoch} failed: {e}"
+                )
+
+    def close(self) -> None:
+        """Waits for the uploads in flight."""
+        self._executor.shutdown(wait=True)
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
@@ -0,0 +1,153 @@
+"""Aggregate the logged scalars across the workers of distributed training."""
+from typing import List, Tuple, Union, Dict, Any, Optional
+import logging
+import math
+import time
+import torch
+import torch.distributed as dist
+
+logger = logging.getLogger(__name__)
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+
+def all_gather_scalars(values: Dict[str, float]) -> Dict[str, List[float]]:
+    """
+    Gathers the scalars of every worker with a single collective.
+
+    All the workers have to call this with the same keys.
+
+    Args:
+        values: The scalars of this worker.
+
+    Returns:
+        The values of each key on every worker, ordered by rank.
+    """
+    names = sorted(values)
+    device = (
+        torch.device("cuda", torch.cuda.current_device())
+        if dist.get_backend() == "nccl"
+        else torch.device("cpu")
+    )
+    packed = torch.tensor(
+        [float(values[name]) for name in names],
+        dtype=torch.float64,
+        device=device,
+    )
+    gathered = [torch.empty_like(packed) for _ in range(dist.get_world_size())]
+    dist.all_gather(gathered, packed)
+    stacked = torch.stack(gathered).cpu()
+
+    return {name: stacked[:, i].tolist() for i, name in enumerate(names)}
+
+
+def _nanmean(values: List[float]) -> float:
+    finite = [v for v in values if not math.isnan(v)]
+
+    return sum(finite) / len(finite) if finite else math.nan
+
+
+class RankAggregator:
+    """
+    Aggregates batch metrics, throughput and time per batch over all the
+    workers once per log interval.
+
+    Every worker counts its own batches and instances between two calls to
+    :meth:`aggregate`, which exchanges them, together with the selected
+    metrics, in one packed `all_gather`.
+
+    Args:
+        metrics: Names of the batch metrics to average over the workers.
+            Defaults to the numeric batch metrics of rank 0 at the first
+            call to :meth:`aggregate`, which it broadcasts to the others.
+    """
+
+    def __init__(self, metrics: Optional[List[str]] = None) -> None:
+        self.metrics = metrics
+        self.reset()
+
+    def reset(self) -> None:
+        self._num_batches = 0
+        self._num_instances = 0
+        self._start_time = time.perf_counter()
+
+    def count(self, num_instances: int) -> None:
+        """Called after every training batch of this worker."""
+        self._num_batches += 1
+        self._num_instances += num_instances
+
+    def aggregate(self, batch_metrics: Dict[str, Any]) -> Dict[str, float]:
+        """
+        Must be called by all the workers at the same batch.
+
+        Returns:
+            The selected metrics averaged over the workers, the total
+            `instances_per_second` of the job and the mean and max (i.e.,
+            slowest worker) of `seconds_per_batch`.
+        """
+        elapsed = max(time.perf_counter() - self._start_time, 1e-9)
+
+        if self.metrics is None:
+            # all_gather_scalars needs the same names on all the workers
+            names = [
+                [
+                    k
+                    for k, v in batch_metrics.items()
+                    if isinstance(v, (int, float)) and not isinstance(v, bool)
+                ]
+            ]
+            dist.broadcast_object_list(names, src=0)
+            self.metrics = names[0]
+        names = self.metrics
+        local = {
+            f"metric.{name}": float(batch_metrics.get(name, math.nan))
+            for name in names
+        }
+        local["instances_per_second"] = self._num_instances / elapsed
+        local["seconds_per_batch"] = elapsed / max(self._num_batches, 1)
+        gathered = all_gather_scalars(local)
+        self.reset()
+        aggregated = {
+            name: _nanmean(gathered[f"metric.{name}"]) for name in names
+        }
+        aggregated["instances_per_second"] = sum(
+            gathered["instances_per_second"]
+        )
+        aggregated["seconds_per_batch"] = _nanmean(
+            gathered["seconds_per_batch"]
+        )
+        aggregated["seconds_per_batch_max"] = max(
+            gathered["seconds_per_batch"]
+        )
+
+        return aggregated
+
+
+def summarize_ranks(values: Dict[str, float]) -> Dict[str, float]:
+    """
+    Gathers the scalars of every worker (see :func:`all_gather_scalars`) and
+    summarizes each of them over the workers.
+
+    Returns:
+        For every key, its `_max`, `_min`, `_mean`, `_skew` (max over mean)
+        and the `_slowest_rank`, i.e., the rank with the largest value.
+    """
+    gathered = (
+        all_gather_scalars(values)
+        if is_distributed()
+        else {name: [float(value)] for name, value in values.items()}
+    )
+    summary: Dict[str, float] = {}
+
+    for name, per_rank in gathered.items():
+        largest = max(per_rank)
+        mean = sum(per_rank) / len(per_rank)
+        summary[f"{name}_max"] = largest
+        summary[f"{name}_min"] = min(per_rank)
+        summary[f"{name}_mean"] = mean
+        summary[f"{name}_skew"] = largest / mean if mean > 0 else 1.0
+        summary[f"{name}_slowest_rank"] = per_rank.index(largest)
+
+    return summary
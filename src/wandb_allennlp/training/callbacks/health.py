@@ -0,0 +1,168 @@
+"""Cheap checks for training that diverges."""
+from typing import List, Tuple, Union, Dict, Any, Optional, Iterable
+import logging
+import math
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class SeriesStats:
+    """
+    Mean, max, number of non-finite values and number of spikes of a series
+    of scalars.
+
+    Tensors are accumulated on their device: adding one only launches a few
+    small kernels and never waits for the device. The statistics are copied
+    to the host by :meth:`read`. Python numbers, which are on the host
+    already, are accumulated in python.
+
+    Args:
+        spike_factor: A value larger than `spike_factor` times the moving
+            average of the previous values is a spike. `None` disables the
+            spike detection.
+        ema_decay: Decay of the moving average.
+        warmup: Number of values to see before counting spikes.
+    """
+
+    #: Reset by :meth:`read`. The moving average and its weight, which
+    #: removes the bias towards the initial 0, are kept.
+    RESET = {"sum": 0.0, "max": -math.inf, "nonfinite": 0.0, "spikes": 0.0}
+
+    def __init__(
+        self,
+        spike_factor: Optional[float] = None,
+        ema_decay: float = 0.99,
+        warmup: int = 10,
+    ) -> None:
+        self.spike_factor = spike_factor
+        self.ema_decay = ema_decay
+        self.warmup = warmup
+        self.num_values = 0
+        self._seen = 0
+        self._state: Dict[str, Any] = {
+            **self.RESET,
+            "ema": 0.0,
+            "ema_weight": 0.0,
+        }
+
+    def _count_spikes(self) -> bool:
+        return self.spike_factor is not None and self._seen >= self.warmup
+
+    def _add_number(self, value: float) -> None:
+        state = self._state
+
+        if not math.isfinite(value):
+            state["nonfinite"] += 1
+        else:
+            if self._count_spikes():
+                average = state["ema"] / max(state["ema_weight"], 1e-12)
+                state["spikes"] += value > self.spike_factor * average
+            state["sum"] += value
+            state["max"] = max(state["max"], value)
+            state["ema"] = (
+                self.ema_decay * state["ema"] + (1 - self.ema_decay) * value
+            )
+            state["ema_weight"] = (
+                self.ema_decay * state["ema_weight"] + 1 - self.ema_decay
+            )
+
+    def _add_tensor(self, value: torch.Tensor) -> None:
+        value = value.detach().float().reshape(())
+        state = self._state
+
+        if not isinstance(state["sum"], torch.Tensor):
+            for name in state:
+                state[name] = torch.tensor(state[name], device=value.device)
+        finite = torch.isfinite(value)
+        clean = torch.where(finite, value, torch.zeros_like(value))
+
+        if self._count_spikes():
+            average = state["ema"] / state["ema_weight"].clamp(min=1e-12)
+            state["spikes"] += finite & (value > self.spike_factor * average)
+        state["sum"] += clean
+        state["max"] = torch.maximum(
+            state["max"], torch.where(finite, value, state["max"])
+        )
+        state["nonfinite"] += ~finite
+        # non-finite values leave the average as it is
+        decay = torch.where(
+            finite,
+            torch.full_like(value, self.ema_decay),
+            torch.ones_like(value),
+        )
+        state["ema"] = decay * state["ema"] + (1 - decay) * clean
+        state["ema_weight"] = decay * state["ema_weight"] + 1 - decay
+
+    def add(self, value: Union[float, torch.Tensor]) -> None:
+        if isinstance(value, torch.Tensor):
+            self._add_tensor(value)
+        elif isinstance(self._state["sum"], torch.Tensor):
+            self._add_tensor(torch.tensor(float(value)))
+        else:
+            self._add_number(float(value))
+        self.num_values += 1
+        self._seen += 1
+
+    def read(self) -> Dict[str, float]:
+        """
+        Returns the statistics of the values added since the last read, with
+        at most one copy from the device, and resets them.
+        """
+        if self.num_values == 0:
+            return {}
+        state = self._state
+        values = [state[name] for name in self.RESET]
+
+        if isinstance(values[0], torch.Tensor):
+            values = torch.stack(values).tolist()
+        total, maximum, nonfinite, spikes = map(float, values)
+        num_finite = self.num_values - nonfinite
+        stats = {"nonfinite": nonfinite, "spikes": spikes}
+
+        if num_finite > 0:
+            stats.update(mean=total / num_finite, max=maximum)
+
+        for name, initial in self.RESET.items():
+            if isinstance(state[name], torch.Tensor):
+                state[name].fill_(initial)
+            else:
+                state[name] = initial
+        self.num_values = 0
+
+        return stats
+
+
+def gradient_norm(
+    parameters: Iterable[torch.nn.Parameter],
+    scale: Optional[torch.Tensor] = None,
+) -> Optional[torch.Tensor]:
+    """
+    The total L2 norm of the gradients as a tensor on the device, computed
+    with one fused kernel where torch has `_foreach_norm`.
+
+    Args:
+        scale: The loss scale of mixed precision training, by which the
+            gradients are still multiplied.
+    """
+    grads = [
+        p.grad.detach().coalesce().values() if p.grad.is_sparse else p.grad
+        for p in parameters
+        if p.grad is not None
+    ]
+
+    if not grads:
+        return None
+    try:
+        norms = list(torch._foreach_norm(grads))
+    except (AttributeError, RuntimeError):  # older torch
+        norms = [torch.linalg.vector_norm(g.detach()) for g in grads]
+    device = norms[0].device
+    norm = torch.linalg.vector_norm(
+        torch.stack([n.to(device, torch.float32) for n in norms])
+    )
+
+    if scale is not None:
+        norm = norm / scale.to(device)
+
+    return norm
@@ -0,0 +1,95 @@
+"""Downsample the scalar history that is uploaded to wandb."""
+from typing import List, Tuple, Union, Dict, Any, Optional
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+
+class _Bucket:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+
+class DownsampledHistory:
+    """
+    Aggregates consecutive values of every scalar into min/mean/max buckets.
+
+    The first `points_per_resolution` buckets of a scalar hold `bucket_size`
+    values each, the next ones twice as many, and so on. So the number of
+    points of a run of `n` steps grows with `log(n)` instead of `n`, while
+    the beginning of the run, where most things happen, keeps the finest
+    resolution.
+
+    Args:
+        bucket_size: Number of values in the first buckets.
+        points_per_resolution: Number of buckets before the bucket size
+            doubles.
+    """
+
+    def __init__(
+        self, bucket_size: int = 10, points_per_resolution: int = 1000
+    ) -> None:
+        if bucket_size < 1 or points_per_resolution < 1:
+            raise ValueError(
+                "bucket_size and points_per_resolution should be positive"
+            )
+        self.bucket_size = bucket_size
+        self.points_per_resolution = points_per_resolution
+        self._buckets: Dict[str, _Bucket] = {}
+        self._num_points: Dict[str, int] = {}
+
+    def current_bucket_size(self, name: str) -> int:
+        level = self._num_points.get(name, 0) // self.points_per_resolution
+
+        return self.bucket_size * 2 ** level
+
+    def _close(self, name: str) -> Dict[str, float]:
+        bucket = self._buckets.pop(name)
+        self._num_points[name] = self._num_points.get(name, 0) + 1
+
+        if bucket.count == 1:
+            return {name: bucket.total}
+
+        return {
+            name: bucket.total / bucket.count,
+            f"{name}_min": bucket.min,
+            f"{name}_max": bucket.max,
+        }
+
+    def add(self, scalars: Dict[str, float]) -> Dict[str, float]:
+        """
+        Adds one value of each of the `scalars`.
+
+        Returns:
+            The mean, min (`<name>_min`) and max (`<name>_max`) of the
+            buckets that are complete.
+        """
+        complete: Dict[str, float] = {}
+
+        for name, value in scalars.items():
+            bucket = self._buckets.setdefault(name, _Bucket())
+            bucket.add(float(value))
+
+            if bucket.count >= self.current_bucket_size(name):
+                complete.update(self._close(name))
+
+        return complete
+
+    def flush(self) -> Dict[str, float]:
+        """Closes all the buckets, e.g., at the end of an epoch."""
+        complete: Dict[str, float] = {}
+
+        for name in list(self._buckets):
+            complete.update(self._close(name))
+
+        return complete
@@ -0,0 +1,164 @@
+"""Upload growing files, like `out.log`, without uploading them again and again.
+
+With `policy="live"`, wandb uploads the whole file every time it changes, so a
+log that grows during a long run causes quadratic upload traffic.
+:class:`LiveFileSync` instead uploads only the bytes appended since the last
+upload, as a sequence of numbered chunk files, at most once per interval and
+within a bandwidth budget.
+"""
+from typing import List, Tuple, Union, Dict, Any, Optional, Callable
+import glob
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def wandb_save_now(upload_dir: str) -> Callable[[str], None]:
+    """Uploads a file once with `wandb.save(..., policy="now")`."""
+    import wandb
+
+    base_path = os.path.dirname(upload_dir)
+
+    def save(path: str) -> None:
+        if wandb.run is None:
+            logger.warning(f"The wandb run is finished. Not uploading {path}.")
+
+            return
+        wandb.save(path, base_path=base_path, policy="now")
+
+    return save
+
+
+class LiveFileSync:
+    """
+    Uploads the bytes appended to the files matching `patterns` as chunks
+    `<upload_dir>/<file>.<chunk number>`.
+
+    A file that becomes shorter, e.g., because it was truncated, is uploaded
+    again from the beginning.
+
+    Args:
+        directory: The directory the `patterns` are relative to.
+        patterns: Globs of the files to upload.
+        upload_dir: Where the chunks are written before they are uploaded.
+        save: Uploads a chunk. Default: :func:`wandb_save_now`.
+        min_interval: Seconds between two uploads.
+        max_bytes_per_second: Average upload bandwidth. The bytes above the
+            budget are uploaded later. Default: no limit.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        patterns: List[str],
+        upload_dir: str,
+        save: Optional[Callable[[str], None]] = None,
+        min_interval: float = 30.0,
+        max_bytes_per_second: Optional[float] = None,
+    ) -> None:
+        self.directory = directory
+        self.patterns = patterns
+        self.upload_dir = upload_dir
+        self.save = save or wandb_save_now(upload_dir)
+        self.min_interval = min_interval
+        self.max_bytes_per_second = max_bytes_per_second
+        self.offsets: Dict[str, int] = {}
+        self.num_chunks: Dict[str, int] = {}
+        self.bytes_uploaded = 0
+        self._last_sync: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _files(self) -> List[str]:
+        files = set()
+
+        for pattern in self.patterns:
+            for path in glob.glob(os.path.join(self.directory, pattern)):
+                if os.path.isfile(path):
+                    files.add(os.path.relpath(path, self.directory))
+
+        return sorted(files)
+
+    def _budget(self, now: float, ignore_limits: bool) -> Optional[int]:
+        if ignore_limits or self.max_bytes_per_second is None:
+            return None
+        elapsed = (
+            self.min_interval
+            if self._last_sync is None
+            else now - self._last_sync
+        )
+
+        return int(self.max_bytes_per_second * elapsed)
+
+    def sync(self, ignore_limits: bool = False) -> int:
+        """
+        Uploads what was appended since the last call.
+
+        Args:
+            ignore_limits: Upload everything, e.g., at the end of the run.
+
+        Returns:
+            The number of bytes uploaded.
+        """
+        with self._lock:
+            now = time.time()
+            budget = self._budget(now, ignore_limits)
+            uploaded = 0
+
+            for name in self._files():
+                path = os.path.join(self.directory, name)
+                size = os.path.getsize(path)
+                offset = self.offsets.get(name, 0)
+
+                if size < offset:
+                    logger.info(f"{name} got shorter. Uploading it again.")
+                    offset = 0
+                end = size if budget is None else min(size, offset + budget)
+
+                if end <= offset:
+                    continue
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    data = f.read(end - offset)
+                chunk = self.num_chunks.get(name, 0)
+                chunk_path = os.path.join(self.upload_dir, f"{name}.{chunk:06d}")
+                os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+                with open(chunk_path, "wb") as f:
+                    f.write(data)
+                self.save(chunk_path)
+                self.num_chunks[name] = chunk + 1
+                self.offsets[name] = offset + len(data)
+                uploaded += len(data)
+
+                if budget is not None:
+                    budget -= len(data)
+            self._last_sync = now
+            self.bytes_uploaded += uploaded
+
+        return uploaded
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.min_interval):
+            try:
+                self.sync()
+            except Exception as e:
+                logger.warning(f"Live sync failed: {e}")
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, name="live-file-sync", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the background thread and uploads the rest of the files."""
+
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.sync(ignore_limits=True)
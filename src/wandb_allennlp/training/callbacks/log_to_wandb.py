@@ -1,5 +1,6 @@
 from typing import List, Tuple, Union, Dict, Any, Optional, Callable
 import logging
+import math
 from allennlp.common.registrable import Registrable
 from allennlp.training.callbacks import (
     WandBCallback,
@@ -8,13 +9,31 @@ from allennlp.training.callbacks import (
 from allennlp.training.callbacks.log_writer import LogWriterCallback
 from allennlp.training import GradientDescentTrainer
 from allennlp.data import TensorDict
+from allennlp.training.util import get_batch_size
 
 from allennlp.models.archival import archive_model, verify_include_in_archive
 from wandb_allennlp.utils import read_from_env
 from overrides import overrides
 import os
+import sys
+import time
 import torch
-from .utils import flatten_dict
+from .utils import (
+    filter_config,
+    flatten_dict,
+    get_config_from_serialization_dir,
+)
+from .adaptive import AdaptiveIntervals
+from .history import DownsampledHistory
+from .scalar_log import ScalarLogWriter
+from .live_sync import LiveFileSync
+from concurrent.futures import ThreadPoolExecutor
+from wandb_allennlp.run_index import RunIndex
+from wandb_allennlp.content_store import ContentStore
+from wandb_allennlp.mmap_archive import write_mmap_archive
+from wandb_allennlp.training.resume import checkpoint_files
+from .distributed import RankAggregator, is_distributed
+from .watch import GradientWatcher
 
 logger = logging.getLogger(__name__)
 
@@ -98,11 +117,73 @@ class AllennlpWandbCallback(WandBCallback):
     """
     This callback should only be used with `train_with_wandb` command.
 
+    With `aggregate_across_ranks`, the batch metrics logged in distributed
+    training are averaged over all the workers instead of being the ones of
+    the primary worker, and the total `instances_per_second` and the
+    `seconds_per_batch` (mean and max over the workers) are logged with them.
+    `aggregated_metrics` selects the batch metrics to average (default: all).
+
+    If `watch_modules` (a regex over the module names) or `watch_interval` is
+    given, `watch_model` uses :class:`GradientWatcher` instead of
+    `wandb.watch`. It only hooks the matching modules, only on every
+    `watch_interval`-th step, and logs the norm, max and non-finite count of
+    the gradients instead of histograms.
+
+    With `adaptive_logging`, the `summary_interval`, `distribution_interval`
+    and `batch_size_interval` are only the initial values. The time spent on
+    each of them is measured and the intervals are adjusted so that logging
+    takes at most `max_logging_overhead` of the training time, while every
+    category is still logged at least `min_log_points_per_epoch` times per
+    epoch.
+
+    With `downsample_history`, the batch scalars are not uploaded every
+    `summary_interval` but aggregated into min/mean/max buckets (see
+    :class:`DownsampledHistory`), while the epoch metrics are uploaded as
+    usual. The full series is kept in the serialization directory.
+
+    Unless `log_scalars_to_file` is false, every logged scalar is also
+    written to a compact binary log in the serialization directory (see
+    :class:`ScalarLogWriter` and :func:`read_scalar_log`).
+
+    With `live_sync`, the `files_to_save` are not uploaded with wandb's
+    `live` policy, which uploads the whole file on every change, but by
+    :class:`LiveFileSync`, which uploads only the appended bytes at most every
+    `live_sync_interval` seconds and within `live_sync_max_bytes_per_second`.
+
+    Unless `index_run` is false, the serialization directory, sweep, group,
+    status, config and final metrics of the run and the hashes of its
+    checkpoints are recorded in the :class:`RunIndex`, which
+    `train-with-wandb --resume` and `wandb-index` use to find runs.
+
+    With `save_mmap_archive`, the model is also archived as an uncompressed
+    directory (`model.mmap`) that :func:`load_mmap_archive` loads without
+    extracting it.
+
+    With `share_identical_files`, the `shared_files` (globs relative to the
+    serialization directory, by default the vocabulary and the
+    `include_in_archive` files) are moved to the :class:`ContentStore` at the
+    end of the run, so that the files that are identical across the trials
+    of a sweep are stored only once.
+
+    The config is flattened and logged once, when wandb is initialized. Only
+    the keys matching `config_include_keys`, if given, and not matching
+    `config_exclude_keys` are logged (glob patterns like `model.*`, see
+    :func:`filter_config`). `--wandb-config-include-keys` and
+    `--wandb-config-exclude-keys` take precedence. Lists longer than
+    `max_config_list_length`, e.g. label vocabularies, are logged as their
+    length and hash.
+
     Note:
         If used with `allennlp train` command, this might have unexpected
         behaviour because we read some arguments from environment variables.
     """
 
+    _INTERVAL_ATTRIBUTES = {
+        "summary": "_summary_interval",
+        "distribution": "_distribution_interval",
+        "batch_size": "_batch_size_interval",
+    }
+
     def __init__(
         self,
         serialization_dir: str,
@@ -122,9 +203,30 @@ class AllennlpWandbCallback(WandBCallback):
         files_to_save_at_end: Optional[List[str]] = None,
         include_in_archive: List[str] = None,
         save_model_archive: bool = True,
+        save_mmap_archive: bool = False,
         wandb_kwargs: Optional[Dict[str, Any]] = None,
         finish_on_end: bool = False,
         sub_callbacks: Optional[List[AllennlpWandbSubCallback]] = None,
+        aggregate_across_ranks: bool = False,
+        aggregated_metrics: Optional[List[str]] = None,
+        watch_modules: Optional[str] = None,
+        watch_interval: Optional[int] = None,
+        adaptive_logging: bool = False,
+        max_logging_overhead: float = 0.05,
+        min_log_points_per_epoch: int = 10,
+        downsample_history: bool = False,
+        history_bucket_size: int = 10,
+        history_points_per_resolution: int = 1000,
+        log_scalars_to_file: bool = True,
+        live_sync: bool = False,
+        live_sync_interval: float = 30.0,
+        live_sync_max_bytes_per_second: Optional[float] = None,
+        index_run: bool = True,
+        share_identical_files: bool = False,
+        shared_files: Optional[List[str]] = None,
+        config_include_keys: Optional[List[str]] = None,
+        config_exclude_keys: Optional[List[str]] = None,
+        max_config_list_length: Optional[int] = None,
     ) -> None:
         logger.debug("Wandb related varaibles")
         logger.debug(
@@ -157,6 +259,12 @@ class AllennlpWandbCallback(WandBCallback):
             tags = t.split(",")
         else:
             tags = t
+        self.use_gradient_watcher = watch_model and (
+            watch_modules is not None or watch_interval is not None
+        )
+        self.watch_modules = watch_modules
+        self.watch_interval = watch_interval or summary_interval
+        self.gradient_watcher: Optional[GradientWatcher] = None
         super().__init__(
             serialization_dir,
             summary_interval=summary_interval,
@@ -171,8 +279,8 @@ class AllennlpWandbCallback(WandBCallback):
             name=read_from_env("WANDB_NAME") or name,
             notes=read_from_env("WANDB_NOTES") or notes,
             tags=tags,
-            watch_model=watch_model,
-            files_to_save=tuple(files_to_save),
+            watch_model=watch_model and not self.use_gradient_watcher,
+            files_to_save=() if live_sync else tuple(files_to_save),
             wandb_kwargs=wandb_kwargs,
         )
         self.finish_on_end = finish_on_end
@@ -180,10 +288,61 @@ class AllennlpWandbCallback(WandBCallback):
         self.include_in_archive = include_in_archive
         verify_include_in_archive(include_in_archive)
         self.save_model_archive = save_model_archive
+        self.save_mmap_archive = save_mmap_archive
         self.priority = 100
         self.sub_callbacks = sorted(
             sub_callbacks or [], key=lambda x: x.priority, reverse=True
         )
+        self.rank_aggregator = (
+            RankAggregator(aggregated_metrics)
+            if aggregate_across_ranks
+            else None
+        )
+
+        self.adaptive_intervals: Optional[AdaptiveIntervals] = None
+        self._last_batch_end: Optional[float] = None
+
+        if adaptive_logging:
+            if aggregate_across_ranks:
+                # the workers have to agree on the batches to aggregate
+                raise ValueError(
+                    "adaptive_logging cannot be used with aggregate_across_ranks"
+                )
+            self.adaptive_intervals = AdaptiveIntervals(
+                {
+                    category: getattr(self, attribute)
+                    for category, attribute in self._INTERVAL_ATTRIBUTES.items()
+                    if getattr(self, attribute)
+                },
+                max_overhead=max_logging_overhead,
+                min_points_per_epoch=min_log_points_per_epoch,
+            )
+
+        self.downsampled_history = (
+            DownsampledHistory(
+                history_bucket_size, history_points_per_resolution
+            )
+            if downsample_history
+            else None
+        )
+        self.log_scalars_to_file = log_scalars_to_file
+        self.live_sync = live_sync
+        self.live_files_to_save = list(files_to_save)
+        self.live_sync_interval = live_sync_interval
+        self.live_sync_max_bytes_per_second = live_sync_max_bytes_per_second
+        self.live_file_sync: Optional[LiveFileSync] = None
+        self.index_run = index_run
+        self.run_index: Optional[RunIndex] = None
+        self._index_executor: Optional[ThreadPoolExecutor] = None
+        self._checkpoints_to_index = False
+        self.scalar_log: Optional[ScalarLogWriter] = None
+        self._logging_batch = False
+        self.share_identical_files = share_identical_files
+        self.shared_files = (
+            shared_files
+            if shared_files is not None
+            else ["vocabulary/*"] + list(include_in_archive or [])
+        )
 
         if save_model_archive:
             self._files_to_save_at_end.append("model.tar.gz")
@@ -193,8 +352,14 @@ class AllennlpWandbCallback(WandBCallback):
             self._wandb_kwargs["dir"] = None
 
         if "config" in self._wandb_kwargs:
-            self._wandb_kwargs["config"] = flatten_dict(
-                self._wandb_kwargs["config"]
+            # the env vars are set by --wandb-config-include/exclude-keys
+            self._wandb_kwargs["config"] = filter_config(
+                self._wandb_kwargs["config"],
+                include_keys=read_from_env("WANDB_CONFIG_INCLUDE_KEYS")
+                or config_include_keys,
+                exclude_keys=read_from_env("WANDB_CONFIG_EXCLUDE_KEYS")
+                or config_exclude_keys,
+                max_list_length=max_config_list_length,
             )
 
     def on_start(
@@ -205,6 +370,62 @@ class AllennlpWandbCallback(WandBCallback):
     ) -> None:
         super().on_start(trainer, is_primary=is_primary, **kwargs)
 
+        if self.rank_aggregator is not None:
+            self.rank_aggregator.reset()
+
+        if self.adaptive_intervals is not None:
+            try:
+                self.adaptive_intervals.set_steps_per_epoch(
+                    math.ceil(
+                        len(trainer.data_loader)
+                        / trainer._num_gradient_accumulation_steps
+                    )
+                )
+            except TypeError:  # the data loader has no length
+                self.adaptive_intervals.set_steps_per_epoch(None)
+
+        if (
+            self.log_scalars_to_file or self.downsampled_history is not None
+        ) and is_primary:
+            self.scalar_log = ScalarLogWriter(self.serialization_dir)
+
+        if self.live_sync and is_primary:
+            self.live_file_sync = LiveFileSync(
+                self.serialization_dir,
+                self.live_files_to_save,
+                os.path.join(self.wandb.run.dir, "live"),  # type: ignore
+                min_interval=self.live_sync_interval,
+                max_bytes_per_second=self.live_sync_max_bytes_per_second,
+            )
+            self.live_file_sync.start()
+
+        if self.index_run and is_primary:
+            try:
+                run = self.wandb.run  # type: ignore
+                self.run_index = RunIndex()
+                self.run_index.add_run(
+                    str(run.id),
+                    self.serialization_dir,
+                    sweep_id=run.sweep_id,
+                    group=run.group or None,
+                    status="running",
+                    config=get_config_from_serialization_dir(
+                        self.serialization_dir
+                    ),
+                )
+                # hashing large checkpoints should not block training
+                self._index_executor = ThreadPoolExecutor(max_workers=1)
+            except Exception as e:
+                logger.warning(f"Could not add the run to the run index: {e}")
+                self.run_index = None
+
+        if self.use_gradient_watcher and is_primary:
+            self.gradient_watcher = GradientWatcher(
+                trainer.model,
+                modules=self.watch_modules,
+                interval=self.watch_interval,
+            )
+
         for subcallback in self.sub_callbacks:
             subcallback.on_start_(self, trainer, is_primary=is_primary)
 
@@ -224,18 +445,67 @@ class AllennlpWandbCallback(WandBCallback):
         """
         This callback hook is called after the end of each batch.
         """
-        super().on_batch(
-            trainer,
-            batch_inputs,
-            batch_outputs,
-            batch_metrics,
-            epoch,
-            batch_number,
-            is_training,
-            is_primary=is_primary,
-            batch_grad_norm=batch_grad_norm,
+
+        if self._checkpoints_to_index:
+            assert self._index_executor is not None
+            self._checkpoints_to_index = False
+            self._index_executor.submit(self._index_checkpoints)
+
+        if (
+            self.rank_aggregator is not None
+            and is_training
+            and is_distributed()
+        ):
+            # every worker has to take part in the collective
+            self.rank_aggregator.count(
+                sum(get_batch_size(batch) for batch in batch_inputs)
+            )
+
+            if trainer._total_batches_completed % self._summary_interval == 0:
+                batch_metrics = {
+                    **batch_metrics,
+                    **self.rank_aggregator.aggregate(batch_metrics),
+                }
+        adapt = (
+            self.adaptive_intervals is not None and is_training and is_primary
         )
 
+        if adapt:
+            start = time.perf_counter()
+
+            if self._last_batch_end is not None:
+                self.adaptive_intervals.record_step(  # type: ignore
+                    start - self._last_batch_end
+                )
+            due = self._due_logging(trainer, batch_number)
+        self._logging_batch = True
+        try:
+            super().on_batch(
+                trainer,
+                batch_inputs,
+                batch_outputs,
+                batch_metrics,
+                epoch,
+                batch_number,
+                is_training,
+                is_primary=is_primary,
+                batch_grad_norm=batch_grad_norm,
+            )
+        finally:
+            self._logging_batch = False
+
+        if adapt:
+            self.adaptive_intervals.record_logging(  # type: ignore
+                due, time.perf_counter() - start
+            )
+            self._apply_intervals(trainer, batch_number)
+
+        if self.gradient_watcher is not None and is_training:
+            watched = self.gradient_watcher.step()
+
+            if watched:
+                self.log_scalars(watched, epoch=epoch)
+
         for sub_callback in self.sub_callbacks:
             sub_callback.on_batch_(
                 self,
@@ -250,6 +520,56 @@ class AllennlpWandbCallback(WandBCallback):
                 batch_grad_norm=batch_grad_norm,
             )
 
+        if adapt:
+            self._last_batch_end = time.perf_counter()
+
+    def _due_logging(
+        self, trainer: "GradientDescentTrainer", batch_number: int
+    ) -> List[str]:
+        completed = trainer._total_batches_completed
+        due = []
+
+        if completed % self._summary_interval == 0:
+            due.append("summary")
+
+        if (
+            self._distribution_interval
+            and completed % self._distribution_interval == 0
+        ):
+            due.append("distribution")
+
+        # like LogWriterCallback.log_batch(), which counts in the epoch
+        if (
+            self._batch_size_interval
+            and batch_number % self._batch_size_interval == 0
+        ):
+            due.append("batch_size")
+
+        return due
+
+    def _apply_intervals(
+        self, trainer: "GradientDescentTrainer", batch_number: int
+    ) -> None:
+        assert self.adaptive_intervals is not None
+
+        for category, interval in self.adaptive_intervals.intervals.items():
+            attribute = self._INTERVAL_ATTRIBUTES[category]
+            current = getattr(self, attribute)
+            next_batch = (
+                batch_number + 1
+                if category == "batch_size"
+                else trainer._total_batches_completed + 1
+            )
+            # Only switch when neither interval is due on the next batch,
+            # so that the hooks set up for the next batch stay consistent.
+
+            if (
+                interval != current
+                and next_batch % current != 0
+                and next_batch % interval != 0
+            ):
+                setattr(self, attribute, interval)
+
     def on_epoch(
         self,
         trainer: "GradientDescentTrainer",
@@ -258,9 +578,24 @@ class AllennlpWandbCallback(WandBCallback):
         is_primary: bool = True,
         **kwargs: Any,
     ) -> None:
+        if self.downsampled_history is not None and is_primary:
+            # buckets do not span epochs
+            remaining = self.downsampled_history.flush()
+
+            if remaining:
+                super().log_scalars(remaining, epoch=epoch)
+
+        if self.scalar_log is not None:
+            self.scalar_log.flush()
         super().on_epoch(
             trainer, metrics, epoch, is_primary=is_primary, **kwargs
         )
+        # the validation is not a training step
+        self._last_batch_end = None
+
+        # the trainer saves the checkpoint after on_epoch, so it is indexed
+        # at the next batch or in close()
+        self._checkpoints_to_index = self._index_executor is not None
 
         for sub_callback in self.sub_callbacks:
             sub_callback.on_epoch_(
@@ -275,6 +610,20 @@ class AllennlpWandbCallback(WandBCallback):
         is_primary: bool = True,
         **kwargs: Any,
     ) -> None:
+        if self.run_index is not None:
+            # the trainer calls on_end() in a finally block. Update the
+            # index first, so that the sub-callbacks see the final metrics.
+            status = "failed" if sys.exc_info()[0] is not None else "finished"
+
+            try:
+                self.run_index.finish_run(
+                    str(self.wandb.run.id),  # type: ignore
+                    status,
+                    metrics=flatten_dict(metrics) if metrics else None,
+                )
+            except Exception as e:
+                logger.warning(f"Could not update the run index: {e}")
+
         for sub_callback in self.sub_callbacks:
             sub_callback.on_end_(
                 self,
@@ -287,6 +636,67 @@ class AllennlpWandbCallback(WandBCallback):
             trainer, metrics=metrics, epoch=epoch, is_primary=is_primary
         )
 
+    def _index_checkpoints(self) -> None:
+        assert self.run_index is not None
+
+        try:
+            self.run_index.record_files(
+                str(self.wandb.run.id),  # type: ignore
+                self.serialization_dir,
+                checkpoint_files(self.serialization_dir),
+            )
+        except Exception as e:
+            logger.warning(f"Could not record the checkpoints in the index: {e}")
+
+    @overrides
+    def log_scalars(
+        self,
+        scalars: Dict[str, Union[int, float]],
+        log_prefix: str = "",
+        epoch: Optional[int] = None,
+    ) -> None:
+        prefixed = {
+            (f"{log_prefix}/{k}" if log_prefix else k): v
+            for k, v in scalars.items()
+        }
+
+        if self.scalar_log is not None:
+            self.scalar_log.write(
+                self.trainer._total_batches_completed,
+                {
+                    k: v
+                    for k, v in prefixed.items()
+                    if isinstance(v, (int, float))
+                },
+            )
+
+        if self.downsampled_history is None or not self._logging_batch:
+            super().log_scalars(scalars, log_prefix=log_prefix, epoch=epoch)
+
+            return
+        complete = self.downsampled_history.add(prefixed)
+
+        if complete:
+            super().log_scalars(complete, epoch=epoch)
+
+    def _write_mmap_archive(self) -> None:
+        # e.g., training failed in the first epoch. close() must go on, so
+        # that the original error is not hidden and wandb is finished.
+        if not os.path.isfile(os.path.join(self.serialization_dir, "best.th")):
+            logger.warning(
+                "Not writing the memory-mapped archive without best.th."
+            )
+
+            return
+        logger.info("Writing the memory-mapped archive.")
+        try:
+            write_mmap_archive(
+                self.serialization_dir,
+                include_in_archive=self.include_in_archive,
+            )
+        except Exception as e:
+            logger.warning(f"Could not write the memory-mapped archive: {e}")
+
     @overrides
     def close(self) -> None:
         import wandb
@@ -306,6 +716,20 @@ class AllennlpWandbCallback(WandBCallback):
                 include_in_archive=self.include_in_archive,
             )
 
+        if self.save_mmap_archive:
+            self._write_mmap_archive()
+
+        if self.share_identical_files:
+            try:
+                saved = ContentStore().share_files(
+                    self.serialization_dir, self.shared_files
+                )
+                logger.info(
+                    f"{saved / 2**20:.1f} MiB are shared with other runs"
+                )
+            except Exception as e:
+                logger.warning(f"Could not use the content store: {e}")
+
         if self._files_to_save_at_end:
             for fpath in self._files_to_save_at_end:
                 self.wandb.save(  # type: ignore
@@ -314,6 +738,20 @@ class AllennlpWandbCallback(WandBCallback):
                     policy="end",
                 )
 
+        if self.scalar_log is not None:
+            self.scalar_log.close()
+            self.scalar_log = None
+
+        if self.live_file_sync is not None:
+            self.live_file_sync.stop()
+            self.live_file_sync = None
+
+        if self._index_executor is not None:
+            self._checkpoints_to_index = False
+            self._index_executor.submit(self._index_checkpoints)
+            self._index_executor.shutdown(wait=True)
+            self._index_executor = None
+
         LogWriterCallback.close(self)
 
         if self.finish_on_end:
@@ -0,0 +1,140 @@
+"""Windows of training steps profiled with torch.profiler."""
+from typing import List, Tuple, Union, Dict, Any, Optional
+import logging
+import os
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def profiler_activities(
+    names: Optional[List[str]] = None,
+) -> List["torch.profiler.ProfilerActivity"]:
+    """
+    The activities of torch.profiler with the given names, `cpu` and `cuda`.
+    By default, the CPU and, if it is available, CUDA.
+    """
+    from torch.profiler import ProfilerActivity
+
+    if names is None:
+        names = ["cpu", "cuda"] if torch.cuda.is_available() else ["cpu"]
+    activities = []
+
+    for name in names:
+        activity = getattr(ProfilerActivity, name.upper(), None)
+
+        if activity is None:
+            raise ValueError(f"Unknown profiler activity '{name}'")
+        activities.append(activity)
+
+    return activities
+
+
+class ProfilerWindow:
+    """
+    A torch.profiler session over `(wait + warmup + active) * repeat`
+    steps. The profiler only exists while the window is open, so steps
+    outside of it are not slowed down at all.
+
+    After each `active` steps, a Chrome trace (`{name}_{step}.pt.trace.json`,
+    which https://ui.perfetto.dev or chrome://tracing open) and a table of
+    the operators sorted by `sort_by` (`{name}_{step}.txt`) are written to
+    `output_dir`. A window closed during its active steps writes them for
+    the steps recorded so far.
+
+    Args:
+        output_dir: The directory of the traces and tables.
+        name: Prefix of the file names.
+        wait: Number of steps to skip first.
+        warmup: Number of steps during which the profiler runs, but the
+            results are thrown away, as they include its start-up costs.
+        active: Number of steps that are recorded.
+        repeat: Number of times to go through the wait, warmup and active
+            steps.
+        activities: Names of the activities to profile. See
+            :func:`profiler_activities`.
+        sort_by: Sort key of the table. Default: the self time on the
+            device with CUDA, and on the CPU otherwise.
+        row_limit: Number of operators in the table.
+        **profiler_kwargs: Passed to `torch.profiler.profile`, for instance
+            `record_shapes`, `profile_memory` or `with_stack`.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        name: str,
+        wait: int = 1,
+        warmup: int = 1,
+        active: int = 3,
+        repeat: int = 1,
+        activities: Optional[List[str]] = None,
+        sort_by: Optional[str] = None,
+        row_limit: int = 50,
+        **profiler_kwargs: Any,
+    ) -> None:
+        import torch.profiler
+
+        self.output_dir = output_dir
+        self.name = name
+        self.num_steps = (wait + warmup + active) * repeat
+        activities_ = profiler_activities(activities)
+
+        if sort_by is None:
+            sort_by = (
+                "self_cuda_time_total"
+                if torch.profiler.ProfilerActivity.CUDA in activities_
+                else "self_cpu_time_total"
+            )
+        self.sort_by = sort_by
+        self.row_limit = row_limit
+        #: The files written, relative to `output_dir`
+        self.files: List[str] = []
+        self.steps_done = 0
+        profiler = torch.profiler.profile(
+            activities=activities_,
+            schedule=torch.profiler.schedule(
+                wait=wait, warmup=warmup, active=active, repeat=repeat
+            ),
+            on_trace_ready=self._write,
+            **profiler_kwargs,
+        )
+        profiler.start()
+        self.profiler: Optional[torch.profiler.profile] = profiler
+
+    def _write(self, profiler: "torch.profiler.profile") -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = f"{self.name}_{profiler.step_num}"
+        trace = f"{prefix}.pt.trace.json"
+        table = f"{prefix}.txt"
+        profiler.export_chrome_trace(os.path.join(self.output_dir, trace))
+
+        with open(os.path.join(self.output_dir, table), "w") as f:
+            f.write(
+                profiler.key_averages().table(
+                    sort_by=self.sort_by, row_limit=self.row_limit
+                )
+            )
+        self.files.extend([trace, table])
+        logger.info(f"Wrote the profile {prefix} to {self.output_dir}")
+
+    def step(self) -> bool:
+        """
+        Marks the end of a step. Returns `False` once the window is over
+        and closed.
+        """
+        assert self.profiler is not None
+        self.profiler.step()
+        self.steps_done += 1
+
+        if self.steps_done >= self.num_steps:
+            self.close()
+
+            return False
+
+        return True
+
+    def close(self) -> None:
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
@@ -0,0 +1,117 @@
+"""Compact append-only log of scalars in the serialization directory.
+
+Every record has a fixed width: the step (uint64), the id of the metric
+(uint32) and the value (float32). The names of the metrics are appended, one
+per line, to a separate file, so the id of a metric is the line number of its
+name. :func:`read_scalar_log` memory-maps the log into NumPy arrays.
+"""
+from typing import List, Tuple, Union, Dict, Any, Optional, IO
+import logging
+import os
+import struct
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SCALAR_LOG_NAME = "scalars.bin"
+SCALAR_NAMES_NAME = "scalars.names"
+RECORD = struct.Struct("<QIf")
+RECORD_DTYPE = np.dtype([("step", "<u8"), ("metric", "<u4"), ("value", "<f4")])
+
+
+class ScalarLogWriter:
+    """
+    Appends scalars to `SCALAR_LOG_NAME` and their names to
+    `SCALAR_NAMES_NAME` in `directory`.
+
+    An existing log, e.g., when training is recovered, is continued.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        names_path = os.path.join(directory, SCALAR_NAMES_NAME)
+        self.ids: Dict[str, int] = {}
+
+        if os.path.isfile(names_path):
+            with open(names_path) as f:
+                for line in f:
+                    self.ids[line.rstrip("\n")] = len(self.ids)
+        self._names: IO[str] = open(names_path, "a")
+        self._records: IO[bytes] = open(
+            os.path.join(directory, SCALAR_LOG_NAME), "ab"
+        )
+
+    def _id(self, name: str) -> int:
+        if name not in self.ids:
+            self.ids[name] = len(self.ids)
+            self._names.write(name + "\n")
+
+        return self.ids[name]
+
+    def write(self, step: int, scalars: Dict[str, float]) -> None:
+        self._records.write(
+            b"".join(
+                RECORD.pack(step, self._id(name), value)
+                for name, value in scalars.items()
+            )
+        )
+
+    def flush(self) -> None:
+        # names first, so a record never refers to a missing name
+        self._names.flush()
+        self._records.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self._names.close()
+        self._records.close()
+
+
+def read_scalar_log(
+    directory: str, names: Optional[List[str]] = None
+) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Reads the log written by :class:`ScalarLogWriter`.
+
+    Args:
+        directory: The serialization directory.
+        names: The metrics to read. Default: all.
+
+    Returns:
+        The steps and the values of every metric, in the order they were
+        logged.
+    """
+    with open(os.path.join(directory, SCALAR_NAMES_NAME)) as f:
+        all_names = [line.rstrip("\n") for line in f]
+    path = os.path.join(directory, SCALAR_LOG_NAME)
+    # ignore a partially written last record
+    num_records = os.path.getsize(path) // RECORD_DTYPE.itemsize
+
+    if num_records == 0:
+        records = np.zeros(0, dtype=RECORD_DTYPE)
+    else:
+        records = np.memmap(
+            path, dtype=RECORD_DTYPE, mode="r", shape=(num_records,)
+        )
+    wanted = set(all_names if names is None else names)
+    metric_ids = records["metric"]
+
+    if len(all_names) <= np.iinfo(np.uint16).max:
+        # numpy uses a linear time radix sort for 16 bit integers
+        metric_ids = metric_ids.astype(np.uint16)
+    # group the records by metric, keeping the order within each metric
+    order = np.argsort(metric_ids, kind="stable")
+    bounds = np.cumsum(np.bincount(metric_ids, minlength=len(all_names)))
+    steps, values = records["step"][order], records["value"][order]
+    result: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+    start = 0
+
+    for metric_id, name in enumerate(all_names):
+        end = int(bounds[metric_id])
+
+        if name in wanted:
+            result[name] = (steps[start:end], values[start:end])
+        start = end
+
+    return result
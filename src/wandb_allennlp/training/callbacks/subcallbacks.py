@@ -1,10 +1,32 @@
-from typing import List, Tuple, Union, Dict, Any, Optional
+from typing import List, Tuple, Union, Dict, Any, Optional, Iterator
+import logging
+import math
+import os
+import time
+import torch
+import torch.distributed as dist
 
+from wandb_allennlp.config import ALLENNLP_SERIALIZATION_DIR
+from wandb_allennlp.sweep.asha import ASHACoordinator, geometric_rungs
 from wandb_allennlp.training.callbacks.log_to_wandb import (
     AllennlpWandbSubCallback,
     AllennlpWandbCallback,
     GradientDescentTrainer,
 )
+from wandb_allennlp.training.callbacks.distributed import summarize_ranks
+from wandb_allennlp.training.callbacks.checkpoint_upload import (
+    CheckpointUploader,
+)
+from wandb_allennlp.training.callbacks.best_weights import HostWeightsSnapshot
+from wandb_allennlp.training.callbacks.health import (
+    SeriesStats,
+    gradient_norm,
+)
+from wandb_allennlp.training.callbacks.profiling import ProfilerWindow
+from wandb_allennlp.retention import RetentionPolicy, apply_retention
+from wandb_allennlp.utils import read_from_env
+
+logger = logging.getLogger(__name__)
 
 
 @AllennlpWandbSubCallback.register("log_best_validation_metrics")
@@ -39,3 +61,945 @@ class LogBestValidationMetrics(AllennlpWandbSubCallback):
             log_prefix="validation",
             epoch=epoch,
         )
+
+
+@AllennlpWandbSubCallback.register("asha_early_stopping")
+class ASHAEarlyStopping(AllennlpWandbSubCallback):
+    """
+    Stops bad trials of a sweep early using asynchronous successive halving.
+
+    At every rung epoch the tracked validation metric (the one used by
+    `LogBestValidationMetrics`) is reported to a SQLite file shared by the
+    trials of the sweep. If the trial is not in the top `1/reduction_factor`
+    of the trials that reached the rung, the training stops after this epoch
+    just like when the trainer runs out of patience, i.e., the model is
+    archived and evaluated as usual. A rung epoch without the validation
+    metric, e.g., because it is not validated, is not reported and the
+    trial continues.
+
+    Args:
+        priority: Priority of the sub-callback.
+        store: Path of the SQLite file. Defaults to
+            `ALLENNLP_SERIALIZATION_DIR/sweeps/asha-<WANDB_SWEEP_ID>.sqlite`.
+        rungs: Epochs (counted from 1) at which to report. Defaults to
+            `min_epochs * reduction_factor**k` below `num_epochs`.
+        min_epochs: Epochs before the first rung.
+        reduction_factor: See :class:`ASHACoordinator`.
+        min_trials_per_rung: See :class:`ASHACoordinator`.
+    """
+
+    def __init__(
+        self,
+        priority: int = 0,
+        store: Optional[str] = None,
+        rungs: Optional[List[int]] = None,
+        min_epochs: int = 1,
+        reduction_factor: int = 3,
+        min_trials_per_rung: Optional[int] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(priority, **kwargs)
+        self.store = store or os.path.join(
+            ALLENNLP_SERIALIZATION_DIR,
+            "sweeps",
+            f"asha-{read_from_env('WANDB_SWEEP_ID') or 'local'}.sqlite",
+        )
+        self.rungs = rungs
+        self.min_epochs = min_epochs
+        self.reduction_factor = reduction_factor
+        self.min_trials_per_rung = min_trials_per_rung
+        self.coordinator: Optional[ASHACoordinator] = None
+
+    def on_start_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        is_primary: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        super().on_start_(
+            super_callback, trainer, is_primary=is_primary, **kwargs
+        )
+
+        if self.rungs is None:
+            self.rungs = geometric_rungs(
+                self.min_epochs, trainer._num_epochs, self.reduction_factor
+            )
+
+        if is_primary:
+            self.coordinator = ASHACoordinator(
+                self.store,
+                reduction_factor=self.reduction_factor,
+                min_trials_per_rung=self.min_trials_per_rung,
+            )
+
+    def on_epoch_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        metrics: Dict[str, Any],
+        epoch: int,
+        is_primary: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        rung = epoch + 1
+
+        if self.rungs is None or rung not in self.rungs:
+            return
+        should_continue = True
+
+        if is_primary:
+            assert self.coordinator is not None
+            names = [
+                f"validation_{name}"
+                for _, name in trainer._metric_tracker.tracked_metrics
+            ]
+            missing = [name for name in names if name not in metrics]
+
+            if missing:
+                # e.g., no validation in this epoch
+                logger.warning(
+                    f"ASHA: not reporting rung {rung} without {missing}."
+                )
+            else:
+                # same as MetricTracker.combined_score(), higher is better
+                value = sum(
+                    sign * metrics[name]
+                    for (sign, _), name in zip(
+                        trainer._metric_tracker.tracked_metrics, names
+                    )
+                )
+                should_continue = self.coordinator.report(
+                    str(super_callback.wandb.run.id), rung, value
+                )
+
+        if dist.is_available() and dist.is_initialized():
+            decision = torch.tensor(
+                [float(should_continue)],
+                device=next(trainer.model.parameters()).device,
+            )
+            dist.broadcast(decision, src=0)
+            should_continue = bool(decision.item())
+
+        if not should_continue:
+            logger.info(f"ASHA: stopping the trial at rung {rung}.")
+            # the trainer checks for early stopping right after the callbacks
+            trainer._metric_tracker._patience = 0
+
+            if is_primary:
+                super_callback.log_scalars(
+                    {"asha_stopped_at_epoch": epoch}, epoch=epoch
+                )
+
+
+class _TimedDataLoader:
+    """Measures the time spent waiting for each batch of a data loader."""
+
+    def __init__(self, data_loader: Any, detector: "StragglerDetection"):
+        self._data_loader = data_loader
+        self._detector = detector
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._data_loader, name)
+
+    def __len__(self) -> int:
+        return len(self._data_loader)
+
+    def __iter__(self) -> Iterator[Any]:
+        iterator = iter(self._data_loader)
+
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            self._detector.fetched(start, time.perf_counter())
+            yield batch
+
+
+@AllennlpWandbSubCallback.register("straggler_detection")
+class StragglerDetection(AllennlpWandbSubCallback):
+    """
+    Finds the workers that slow down distributed training.
+
+    Every worker measures its time per training step and the part of it
+    spent waiting for the data loader. Every `interval` steps these are
+    gathered from all the workers with a single collective (no collective
+    on the other steps) and the max, min, mean, skew (max over mean) and the
+    slowest rank are logged under `straggler/`.
+
+    Args:
+        priority: Priority of the sub-callback.
+        interval: Number of steps between two gathers.
+        time_data_loading: Whether to wrap the data loader of the trainer to
+            measure the data loading time.
+        warning_skew: Log a warning if the skew of the step time is above
+            this.
+    """
+
+    def __init__(
+        self,
+        priority: int = 0,
+        interval: int = 100,
+        time_data_loading: bool = True,
+        warning_skew: float = 1.2,
+        **kwargs: Any,
+    ):
+        super().__init__(priority, **kwargs)
+        self.interval = interval
+        self.time_data_loading = time_data_loading
+        self.warning_skew = warning_skew
+        self._step_start: Optional[float] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._step_time = 0.0
+        self._data_time = 0.0
+        self._num_steps = 0
+
+    def fetched(self, start: float, end: float) -> None:
+        """Called by the data loader wrapper after every batch."""
+
+        if self._step_start is None:
+            self._step_start = start
+        self._data_time += end - start
+
+    def on_start_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        is_primary: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        super().on_start_(
+            super_callback, trainer, is_primary=is_primary, **kwargs
+        )
+
+        if self.time_data_loading:
+            trainer.data_loader = _TimedDataLoader(trainer.data_loader, self)
+
+    def on_batch_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        batch_inputs: List[Any],
+        batch_outputs: List[Dict[str, Any]],
+        batch_metrics: Dict[str, Any],
+        epoch: int,
+        batch_number: int,
+        is_training: bool,
+        is_primary: bool = True,
+        batch_grad_norm: Optional[float] = None,
+        **kwargs: Any,
+    ) -> None:
+        if not is_training:
+            return
+        now = time.perf_counter()
+
+        if self._step_start is not None:
+            self._step_time += now - self._step_start
+            self._num_steps += 1
+        # without the data loader wrapper, the next step starts now
+        self._step_start = None if self.time_data_loading else now
+
+        if trainer._total_batches_completed % self.interval != 0:
+            return
+        num_steps = max(self._num_steps, 1)
+        summary = summarize_ranks(
+            {
+                "step_time": self._step_time / num_steps,
+                "data_time": self._data_time / num_steps,
+            }
+        )
+        self._reset()
+
+        if is_primary:
+            if summary["step_time_skew"] > self.warning_skew:
+                logger.warning(
+                    f"Rank {int(summary['step_time_slowest_rank'])} is the "
+                    f"slowest: {summary['step_time_max']:.3f}s per step, "
+                    f"mean {summary['step_time_mean']:.3f}s."
+                )
+            super_callback.log_scalars(
+                summary, log_prefix="straggler", epoch=epoch
+            )
+
+
+@AllennlpWandbSubCallback.register("upload_checkpoints")
+class UploadCheckpoints(AllennlpWandbSubCallback):
+    """
+    Uploads the checkpoints to wandb after every epoch instead of only the
+    model archive at the end, so that a preempted run loses less work.
+
+    The checkpoint files that changed during the epoch are snapshotted and
+    uploaded as a new version of the artifact `checkpoints-<run id>` on a
+    background thread (see :class:`CheckpointUploader`). The trainer only
+    writes the checkpoint and `best.th` of an epoch after `on_epoch`, so
+    the snapshot is taken at the first batch of the next epoch, or at the
+    end of training. The versions get
+    the aliases `latest`, `epoch-<epoch>` and, if `best.th` changed, `best`.
+    Only the `keep_last` most recent versions and the best one are kept.
+
+    Args:
+        priority: Priority of the sub-callback.
+        max_in_flight: Number of snapshots that are uploaded at the same time.
+        keep_last: Number of recent versions to keep besides the best one.
+            Use `null` to keep all.
+        patterns: Globs of the checkpoint files in the serialization directory.
+    """
+
+    def __init__(
+        self,
+        priority: int = 0,
+        max_in_flight: int = 1,
+        keep_last: Optional[int] = 1,
+        patterns: Optional[List[str]] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(priority, **kwargs)
+        self.max_in_flight = max_in_flight
+        self.keep_last = keep_last
+        self.patterns = patterns
+        self.uploader: Optional[CheckpointUploader] = None
+        self._pending_epoch: Optional[int] = None
+
+    def on_start_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        is_primary: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        super().on_start_(
+            super_callback, trainer, is_primary=is_primary, **kwargs
+        )
+
+        if not is_primary:
+            return
+        self.run = super_callback.wandb.run
+        self.uploader = CheckpointUploader(
+            super_callback.serialization_dir,
+            os.path.join(super_callback.serialization_dir, ".checkpoint_uploads"),
+            upload=self._upload,
+            delete=self._delete if self.keep_last is not None else None,
+            patterns=self.patterns,
+            max_in_flight=self.max_in_flight,
+            keep_last=self.keep_last or 0,
+        )
+
+    def _upload(self, snapshot_dir: str, epoch: int, aliases: List[str]) -> Any:
+        import wandb
+
+        artifact = wandb.Artifact(
+            f"checkpoints-{self.run.id}",
+            type="checkpoint",
+            metadata={"epoch": epoch},
+        )
+        artifact.add_dir(snapshot_dir)
+        logged = self.run.log_artifact(artifact, aliases=aliases)
+        # the snapshot is deleted once this returns
+        logged.wait()
+
+        return logged
+
+    def _delete(self, artifact: Any) -> None:
+        artifact.delete(delete_aliases=True)
+
+    def _submit_pending(self) -> None:
+        assert self.uploader is not None
+
+        if self._pending_epoch is not None:
+            self.uploader.submit(self._pending_epoch)
+            self._pending_epoch = None
+
+    def on_batch_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        batch_inputs: List[Any],
+        batch_outputs: List[Dict[str, Any]],
+        batch_metrics: Dict[str, Any],
+        epoch: int,
+        batch_number: int,
+        is_training: bool,
+        is_primary: bool = True,
+        batch_grad_norm: Optional[float] = None,
+        **kwargs: Any,
+    ) -> None:
+        if self.uploader is not None:
+            self._submit_pending()
+
+    def on_epoch_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        metrics: Dict[str, Any],
+        epoch: int,
+        is_primary: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        # the checkpointer runs after on_epoch
+        self._pending_epoch = epoch
+
+    def on_end_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        metrics: Dict[str, Any] = None,
+        epoch: int = None,
+        is_primary: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        if self.uploader is None:
+            return
+        # the trainer has saved the last epoch by now
+        self._submit_pending()
+        self.uploader.close()
+        self.uploader = None
+
+
+@AllennlpWandbSubCallback.register("retention_policy")
+class ApplyRetentionPolicy(AllennlpWandbSubCallback):
+    """
+    Frees the disk space taken by the other runs of the sweep (or by all the
+    runs, if the run is not part of a sweep) at the end of the run,
+    according to a :class:`RetentionPolicy`. The runs are taken
+    from the run index, so `index_run` has to be on. The current run and
+    the runs that are still running are not touched.
+
+    Args:
+        priority: Priority of the sub-callback.
+        metric: See :class:`RetentionPolicy`. Defaults to the best value of
+            the tracked validation metric, e.g., `+best_validation_accuracy`.
+        keep_top_k: See :class:`RetentionPolicy`.
+        keep_days: See :class:`RetentionPolicy`.
+        archives_only: See :class:`RetentionPolicy`.
+        num_workers: Number of files deleted concurrently.
+    """
+
+    def __init__(
+        self,
+        priority: int = 0,
+        metric: Optional[str] = None,
+        keep_top_k: Optional[int] = None,
+        keep_days: Optional[float] = None,
+        archives_only: bool = False,
+        num_workers: int = 8,
+        **kwargs: Any,
+    ):
+        super().__init__(priority, **kwargs)
+
+        if keep_top_k is None and keep_days is None and not archives_only:
+            raise ValueError(
+                "Set at least one of keep_top_k, keep_days or archives_only"
+            )
+        self.metric = metric
+        self.keep_top_k = keep_top_k
+        self.keep_days = keep_days
+        self.archives_only = archives_only
+        self.num_workers = num_workers
+
+    def on_end_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        metrics: Dict[str, Any] = None,
+        epoch: int = None,
+        is_primary: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        if not is_primary:
+            return
+
+        if super_callback.run_index is None:
+            logger.warning("Not applying the retention policy without index_run.")
+
+            return
+        metric = self.metric
+
+        if metric is None:
+            sign, name = trainer._metric_tracker.tracked_metrics[0]
+            metric = f"{'+' if sign > 0 else '-'}best_validation_{name}"
+        run = super_callback.wandb.run  # type: ignore
+        policy = RetentionPolicy(
+            metric=metric,
+            keep_top_k=self.keep_top_k,
+            keep_days=self.keep_days,
+            archives_only=self.archives_only,
+        )
+
+        try:
+            deleted, reclaimed = apply_retention(
+                super_callback.run_index,
+                policy,
+                sweep_id=run.sweep_id,
+                exclude=[str(run.id)],
+                num_workers=self.num_workers,
+            )
+        except Exception as e:
+            logger.warning(f"Could not apply the retention policy: {e}")
+
+            return
+        logger.info(
+            f"Retention policy: reclaimed {reclaimed / 2**20:.1f} MiB "
+            f"from {len(deleted)} runs"
+        )
+
+
+@AllennlpWandbSubCallback.register("best_weights_in_memory")
+class BestWeightsInMemory(AllennlpWandbSubCallback):
+    """
+    Keeps the weights of the best epoch in host memory, so that the trainer
+    restores them from there after the last epoch instead of reading
+    `best.th` back from the disk. So the evaluation on the test set in
+    `TrainTestAndLogToWandb.finish` starts without a disk round trip.
+    `best.th` is still written for the archive.
+
+    Training with a moving average restores from the disk as usual, because
+    the best weights are the averaged ones.
+
+    Args:
+        priority: Priority of the sub-callback.
+        pin_memory: Use pinned host memory for faster copies from and to the
+            GPU.
+        half_precision: Keep the floating point weights as float16, which
+            halves the memory but rounds the restored weights.
+    """
+
+    def __init__(
+        self,
+        priority: int = 0,
+        pin_memory: bool = False,
+        half_precision: bool = False,
+        **kwargs: Any,
+    ):
+        super().__init__(priority, **kwargs)
+        self.snapshot = HostWeightsSnapshot(
+            pin_memory=pin_memory,
+            dtype=torch.float16 if half_precision else None,
+        )
+        self.enabled = False
+
+    def on_start_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        is_primary: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        super().on_start_(
+            super_callback, trainer, is_primary=is_primary, **kwargs
+        )
+        self.enabled = is_primary and trainer._moving_average is None
+
+        if is_primary and not self.enabled:
+            logger.warning(
+                "best_weights_in_memory does nothing with a moving average."
+            )
+
+        if not self.enabled:
+            return
+        load_model_state = trainer._load_model_state
+
+        def load_best_model_state(path: str) -> None:
+            # the trainer only loads the best weights after the last epoch
+            if self.snapshot.state:
+                start = time.time()
+                self.snapshot.restore(trainer.model)
+                logger.info(
+                    "Restored the best weights from memory "
+                    f"in {time.time() - start:.3f}s"
+                )
+            else:
+                load_model_state(path)
+
+        trainer._load_model_state = load_best_model_state
+
+    def on_epoch_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        metrics: Dict[str, Any],
+        epoch: int,
+        is_primary: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        # the same condition under which the trainer writes best.th
+        if not (
+            self.enabled
+            and getattr(trainer, "_should_validate_this_epoch", True)
+            and trainer._metric_tracker.is_best_so_far()
+        ):
+            return
+        start = time.time()
+        self.snapshot.save(trainer.model)
+        logger.debug(
+            f"Kept the weights of epoch {epoch} in memory "
+            f"({self.snapshot.nbytes / 2**20:.1f} MiB) "
+            f"in {time.time() - start:.3f}s"
+        )
+
+    def on_end_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        metrics: Dict[str, Any] = None,
+        epoch: int = None,
+        is_primary: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        # free the memory
+        self.snapshot.state = {}
+
+
+@AllennlpWandbSubCallback.register("health_monitor")
+class HealthMonitor(AllennlpWandbSubCallback):
+    """
+    Watches the loss and the gradient norm of the training batches for
+    non-finite values and spikes, without a synchronization per batch.
+
+    The trainer already has the batch loss on the host, and the gradient
+    norm too if `grad_norm` is set in the trainer (except for `true` with
+    mixed precision, which is the norm of the scaled gradients). Otherwise
+    the gradient norm is computed on the device. The statistics (see
+    :class:`SeriesStats`) are read and checked every `interval` training
+    steps only, and logged under `health/`, with the loss scale of mixed
+    precision training.
+
+    A check fails if a loss was not finite, if a gradient norm was not
+    finite without mixed precision (whose gradient scaler skips these steps
+    itself), if a value spiked, or if the loss scale fell below
+    `min_loss_scale`. Failed checks are logged as warnings, and `actions`
+    can do more:
+
+    * `tag`: adds `tag` to the tags of the run when a check fails.
+    * `abort`: stops training with an error after `patience` failed checks
+      in a row.
+    * `skip_logging`: does not log non-finite scalars to wandb, so that they
+      do not spoil the charts. This does not wait for a check.
+
+    Args:
+        priority: Priority of the sub-callback.
+        interval: Number of steps between two checks. Default: the
+            `summary_interval` of the callback.
+        spike_factor: A value above `spike_factor` times the moving average
+            is a spike. `None` only checks for non-finite values.
+        warmup: Number of steps before spikes are counted.
+        min_loss_scale: With mixed precision, a lower loss scale fails a
+            check, because the gradients keep overflowing.
+        actions: Any of `skip_logging`, `tag` and `abort`.
+        tag: The tag for the `tag` action.
+        patience: Number of failed checks in a row before `abort`.
+    """
+
+    ACTIONS = ["skip_logging", "tag", "abort"]
+
+    def __init__(
+        self,
+        priority: int = 0,
+        interval: Optional[int] = None,
+        spike_factor: Optional[float] = 10.0,
+        warmup: int = 100,
+        min_loss_scale: float = 1.0,
+        actions: Optional[List[str]] = None,
+        tag: str = "unhealthy",
+        patience: int = 1,
+        **kwargs: Any,
+    ):
+        super().__init__(priority, **kwargs)
+        unknown = set(actions or []) - set(self.ACTIONS)
+
+        if unknown:
+            raise ValueError(
+                f"Unknown actions {sorted(unknown)}, use {self.ACTIONS}"
+            )
+        self.interval = interval
+        self.min_loss_scale = min_loss_scale
+        self.actions = actions or []
+        self.tag = tag
+        self.patience = patience
+        self.loss = SeriesStats(spike_factor, warmup=warmup)
+        self.grad_norm = SeriesStats(spike_factor, warmup=warmup)
+        self.failed_checks = 0
+        self.enabled = False
+
+    def on_start_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        is_primary: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        super().on_start_(
+            super_callback, trainer, is_primary=is_primary, **kwargs
+        )
+        self.enabled = is_primary
+        self.interval = self.interval or super_callback._summary_interval
+
+        if self.enabled and "skip_logging" in self.actions:
+            log_scalars = super_callback.log_scalars
+
+            def log_finite_scalars(
+                scalars: Dict[str, Any], *args: Any, **kwargs: Any
+            ) -> None:
+                # the values are already on the host
+                scalars = {
+                    k: v
+                    for k, v in scalars.items()
+                    if not isinstance(v, float) or math.isfinite(v)
+                }
+                log_scalars(scalars, *args, **kwargs)
+
+            super_callback.log_scalars = log_finite_scalars  # type: ignore
+
+    def on_batch_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        batch_inputs: List[Any],
+        batch_outputs: List[Dict[str, Any]],
+        batch_metrics: Dict[str, Any],
+        epoch: int,
+        batch_number: int,
+        is_training: bool,
+        is_primary: bool = True,
+        batch_grad_norm: Optional[float] = None,
+        **kwargs: Any,
+    ) -> None:
+        if not (self.enabled and is_training):
+            return
+        loss = batch_metrics.get("batch_loss")
+
+        if loss is not None:
+            self.loss.add(loss)
+        # with mixed precision and `grad_norm: true`, the trainer computes
+        # the norm before unscaling, and the scale has changed since
+        scaled = (
+            getattr(trainer, "_scaler", None) is not None
+            and trainer._grad_norm is True
+        )
+
+        if batch_grad_norm is not None and not scaled:
+            self.grad_norm.add(batch_grad_norm)
+        else:
+            # the step of the gradient scaler unscaled the gradients in place
+            norm = gradient_norm(trainer.model.parameters())
+
+            if norm is not None:
+                self.grad_norm.add(norm)
+
+        if trainer._total_batches_completed % self.interval == 0:
+            self.check(super_callback, trainer, epoch)
+
+    def check(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        epoch: int,
+    ) -> None:
+        scaler = getattr(trainer, "_scaler", None)
+        stats = {
+            f"{series}_{name}": value
+            for series, series_stats in [
+                ("loss", self.loss),
+                ("grad_norm", self.grad_norm),
+            ]
+            for name, value in series_stats.read().items()
+        }
+        problems = []
+
+        if stats.get("loss_nonfinite"):
+            problems.append(f"{stats['loss_nonfinite']:.0f} non-finite losses")
+
+        if stats.get("grad_norm_nonfinite") and scaler is None:
+            problems.append(
+                f"{stats['grad_norm_nonfinite']:.0f} non-finite gradient norms"
+            )
+
+        for series in ["loss", "grad_norm"]:
+            if stats.get(f"{series}_spikes"):
+                problems.append(
+                    f"{stats[f'{series}_spikes']:.0f} spikes of the {series}"
+                )
+
+        if scaler is not None and scaler.is_enabled():
+            stats["loss_scale"] = scaler.get_scale()
+
+            if stats["loss_scale"] < self.min_loss_scale:
+                problems.append(f"loss scale {stats['loss_scale']:g}")
+        self.failed_checks = self.failed_checks + 1 if problems else 0
+        stats["failed_checks"] = self.failed_checks
+        super_callback.log_scalars(stats, log_prefix="health", epoch=epoch)
+
+        if not problems:
+            return
+        message = (
+            f"Training looks unhealthy at step "
+            f"{trainer._total_batches_completed}: {', '.join(problems)}"
+        )
+        logger.warning(message)
+
+        if "tag" in self.actions:
+            run = super_callback.wandb.run  # type: ignore
+
+            if run is not None and self.tag not in (run.tags or ()):
+                run.tags = tuple(run.tags or ()) + (self.tag,)
+
+        if "abort" in self.actions and self.failed_checks >= self.patience:
+            raise RuntimeError(message)
+
+
+@AllennlpWandbSubCallback.register("profiler")
+class Profiler(AllennlpWandbSubCallback):
+    """
+    Profiles windows of training steps with torch.profiler in the given
+    `epochs`, instead of rerunning the training with a profiler by hand.
+
+    A window opens after the first training batch of such an epoch, skips
+    `wait` steps, warms up for `warmup` steps and records `active` steps,
+    `repeat` times (see `torch.profiler.schedule`). It is closed when the
+    epoch ends earlier. The Chrome traces and the tables of the slowest
+    operators are written to `output_dir` in the serialization dir (see
+    :class:`ProfilerWindow`) and uploaded to wandb at the end.
+
+    Without `epochs` nothing is profiled. Outside of the windows, the
+    profiler does not exist, and a batch costs a lookup in `epochs`.
+    Only the primary worker is profiled.
+
+    Args:
+        priority: Priority of the sub-callback.
+        epochs: The epochs to profile, counted from 0.
+        wait: Number of steps before the warmup.
+        warmup: Number of steps whose results are thrown away.
+        active: Number of steps to record.
+        repeat: Number of (wait, warmup, active) cycles in an epoch.
+        output_dir: Directory in the serialization dir.
+        activities: Any of `cpu` and `cuda`. Default: both, if CUDA is
+            available.
+        sort_by: Sort key of the tables, for instance
+            `self_cpu_time_total`.
+        row_limit: Number of operators in the tables.
+        record_shapes: Record the shapes of the inputs of the operators.
+        profile_memory: Record the memory allocations.
+        with_stack: Record the python stack of the operators.
+    """
+
+    def __init__(
+        self,
+        priority: int = 0,
+        epochs: Optional[List[int]] = None,
+        wait: int = 1,
+        warmup: int = 1,
+        active: int = 3,
+        repeat: int = 1,
+        output_dir: str = "profiles",
+        activities: Optional[List[str]] = None,
+        sort_by: Optional[str] = None,
+        row_limit: int = 50,
+        record_shapes: bool = False,
+        profile_memory: bool = False,
+        with_stack: bool = False,
+        **kwargs: Any,
+    ):
+        super().__init__(priority, **kwargs)
+
+        if min(wait, warmup) < 0 or min(active, repeat) < 1:
+            raise ValueError(
+                f"Invalid profiler schedule: wait={wait}, warmup={warmup}, "
+                f"active={active}, repeat={repeat}"
+            )
+        self.epochs = set(epochs or [])
+        self.window_kwargs = dict(
+            wait=wait,
+            warmup=warmup,
+            active=active,
+            repeat=repeat,
+            activities=activities,
+            sort_by=sort_by,
+            row_limit=row_limit,
+            record_shapes=record_shapes,
+            profile_memory=profile_memory,
+            with_stack=with_stack,
+        )
+        self.output_dir = output_dir
+        self.window: Optional[ProfilerWindow] = None
+        self.files: List[str] = []
+
+    def on_start_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        is_primary: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        super().on_start_(
+            super_callback, trainer, is_primary=is_primary, **kwargs
+        )
+
+        if not is_primary:
+            self.epochs = set()
+
+    def on_batch_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        batch_inputs: List[Any],
+        batch_outputs: List[Dict[str, Any]],
+        batch_metrics: Dict[str, Any],
+        epoch: int,
+        batch_number: int,
+        is_training: bool,
+        is_primary: bool = True,
+        batch_grad_norm: Optional[float] = None,
+        **kwargs: Any,
+    ) -> None:
+        if self.window is not None:
+            # the validation is not profiled
+            if not is_training or not self.window.step():
+                self._close()
+
+        elif is_training and epoch in self.epochs:
+            self.epochs.discard(epoch)
+            logger.info(f"Profiling epoch {epoch}")
+            output_dir = os.path.join(
+                super_callback.serialization_dir, self.output_dir
+            )
+            self.window = ProfilerWindow(
+                output_dir, f"epoch_{epoch}", **self.window_kwargs
+            )
+
+    def _close(self) -> None:
+        assert self.window is not None
+        self.window.close()
+        self.files.extend(
+            os.path.join(self.output_dir, name) for name in self.window.files
+        )
+        self.window = None
+
+    def on_epoch_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        metrics: Dict[str, Any],
+        epoch: int,
+        is_primary: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        if self.window is not None:
+            self._close()
+
+    def on_end_(
+        self,
+        super_callback: AllennlpWandbCallback,
+        trainer: "GradientDescentTrainer",
+        metrics: Dict[str, Any] = None,
+        epoch: int = None,
+        is_primary: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        if self.window is not None:
+            self._close()
+        # uploaded by close() of the callback, which comes after on_end
+        super_callback._files_to_save_at_end.extend(self.files)
+        self.files = []
@@ -1,6 +1,9 @@
-from typing import List, Tuple, Union, Dict, Any, Optional
+from typing import List, Tuple, Union, Dict, Any, Optional, Pattern
+from fnmatch import translate
+import hashlib
 import json
 import logging
+import re
 from copy import deepcopy
 from pathlib import Path
 from allennlp.models.archival import CONFIG_NAME
@@ -50,6 +53,103 @@ def flatten_dict(params: Dict[str, Any],
     return output
 
 
+def compile_key_patterns(
+    patterns: Optional[Union[str, List[str]]]
+) -> Optional[Pattern]:
+    """
+    Compiles glob patterns of dotted keys, e.g. ``model.*`` or ``*.dropout``,
+    into one regular expression.
+
+    Args:
+        patterns: List of patterns or comma separated string of patterns.
+
+    Returns:
+        The expression, or ``None`` if there are no patterns.
+    """
+    if isinstance(patterns, str):
+        patterns = patterns.split(",")
+    patterns = [p.strip() for p in patterns or [] if p.strip()]
+
+    if not patterns:
+        return None
+
+    return re.compile("|".join(translate(p) for p in patterns))
+
+
+def summarize_list(values: List[Any]) -> Dict[str, Value]:
+    """
+    Replaces a list by its length and a hash of its content, which still
+    tells apart runs with different lists.
+    """
+    content = json.dumps(values, sort_keys=True, default=str)
+
+    return {
+        "length": len(values),
+        "sha256": hashlib.sha256(content.encode()).hexdigest()[:16],
+    }
+
+
+def filter_config(
+    params: Dict[str, Any],
+    include_keys: Optional[Union[str, List[str]]] = None,
+    exclude_keys: Optional[Union[str, List[str]]] = None,
+    max_list_length: Optional[int] = None,
+    delimiter: str = ".",
+) -> Dict[str, Value]:
+    """
+    Flattens the part of a config to log, like :func:`flatten_dict`.
+
+    The keys are matched while the config is traversed, so an excluded
+    section, e.g. ``dataset_reader``, is never flattened.
+
+    Args:
+        params: The config.
+        include_keys: Patterns (see :func:`compile_key_patterns`) of keys to
+            keep. A key is kept if it or one of its prefixes matches.
+            Defaults to all keys.
+        exclude_keys: Patterns of keys to drop with everything below them.
+        max_list_length: Lists longer than this are replaced by
+            :func:`summarize_list`, e.g. ``<key>.length`` and
+            ``<key>.sha256``, instead of one key per element.
+        delimiter: Delimiter to express the hierarchy. Defaults to ``'.'``.
+
+    Returns:
+        Flattened dict.
+    """
+    include = compile_key_patterns(include_keys)
+    exclude = compile_key_patterns(exclude_keys)
+    output: Dict[str, Value] = {}
+
+    def populate(inp: Any, key: str, included: bool) -> None:
+        if key:
+            if exclude is not None and exclude.match(key):
+                return
+            included = included or bool(include.match(key))  # type: ignore
+        prefix = f"{key}{delimiter}" if key else ""
+
+        if isinstance(inp, dict):
+            for k, v in inp.items():
+                populate(v, f"{prefix}{k}", included)
+
+        elif isinstance(inp, list):
+            if max_list_length is not None and len(inp) > max_list_length:
+                populate(summarize_list(inp), key, included)
+            else:
+                for i, val in enumerate(inp):
+                    populate(val, f"{prefix}{i}", included)
+        elif isinstance(inp, (str, float, int, bool)) or (inp is None):
+            if included:
+                output[key] = inp
+        else:  # unsupported type
+            raise ValueError(
+                f"Unsuported type {type(inp)} at {key} for flattening."
+            )
+
+    populate(params, "", include is None)
+
+    return output
+
+
 def get_config_from_serialization_dir(dir_: str, ) -> Dict[str, Value]:
     with open(Path(dir_) / CONFIG_NAME) as f:
         config_dict = json.load(f)
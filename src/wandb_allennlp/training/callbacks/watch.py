@@ -0,0 +1,134 @@
+"""Lightweight replacement for `wandb.watch`.
+
+`wandb.watch` keeps hooks on every parameter for the whole training and
+computes full histograms. :class:`GradientWatcher` only hooks the parameters
+of the modules whose name matches a regex, only for the steps it samples,
+and only transfers a few summary statistics to the host.
+"""
+from typing import List, Tuple, Union, Dict, Any, Optional
+import logging
+import re
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class GradientWatcher:
+    """
+    Collects the gradient and parameter statistics of a model every
+    `interval` steps.
+
+    Call :meth:`step` after every optimizer step. It returns the statistics
+    of the steps that were sampled: the norm, the max absolute value and the
+    number of non-finite entries of the gradient of every watched parameter
+    and the norm of the parameter itself.
+
+    Args:
+        model: The model to watch.
+        modules: Regex matched against the names of the modules (as in
+            `model.named_modules()`). Only the parameters of the matching
+            modules are watched. Default: all.
+        interval: Number of steps between two samples.
+    """
+
+    def __init__(
+        self,
+        model: torch.nn.Module,
+        modules: Optional[str] = None,
+        interval: int = 100,
+    ) -> None:
+        if interval < 1:
+            raise ValueError("interval should be at least 1")
+        self.interval = interval
+        pattern = re.compile(modules) if modules is not None else None
+        self.parameters: Dict[str, torch.nn.Parameter] = {}
+
+        for module_name, module in model.named_modules():
+            if pattern is not None and not pattern.search(module_name):
+                continue
+
+            for name, parameter in module.named_parameters(recurse=False):
+                if parameter.requires_grad:
+                    full_name = f"{module_name}.{name}" if module_name else name
+                    self.parameters[full_name] = parameter
+        logger.info(f"Watching {len(self.parameters)} parameters.")
+        self._handles: List[Any] = []
+        self._grads: Dict[str, torch.Tensor] = {}
+        self._num_steps = 0
+        self._arm_if_sampled()
+
+    @property
+    def is_armed(self) -> bool:
+        return bool(self._handles)
+
+    def _arm_if_sampled(self) -> None:
+        if (self._num_steps + 1) % self.interval != 0:
+            return
+
+        for name, parameter in self.parameters.items():
+            self._handles.append(parameter.register_hook(self._hook(name)))
+
+    def _hook(self, name: str) -> Any:
+        def hook(grad: torch.Tensor) -> None:
+            # sum over the micro-batches of the step, before any clipping
+            previous = self._grads.get(name)
+
+            if previous is None:
+                self._grads[name] = grad.detach().clone()
+            else:
+                previous.add_(grad.detach())
+
+        return hook
+
+    def remove(self) -> None:
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+        self._grads = {}
+
+    def _summarize(self, name: str) -> torch.Tensor:
+        grad = self._grads[name].float()
+
+        return torch.stack(
+            [
+                grad.norm(),
+                grad.abs().max(),
+                (~torch.isfinite(grad)).sum().float(),
+                self.parameters[name].detach().float().norm(),
+            ]
+        )
+
+    def step(self) -> Dict[str, float]:
+        """
+        Called after every optimizer step.
+
+        Returns:
+            The statistics, keyed by `gradients/<name>/<stat>` and
+            `parameters/<name>/norm`, if this step was sampled, else an
+            empty dict.
+        """
+        self._num_steps += 1
+        result: Dict[str, float] = {}
+
+        if self.is_armed:
+            names = list(self._grads)
+
+            if names:
+                with torch.no_grad():
+                    rows = torch.stack(
+                        [self._summarize(name) for name in names]
+                    )
+                    # a single transfer to the host
+                    values = rows.cpu().tolist()
+
+                for name, (grad_norm, abs_max, non_finite, norm) in zip(
+                    names, values
+                ):
+                    result[f"gradients/{name}/norm"] = grad_norm
+                    result[f"gradients/{name}/abs_max"] = abs_max
+                    result[f"gradients/{name}/non_finite"] = non_finite
+                    result[f"parameters/{name}/norm"] = norm
+            self.remove()
+        self._arm_if_sampled()
+
+        return result
@@ -0,0 +1,380 @@
+"""Reuse the dataset reader output and the vocabulary across trials of a sweep.
+
+Trials of a sweep that only differ in model or optimizer hyperparameters
+read, tokenize and index exactly the same data. The classes in this module
+cache the instances and the vocabulary in memory, keyed by a hash of the
+data-relevant part of the config, so that only the first trial pays for it.
+Optionally, the indexed instances and the vocabulary are also stored in a
+directory shared by all the processes on a node.
+"""
+from typing import List, Tuple, Union, Dict, Any, Optional, Iterable, Iterator
+from collections import OrderedDict
+from os import PathLike
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from filelock import FileLock
+from allennlp.common import Lazy, Params
+from allennlp.common import logging as common_logging
+from allennlp.common.meta import Meta, META_NAME
+from allennlp.commands.train import train_model, _train_worker
+from allennlp.data import DatasetReader, Instance, Vocabulary
+from allennlp.models import Model
+from allennlp.models.archival import (
+    CONFIG_NAME,
+    archive_model,
+    verify_include_in_archive,
+)
+from allennlp.training import util as training_util
+
+logger = logging.getLogger(__name__)
+
+CACHED_TYPE = "wandb_allennlp_cached"
+
+#: Top-level config keys that determine the instances and the vocabulary.
+DATA_CONFIG_KEYS = [
+    "dataset_reader",
+    "validation_dataset_reader",
+    "train_data_path",
+    "validation_data_path",
+    "test_data_path",
+    "vocabulary",
+    "datasets_for_vocab_creation",
+]
+
+
+def data_config_hash(params: Union[Params, Dict[str, Any]]) -> str:
+    """
+    Hash of the data-relevant part of a resolved config.
+
+    Args:
+        params: The resolved config, i.e., after the overrides are applied.
+
+    Returns:
+        Hex digest which is the same for all configs that produce the same
+        instances and vocabulary.
+    """
+    config = (
+        params.as_dict(quiet=True) if isinstance(params, Params) else params
+    )
+    relevant = {key: config.get(key) for key in DATA_CONFIG_KEYS}
+    # Include the size and modification time of local data files
+    # so that edited data does not hit stale entries.
+    relevant["data_files"] = {
+        key: [os.path.getsize(path), os.path.getmtime(path)]
+        for key in DATA_CONFIG_KEYS
+        for path in [config.get(key)]
+        if key.endswith("_data_path")
+        and isinstance(path, str)
+        and os.path.isfile(path)
+    }
+
+    return hashlib.sha256(
+        json.dumps(relevant, sort_keys=True).encode()
+    ).hexdigest()
+
+
+class _CacheEntry:
+    def __init__(self) -> None:
+        self.instances: Dict[str, List[Instance]] = {}
+        self.vocabulary: Optional[Vocabulary] = None
+
+
+class DataCache:
+    """
+    In-memory store of instances and vocabularies keyed by
+    :func:`data_config_hash`.
+
+    Only the `max_entries` most recently used data configs are kept in memory.
+    If `cache_dir` is set, :meth:`warm` also writes the indexed instances and
+    the vocabulary to `cache_dir/<key>` and lookups that miss the memory fall
+    back to it. Writes are guarded by a file lock per key, so concurrent
+    processes build every entry only once.
+    """
+
+    def __init__(
+        self, max_entries: int = 2, cache_dir: Optional[str] = None
+    ) -> None:
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+
+    def _disk_dir(self, key: str) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+        path = os.path.join(self.cache_dir, key)
+
+        return path if os.path.isdir(path) else None
+
+    @staticmethod
+    def _instances_file(data_path: str) -> str:
+        digest = hashlib.sha256(data_path.encode()).hexdigest()[:16]
+
+        return f"instances-{digest}.pkl"
+
+    def _entry(self, key: str) -> _CacheEntry:
+        if key not in self._entries:
+            self._entries[key] = _CacheEntry()
+
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                logger.info(f"Evicted data config {evicted[:8]} from cache.")
+        self._entries.move_to_end(key)
+
+        return self._entries[key]
+
+    def get_instances(
+        self, key: str, data_path: str
+    ) -> Optional[List[Instance]]:
+        if key in self._entries and data_path in self._entries[key].instances:
+            return self._entry(key).instances[data_path]
+        disk_dir = self._disk_dir(key)
+
+        if disk_dir is None:
+            return None
+        path = os.path.join(disk_dir, self._instances_file(data_path))
+
+        if not os.path.isfile(path):
+            return None
+        logger.info(f"Loading cached instances from {path}.")
+        with open(path, "rb") as f:
+            instances = pickle.load(f)
+        self.set_instances(key, data_path, instances)
+
+        return instances
+
+    def set_instances(
+        self, key: str, data_path: str, instances: List[Instance]
+    ) -> None:
+        self._entry(key).instances[data_path] = instances
+
+    def get_vocabulary(self, key: str) -> Optional[Vocabulary]:
+        if key in self._entries and self._entries[key].vocabulary is not None:
+            return self._entry(key).vocabulary
+        disk_dir = self._disk_dir(key)
+
+        if disk_dir is None:
+            return None
+        logger.info(f"Loading cached vocabulary from {disk_dir}.")
+        with open(os.path.join(disk_dir, "vocabulary.pkl"), "rb") as f:
+            vocabulary = pickle.load(f)
+        self.set_vocabulary(key, vocabulary)
+
+        return vocabulary
+
+    def set_vocabulary(self, key: str, vocabulary: Vocabulary) -> None:
+        self._entry(key).vocabulary = vocabulary
+
+    def wrap_params(self, params: Params, key: Optional[str] = None) -> Params:
+        """
+        Replaces the dataset readers and the vocabulary in `params` with
+        their cached counterparts. The original sections are kept
+        nested inside so that a cache miss behaves exactly like the
+        original config.
+        """
+        key = key or data_config_hash(params)
+
+        for name in ["dataset_reader", "validation_dataset_reader"]:
+            if name in params:
+                params[name] = {
+                    "type": CACHED_TYPE,
+                    "key": key,
+                    "reader": _as_dict(params.pop(name)),
+                }
+        params["vocabulary"] = {
+            "type": CACHED_TYPE,
+            "key": key,
+            "vocabulary": _as_dict(params.pop("vocabulary", {})),
+        }
+
+        return params
+
+    def warm(self, params: Params) -> str:
+        """
+        Reads the datasets used for vocabulary creation, creates the
+        vocabulary and indexes the instances, without constructing the model.
+        If `cache_dir` is set, the result is written to it.
+
+        Returns:
+            The cache key of `params`.
+        """
+        key = data_config_hash(params)
+
+        if self.cache_dir is None:
+            self._build(params, key)
+
+            return key
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with FileLock(os.path.join(self.cache_dir, f"{key}.lock")):
+            if self._disk_dir(key) is None:
+                self._build(params, key)
+                self._save(key)
+            else:
+                logger.info(f"Found data config {key[:8]} in {self.cache_dir}.")
+
+        return key
+
+    def _build(self, params: Params, key: str) -> None:
+        if self.get_vocabulary(key) is not None:
+            return
+        logger.info(f"Warming up the data cache for data config {key[:8]}.")
+        with tempfile.TemporaryDirectory() as tmp:
+            vocabulary = training_util.make_vocab_from_params(
+                self.wrap_params(params.duplicate(), key), tmp
+            )
+
+        for instances in self._entry(key).instances.values():
+            for instance in instances:
+                instance.index_fields(vocabulary)
+
+    def _save(self, key: str) -> None:
+        assert self.cache_dir is not None
+        entry = self._entry(key)
+        # write to a temporary directory and rename it so that readers
+        # never see a partially written entry
+        tmp_dir = tempfile.mkdtemp(prefix=f"{key}.", dir=self.cache_dir)
+
+        for data_path, instances in entry.instances.items():
+            with open(
+                os.path.join(tmp_dir, self._instances_file(data_path)), "wb"
+            ) as f:
+                pickle.dump(instances, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(tmp_dir, "vocabulary.pkl"), "wb") as f:
+            pickle.dump(entry.vocabulary, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(tmp_dir, "data_paths.json"), "w") as f:
+            json.dump(list(entry.instances), f)
+        os.rename(tmp_dir, os.path.join(self.cache_dir, key))
+        logger.info(f"Saved data config {key[:8]} to {self.cache_dir}.")
+
+
+#: The cache used by the cached reader and vocabulary in this process.
+DATA_CACHE = DataCache()
+
+
+def _as_dict(params: Union[Params, Dict[str, Any]]) -> Dict[str, Any]:
+    return params.as_dict(quiet=True) if isinstance(params, Params) else params
+
+
+@DatasetReader.register(CACHED_TYPE)
+class CachedDatasetReader(DatasetReader):
+    """
+    Serves the instances read by `reader` from :data:`DATA_CACHE`.
+
+    Reads that are sharded across data loader workers or distributed
+    processes are passed through to `reader` without caching.
+    """
+
+    def __init__(
+        self,
+        reader: DatasetReader,
+        key: str,
+        serialization_dir: Optional[str] = None,
+    ) -> None:
+        super().__init__(serialization_dir=serialization_dir)
+        self.reader = reader
+        self.key = key
+
+    def read(self, file_path: Any) -> Iterator[Instance]:
+        if (
+            self._worker_info is not None
+            or self._distributed_info is not None
+        ):
+            self.reader._set_worker_info(self._worker_info)
+            self.reader._set_distributed_info(self._distributed_info)
+            yield from self.reader.read(file_path)
+
+            return
+        data_path = json.dumps(file_path, sort_keys=True)
+        instances = DATA_CACHE.get_instances(self.key, data_path)
+
+        if instances is None:
+            instances = list(self.reader.read(file_path))
+            DATA_CACHE.set_instances(self.key, data_path, instances)
+        else:
+            logger.info(f"Using cached instances for {file_path}.")
+        yield from instances
+
+    def text_to_instance(self, *inputs: Any) -> Instance:
+        return self.reader.text_to_instance(*inputs)
+
+    def apply_token_indexers(self, instance: Instance) -> None:
+        self.reader.apply_token_indexers(instance)
+
+
+@Vocabulary.register(CACHED_TYPE, constructor="from_cache")
+class CachedVocabulary(Vocabulary):
+    """
+    Serves the vocabulary built by `vocabulary` from :data:`DATA_CACHE`.
+    """
+
+    @classmethod
+    def from_cache(
+        cls,
+        key: str,
+        vocabulary: Lazy[Vocabulary] = Lazy(Vocabulary),
+        instances: Optional[Iterable[Instance]] = None,
+    ) -> Vocabulary:
+        vocabulary_ = DATA_CACHE.get_vocabulary(key)
+
+        if vocabulary_ is None:
+            vocabulary_ = vocabulary.construct(instances=instances)
+            DATA_CACHE.set_vocabulary(key, vocabulary_)
+        else:
+            logger.info(f"Using cached vocabulary for data config {key[:8]}.")
+
+        return vocabulary_
+
+
+def train_model_with_cache(
+    params: Params,
+    serialization_dir: Union[str, PathLike],
+    recover: bool = False,
+    force: bool = False,
+    include_package: Optional[List[str]] = None,
+    dry_run: bool = False,
+    file_friendly_logging: bool = False,
+) -> Optional[Model]:
+    """
+    Same as `allennlp.commands.train.train_model` but the dataset readers
+    and the vocabulary are served from :data:`DATA_CACHE`.
+
+    The config saved in the serialization dir, which is the one logged to
+    wandb and put in the archive, is the original one. Distributed training
+    is handed over to `train_model` without caching.
+    """
+
+    if "distributed" in params:
+        return train_model(
+            params,
+            serialization_dir,
+            recover=recover,
+            force=force,
+            include_package=include_package,
+            dry_run=dry_run,
+            file_friendly_logging=file_friendly_logging,
+        )
+    common_logging.FILE_FRIENDLY_LOGGING = file_friendly_logging
+    training_util.create_serialization_dir(
+        params, serialization_dir, recover, force
+    )
+    params.to_file(os.path.join(serialization_dir, CONFIG_NAME))
+    params.pop("evaluation", None)
+    Meta.new().to_file(os.path.join(serialization_dir, META_NAME))
+    include_in_archive = params.pop("include_in_archive", None)
+    verify_include_in_archive(include_in_archive)
+    model = _train_worker(
+        process_rank=0,
+        params=DATA_CACHE.wrap_params(params),
+        serialization_dir=serialization_dir,
+        include_package=include_package,
+        dry_run=dry_run,
+        file_friendly_logging=file_friendly_logging,
+    )
+
+    if not dry_run:
+        archive_model(serialization_dir, include_in_archive=include_in_archive)
+
+    return model
@@ -0,0 +1,111 @@
+"""Resume a preempted run from its local serialization directory."""
+from typing import List, Tuple, Union, Dict, Any, Optional
+import glob
+import logging
+import os
+import shutil
+import torch
+from wandb_allennlp.config import ALLENNLP_SERIALIZATION_DIR
+from wandb_allennlp.run_index import RunIndex, hash_file
+
+logger = logging.getLogger(__name__)
+
+#: Files written by the checkpointer and the trainer of allennlp.
+CHECKPOINT_PATTERNS = ["model_state_*.th", "training_state_*.th", "best.th"]
+CORRUPT_DIR = "corrupt_checkpoints"
+
+
+def checkpoint_files(serialization_dir: str) -> List[str]:
+    return sorted(
+        os.path.basename(path)
+        for pattern in CHECKPOINT_PATTERNS
+        for path in glob.glob(os.path.join(serialization_dir, pattern))
+    )
+
+
+def find_serialization_dir(run_id: str, index: RunIndex) -> Optional[str]:
+    """
+    Looks the run up in the index and, if it is not there, in
+    ALLENNLP_SERIALIZATION_DIR.
+    """
+    serialization_dir = index.find(run_id)
+
+    if serialization_dir is not None:
+        return serialization_dir
+    candidates = sorted(
+        glob.glob(os.path.join(ALLENNLP_SERIALIZATION_DIR, f"run-*-{run_id}"))
+    )
+
+    if not candidates:
+        return None
+    index.add_run(run_id, candidates[-1])
+
+    return candidates[-1]
+
+
+def _loads(path: str) -> bool:
+    try:
+        torch.load(path, map_location="cpu")
+    except Exception as e:
+        logger.warning(f"Cannot load {path}: {e}")
+
+        return False
+
+    return True
+
+
+def verify_checkpoints(
+    serialization_dir: str, run_id: str, index: RunIndex
+) -> List[str]:
+    """
+    Checks the checkpoint files against the hashes in the index and moves the
+    broken ones to `CORRUPT_DIR`, so that `--recover` starts from the latest
+    intact checkpoint.
+
+    A file that has not changed since it was hashed must match its hash. A
+    file that was written after it was last hashed, e.g., just before the
+    run was preempted, must at least load.
+
+    Returns:
+        The names of the files that were moved.
+    """
+    recorded = index.file_hashes(run_id)
+    broken = set()
+
+    for name in checkpoint_files(serialization_dir):
+        path = os.path.join(serialization_dir, name)
+        stat = os.stat(path)
+        known = recorded.get(name)
+
+        if known is not None and known[:2] == (stat.st_size, stat.st_mtime):
+            intact = hash_file(path) == known[2]
+        else:
+            intact = _loads(path)
+
+        if not intact:
+            broken.add(name)
+
+    # model and training states are only usable in pairs
+    for name in list(broken):
+        for prefix, partner in [
+            ("model_state_", "training_state_"),
+            ("training_state_", "model_state_"),
+        ]:
+            if name.startswith(prefix):
+                partner_name = partner + name[len(prefix) :]
+
+                if os.path.exists(os.path.join(serialization_dir, partner_name)):
+                    broken.add(partner_name)
+
+    if broken:
+        corrupt_dir = os.path.join(serialization_dir, CORRUPT_DIR)
+        os.makedirs(corrupt_dir, exist_ok=True)
+
+        for name in sorted(broken):
+            logger.warning(f"Moving broken checkpoint {name} to {corrupt_dir}")
+            shutil.move(
+                os.path.join(serialization_dir, name),
+                os.path.join(corrupt_dir, name),
+            )
+
+    return sorted(broken)
@@ -1,5 +1,8 @@
 from typing import List, Tuple, Union, Dict, Any, Optional, Callable
+from typing import Iterator
+from contextlib import contextmanager
 import os
+import shortuuid
 
 
 def read_from_env(
@@ -13,3 +16,30 @@ def read_from_env(
         val = val_str
 
     return val
+
+
+def generate_run_id() -> str:
+    # ref: wandb/sdk/lib/runid.py
+    run_gen = shortuuid.ShortUUID(
+        alphabet=list("0123456789abcdefghijklmnopqrstuvwxyz")
+    )
+
+    return run_gen.random(8)  # type: ignore[no-untyped-call]
+
+
+@contextmanager
+def environment_variables(env_vars: Dict[str, str]) -> Iterator[None]:
+    """
+    Sets `env_vars` in `os.environ` and restores the previous values, or
+    removes them, on exit.
+    """
+    previous = {key: os.environ.get(key) for key in env_vars}
+    os.environ.update(env_vars)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
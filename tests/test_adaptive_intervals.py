@@ -0,0 +1,55 @@
+from wandb_allennlp.training.callbacks.adaptive import AdaptiveIntervals
+
+
+def test_intervals_follow_the_cost():
+    adaptive = AdaptiveIntervals(
+        {"summary": 100, "distribution": 100}, max_overhead=0.1, smoothing=1.0
+    )
+    adaptive.record_step(0.1)
+    # 0.1 * 0.1 / 2 = 5ms per step for each category
+    adaptive.record_logging(["summary"], 0.001)
+    adaptive.record_logging(["distribution"], 0.5)
+    assert adaptive.intervals == {"summary": 1, "distribution": 100}
+    # the step got faster, so logging is relatively more expensive
+    adaptive.record_step(0.01)
+    adaptive.record_logging(["summary", "distribution"], 0.002)
+    assert adaptive.intervals == {"summary": 2, "distribution": 2}
+
+
+def test_min_points_per_epoch():
+    adaptive = AdaptiveIntervals(
+        {"summary": 10}, max_overhead=0.01, min_points_per_epoch=5
+    )
+    adaptive.set_steps_per_epoch(100)
+    adaptive.record_step(0.01)
+    adaptive.record_logging(["summary"], 1.0)
+    assert adaptive.intervals == {"summary": 20}
+
+
+def test_batch_size_is_due_by_the_batch_number_in_the_epoch():
+    from types import SimpleNamespace
+    from wandb_allennlp.training.callbacks.log_to_wandb import (
+        AllennlpWandbCallback,
+    )
+
+    callback = SimpleNamespace(
+        _summary_interval=100,
+        _distribution_interval=None,
+        _batch_size_interval=10,
+        _INTERVAL_ATTRIBUTES=AllennlpWandbCallback._INTERVAL_ATTRIBUTES,
+        adaptive_intervals=SimpleNamespace(intervals={"batch_size": 20}),
+    )
+    trainer = SimpleNamespace(_total_batches_completed=205)
+
+    def due(batch_number):
+        return AllennlpWandbCallback._due_logging(
+            callback, trainer, batch_number
+        )
+
+    assert due(7) == []
+    assert due(10) == ["batch_size"]
+    # the next batch number in the epoch is 10, unlike the global 206
+    AllennlpWandbCallback._apply_intervals(callback, trainer, 9)
+    assert callback._batch_size_interval == 10
+    AllennlpWandbCallback._apply_intervals(callback, trainer, 10)
+    assert callback._batch_size_interval == 20
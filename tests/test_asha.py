@@ -0,0 +1,61 @@
+import sqlite3
+from contextlib import closing
+from wandb_allennlp.sweep.asha import ASHACoordinator, geometric_rungs
+
+
+def test_geometric_rungs():
+    assert geometric_rungs(1, 30, 3) == [1, 3, 9, 27]
+    assert geometric_rungs(2, 5, 2) == [2, 4]
+
+
+def test_coordinator_keeps_top_trials(tmp_path):
+    coordinator = ASHACoordinator(str(tmp_path / "asha.sqlite"), 3)
+    # not enough trials at the rung to stop anything
+    assert coordinator.report("a", 1, 0.1)
+    assert coordinator.report("b", 1, 0.2)
+    # 3 trials: only the best one continues
+    assert not coordinator.report("c", 1, 0.15)
+    assert coordinator.report("d", 1, 0.3)
+    assert not coordinator.report("e", 1, float("nan"))
+    # rungs are independent and the store is shared
+    other = ASHACoordinator(str(tmp_path / "asha.sqlite"), 3)
+    assert other.report("d", 3, 0.5)
+    assert not other.report("f", 1, 0.12)
+    # 7 trials at rung 1: the top 2 continue
+    assert other.report("g", 1, 0.25)
+
+
+def test_rung_without_validation_metrics_is_not_reported(tmp_path):
+    import torch
+    from types import SimpleNamespace
+    from wandb_allennlp.training.callbacks.subcallbacks import (
+        ASHAEarlyStopping,
+    )
+
+    store = str(tmp_path / "asha.sqlite")
+    callback = ASHAEarlyStopping(
+        store=store, rungs=[1, 2], min_trials_per_rung=1
+    )
+    trainer = SimpleNamespace(
+        _num_epochs=2,
+        _metric_tracker=SimpleNamespace(
+            tracked_metrics=[(1, "accuracy")], _patience=3
+        ),
+        model=torch.nn.Linear(1, 1),
+    )
+    super_callback = SimpleNamespace(
+        wandb=SimpleNamespace(run=SimpleNamespace(id="a"))
+    )
+    callback.on_start_(super_callback, trainer)
+
+    # e.g., validation is skipped in this epoch
+    callback.on_epoch_(super_callback, trainer, {"training_loss": 1.0}, 0)
+    assert trainer._metric_tracker._patience == 3
+    callback.on_epoch_(
+        super_callback, trainer, {"validation_accuracy": 0.9}, 1
+    )
+
+    with closing(sqlite3.connect(store)) as connection:
+        assert connection.execute("SELECT * FROM rungs").fetchall() == [
+            ("a", 2, 0.9)
+        ]
@@ -0,0 +1,67 @@
+"""
+Benchmarks, which are skipped unless WANDB_ALLENNLP_BENCHMARKS is set:
+
+    WANDB_ALLENNLP_BENCHMARKS=1 pytest -m benchmark
+"""
+import copy
+import os
+import timeit
+import pytest
+from wandb_allennlp.overrides import apply_overrides, validate_overrides
+from wandb_allennlp.training.callbacks.utils import filter_config, flatten_dict
+
+pytestmark = [
+    pytest.mark.benchmark,
+    pytest.mark.skipif(
+        not os.environ.get("WANDB_ALLENNLP_BENCHMARKS"),
+        reason="set WANDB_ALLENNLP_BENCHMARKS to run the benchmarks",
+    ),
+]
+
+
+def best_time(function, number=5):
+    return min(timeit.repeat(function, number=1, repeat=number))
+
+
+def test_indexed_overrides_are_faster_than_with_overrides():
+    params = pytest.importorskip("allennlp.common.params")
+    layers = [
+        {"hidden_size": 64, "dropout": 0.1, "activation": "relu"}
+        for _ in range(500)
+    ]
+    config = {"model": {"encoder": {"layers": layers}}}
+    overrides = {
+        f"model.encoder.layers.{i}.{key}": value
+        for i in range(500)
+        for key, value in [("hidden_size", 128), ("dropout", 0.2)]
+    }
+
+    def override():
+        copied = copy.deepcopy(config)
+        validate_overrides(copied, overrides)
+        apply_overrides(copied, overrides)
+
+        return copied
+
+    def with_overrides():
+        return params.with_overrides(copy.deepcopy(config), overrides)
+
+    assert override() == with_overrides()
+    elapsed = best_time(override)
+    baseline = best_time(with_overrides)
+
+    assert elapsed < baseline, f"{elapsed:.4f}s vs. {baseline:.4f}s"
+
+
+def test_excluded_keys_are_not_flattened():
+    config = {
+        "model": {"type": "basic", "dropout": 0.1},
+        "embeddings": [[0.1] * 50 for _ in range(2000)],
+    }
+
+    flattened = best_time(lambda: flatten_dict(config))
+    filtered = best_time(
+        lambda: filter_config(config, exclude_keys="embeddings")
+    )
+
+    assert filtered < flattened / 10, f"{filtered:.4f}s vs. {flattened:.4f}s"
@@ -0,0 +1,154 @@
+import time
+import torch
+from wandb_allennlp.training.callbacks.best_weights import HostWeightsSnapshot
+
+
+def medium_model():
+    # about 25M parameters
+    return torch.nn.Sequential(
+        *[torch.nn.Linear(1024, 1024) for _ in range(24)],
+        torch.nn.BatchNorm1d(1024),
+    )
+
+
+def test_snapshot_restores_best_weights():
+    model = medium_model()
+    snapshot = HostWeightsSnapshot()
+    snapshot.save(model)
+    best = {k: v.clone() for k, v in model.state_dict().items()}
+
+    with torch.no_grad():
+        for parameter in model.parameters():
+            parameter.add_(1.0)
+    snapshot.restore(model)
+
+    for name, tensor in model.state_dict().items():
+        assert torch.equal(tensor, best[name])
+
+
+def test_half_precision_snapshot():
+    model = medium_model()
+    snapshot = HostWeightsSnapshot(dtype=torch.float16)
+    snapshot.save(model)
+    best = {k: v.clone() for k, v in model.state_dict().items()}
+    snapshot.restore(model)
+
+    assert snapshot.state["0.weight"].dtype == torch.float16
+    # integer buffers are kept as they are
+    assert snapshot.state["24.num_batches_tracked"].dtype == torch.int64
+    assert model.state_dict()["0.weight"].dtype == torch.float32
+    assert torch.allclose(
+        model.state_dict()["0.weight"], best["0.weight"], atol=1e-3
+    )
+
+
+def test_restoring_from_memory_is_faster_than_from_disk(tmp_path):
+    model = medium_model()
+    path = tmp_path / "best.th"
+    torch.save(model.state_dict(), path)
+    snapshot = HostWeightsSnapshot()
+    snapshot.save(model)
+
+    def timed(restore):
+        times = []
+
+        for _ in range(3):
+            start = time.perf_counter()
+            restore()
+            times.append(time.perf_counter() - start)
+
+        return min(times)
+
+    from_disk = timed(lambda: model.load_state_dict(torch.load(path)))
+    from_memory = timed(lambda: snapshot.restore(model))
+
+    assert from_memory < from_disk
+
+
+def test_trainer_restores_the_best_weights_from_memory(tmp_path, monkeypatch):
+    from allennlp.data import DataLoader
+    from allennlp.data.vocabulary import Vocabulary
+    from allennlp.models import Model
+    from allennlp.training import GradientDescentTrainer, TrainerCallback
+    from wandb_allennlp.training.callbacks.subcallbacks import (
+        BestWeightsInMemory,
+    )
+
+    class Batches(DataLoader):
+        def __len__(self):
+            return 2
+
+        def __iter__(self):
+            for _ in range(2):
+                yield {"x": torch.randn(4, 3)}
+
+        def index_with(self, vocab):
+            pass
+
+        def set_target_device(self, device):
+            pass
+
+    class Scored(Model):
+        # validation scores of the epochs, the second one is the best
+        scores = [0.5, 0.9, 0.1]
+
+        def __init__(self):
+            super().__init__(Vocabulary())
+            self.linear = torch.nn.Linear(3, 1)
+            self.validations = 0
+
+        def forward(self, x):
+            return {"loss": self.linear(x).pow(2).mean()}
+
+        def get_metrics(self, reset=False):
+            if self.training:
+                return {}
+            score = self.scores[self.validations]
+            self.validations += reset
+
+            return {"score": score}
+
+    class Forward(TrainerCallback):
+        # the hooks that AllennlpWandbCallback forwards
+        def on_start(self, trainer, **kwargs):
+            sub_callback.on_start_(None, trainer)
+
+        def on_epoch(self, trainer, metrics, epoch, **kwargs):
+            sub_callback.on_epoch_(None, trainer, metrics, epoch)
+            weights.append(
+                {k: v.clone() for k, v in trainer.model.state_dict().items()}
+            )
+
+        def on_end(self, trainer, metrics=None, epoch=None, **kwargs):
+            sub_callback.on_end_(None, trainer, metrics, epoch)
+
+    model = Scored()
+    sub_callback = BestWeightsInMemory()
+    weights = []
+    trainer = GradientDescentTrainer(
+        model,
+        torch.optim.SGD(model.parameters(), lr=0.1),
+        Batches(),
+        validation_data_loader=Batches(),
+        validation_metric="+score",
+        num_epochs=3,
+        serialization_dir=str(tmp_path),
+        callbacks=[Forward(str(tmp_path))],
+        enable_default_callbacks=False,
+    )
+
+    def load_from_disk(*args, **kwargs):
+        raise AssertionError("best.th was read")
+
+    monkeypatch.setattr(torch, "load", load_from_disk)
+    trainer.train()
+
+    # best.th is still written for the archive
+    assert (tmp_path / "best.th").exists()
+    assert trainer._metric_tracker.best_epoch == 1
+
+    for name, tensor in model.state_dict().items():
+        assert torch.equal(tensor, weights[1][name])
+        assert not torch.equal(tensor, weights[2][name])
+    # freed in on_end
+    assert sub_callback.snapshot.state == {}
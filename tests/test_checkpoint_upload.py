@@ -0,0 +1,134 @@
+import os
+import threading
+from wandb_allennlp.training.callbacks.checkpoint_upload import (
+    CheckpointUploader,
+)
+
+
+def write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_snapshots_and_retention(tmp_path):
+    serialization_dir = tmp_path / "run"
+    serialization_dir.mkdir()
+    uploads = []
+    deleted = []
+
+    def upload(snapshot_dir, epoch, aliases):
+        files = {}
+
+        for name in sorted(os.listdir(snapshot_dir)):
+            with open(os.path.join(snapshot_dir, name)) as f:
+                files[name] = f.read()
+        uploads.append((epoch, aliases, files))
+
+        return epoch
+
+    uploader = CheckpointUploader(
+        str(serialization_dir),
+        str(serialization_dir / ".uploads"),
+        upload=upload,
+        delete=deleted.append,
+        keep_last=1,
+    )
+    write(serialization_dir / "model_state_e0_b0.th", "m0")
+    write(serialization_dir / "best.th", "b0")
+    uploader.submit(0).result()
+    write(serialization_dir / "model_state_e1_b0.th", "m1")
+    uploader.submit(1).result()
+    # nothing changed
+    assert uploader.submit(1) is None
+    write(serialization_dir / "model_state_e2_b0.th", "m2")
+    write(serialization_dir / "best.th", "b2")
+    uploader.submit(2).result()
+    uploader.close()
+
+    assert uploads == [
+        (
+            0,
+            ["latest", "epoch-0", "best"],
+            {"best.th": "b0", "model_state_e0_b0.th": "m0"},
+        ),
+        (1, ["latest", "epoch-1"], {"model_state_e1_b0.th": "m1"}),
+        (
+            2,
+            ["latest", "epoch-2", "best"],
+            {"best.th": "b2", "model_state_e2_b0.th": "m2"},
+        ),
+    ]
+    # epoch 0 was kept while it was the best one
+    assert deleted == [0, 1]
+    assert [u.epoch for u in uploader.uploaded] == [2]
+    assert not os.path.exists(serialization_dir / ".uploads")
+
+
+def test_snapshot_does_not_change_while_uploading(tmp_path):
+    write(tmp_path / "best.th", "old")
+    started, resume = threading.Event(), threading.Event()
+    contents = []
+
+    def upload(snapshot_dir, epoch, aliases):
+        started.set()
+        resume.wait()
+        with open(os.path.join(snapshot_dir, "best.th")) as f:
+            contents.append(f.read())
+
+    uploader = CheckpointUploader(str(tmp_path), str(tmp_path / "up"), upload)
+    uploader.snapshot(-1)  # best.th is not new anymore
+    write(tmp_path / "best.th", "new!")
+    future = uploader.submit(0)
+    started.wait()
+    # best.th is overwritten in place, the snapshot is a copy
+    write(tmp_path / "best.th", "newer")
+    resume.set()
+    future.result()
+    uploader.close()
+    assert contents == ["new!"]
+
+
+def test_epochs_are_uploaded_after_the_checkpointer_ran(tmp_path):
+    from types import SimpleNamespace
+    from wandb_allennlp.training.callbacks.subcallbacks import (
+        UploadCheckpoints,
+    )
+
+    uploads = {}
+
+    def upload(snapshot_dir, epoch, aliases):
+        for alias in aliases:
+            uploads[alias] = {}
+
+            for name in sorted(os.listdir(snapshot_dir)):
+                with open(os.path.join(snapshot_dir, name)) as f:
+                    uploads[alias][name] = f.read()
+
+    callback = UploadCheckpoints(keep_last=None)
+    callback._upload = upload
+    super_callback = SimpleNamespace(
+        serialization_dir=str(tmp_path), wandb=SimpleNamespace(run=None)
+    )
+    callback.on_start_(super_callback, None)
+
+    # the order of GradientDescentTrainer._try_train()
+    for epoch in range(3):
+        for batch_number in [1, 2]:
+            callback.on_batch_(
+                super_callback, None, [], [], {}, epoch, batch_number, True
+            )
+        callback.on_epoch_(super_callback, None, {}, epoch)
+        # named after the number of completed epochs
+        write(tmp_path / f"model_state_e{epoch + 1}_b0.th", f"m{epoch}")
+
+        if epoch != 1:
+            write(tmp_path / "best.th", f"b{epoch}")
+    callback.on_end_(super_callback, None, epoch=2)
+
+    assert uploads == {
+        "epoch-0": {"best.th": "b0", "model_state_e1_b0.th": "m0"},
+        "epoch-1": {"model_state_e2_b0.th": "m1"},
+        "epoch-2": {"best.th": "b2", "model_state_e3_b0.th": "m2"},
+        "latest": {"best.th": "b2", "model_state_e3_b0.th": "m2"},
+        "best": {"best.th": "b2", "model_state_e3_b0.th": "m2"},
+    }
@@ -0,0 +1,48 @@
+from wandb_allennlp.training.callbacks.utils import (
+    filter_config,
+    flatten_dict,
+    summarize_list,
+)
+
+CONFIG = {
+    "dataset_reader": {"type": "snli", "token_indexers": {"tokens": {}}},
+    "model": {
+        "type": "parameter-tying",
+        "dropout": 0.1,
+        "encoder": {"dropout": 0.2, "hidden_sizes": [64, 64]},
+        "labels": [f"label_{i}" for i in range(1000)],
+    },
+    "trainer": {"optimizer": {"type": "adam", "lr": 0.001}},
+}
+
+
+def test_without_filters_it_flattens():
+    assert filter_config(CONFIG) == flatten_dict(CONFIG)
+
+
+def test_include_and_exclude_keys():
+    config = filter_config(
+        CONFIG,
+        include_keys="model.encoder,*.lr, *.type",
+        exclude_keys=["dataset_reader"],
+    )
+
+    assert config == {
+        "model.type": "parameter-tying",
+        "model.encoder.dropout": 0.2,
+        "model.encoder.hidden_sizes.0": 64,
+        "model.encoder.hidden_sizes.1": 64,
+        "trainer.optimizer.type": "adam",
+        "trainer.optimizer.lr": 0.001,
+    }
+
+
+def test_long_lists_are_summarized():
+    config = filter_config(CONFIG, max_list_length=100)
+    summary = summarize_list(CONFIG["model"]["labels"])
+
+    assert config["model.labels.length"] == 1000
+    assert config["model.labels.sha256"] == summary["sha256"]
+    assert not any(key.startswith("model.labels.0") for key in config)
+    assert config["model.encoder.hidden_sizes.1"] == 64
+    assert summary != summarize_list(CONFIG["model"]["labels"][:-1])
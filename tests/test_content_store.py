@@ -0,0 +1,65 @@
+import os
+from wandb_allennlp.content_store import ContentStore, unshare
+
+
+def make_run_dir(path, vocabulary):
+    (path / "vocabulary").mkdir(parents=True)
+    (path / "vocabulary" / "tokens.txt").write_text(vocabulary)
+    (path / "config.json").write_text("{}")
+
+    return str(path)
+
+
+def test_identical_files_are_stored_once(tmp_path):
+    store = ContentStore(str(tmp_path / "store"))
+    vocabularies = {"a": "x\ny\n", "b": "x\ny\n", "c": "z\n"}
+    runs = [
+        make_run_dir(tmp_path / name, vocabulary)
+        for name, vocabulary in vocabularies.items()
+    ]
+
+    assert store.share_files(runs[0], ["vocabulary/*"]) in [0, 4]
+    assert store.share_files(runs[1], ["vocabulary/*"]) == 4
+    store.share_files(runs[2], ["vocabulary/*"])
+
+    assert len(os.listdir(tmp_path / "store")) == 2
+    tokens = tmp_path / "b" / "vocabulary" / "tokens.txt"
+    assert tokens.read_text() == "x\ny\n"
+    # the config was not shared
+    assert os.stat(tmp_path / "a" / "config.json").st_nlink == 1
+    # sharing again does not change anything
+    assert store.share_files(runs[1], ["vocabulary/*"]) == 0
+
+
+def test_unshare_and_collect_garbage(tmp_path):
+    store = ContentStore(str(tmp_path / "store"))
+    run = make_run_dir(tmp_path / "a", "x\n")
+    store.share_files(run, ["vocabulary/*"])
+    tokens = tmp_path / "a" / "vocabulary" / "tokens.txt"
+
+    unshare(run, str(tmp_path / "store"))
+    assert os.stat(tokens).st_nlink == 1
+    tokens.write_text("changed\n")
+    (stored,) = [
+        os.path.join(root, name)
+        for root, _, files in os.walk(tmp_path / "store")
+        for name in files
+    ]
+    assert open(stored).read() == "x\n"
+
+    assert store.collect_garbage() == 2
+    assert not os.path.exists(stored)
+
+
+def test_unshare_keeps_other_hardlinks(tmp_path):
+    store = ContentStore(str(tmp_path / "store"))
+    run = make_run_dir(tmp_path / "a", "x\n")
+    store.share_files(run, ["vocabulary/*"])
+    # like allennlp's hardlink_or_copy of the last checkpoint to best.th
+    checkpoint = tmp_path / "a" / "model_state_e1_b0.th"
+    checkpoint.write_text("weights")
+    os.link(checkpoint, tmp_path / "a" / "best.th")
+
+    assert unshare(run, str(tmp_path / "store")) == 1
+    assert os.stat(checkpoint).st_nlink == 2
+    assert unshare(run, str(tmp_path / "store")) == 0
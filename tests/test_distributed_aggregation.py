@@ -0,0 +1,104 @@
+import math
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from wandb_allennlp.training.callbacks.distributed import (
+    RankAggregator,
+    all_gather_scalars,
+    summarize_ranks,
+)
+
+WORLD_SIZE = 3
+
+
+def _worker(rank, init_file):
+    dist.init_process_group(
+        "gloo",
+        init_method=f"file://{init_file}",
+        rank=rank,
+        world_size=WORLD_SIZE,
+    )
+
+    try:
+        gathered = all_gather_scalars({"b": 2 * rank, "a": rank})
+        assert gathered == {"a": [0.0, 1.0, 2.0], "b": [0.0, 2.0, 4.0]}
+
+        aggregator = RankAggregator(["loss", "accuracy"])
+
+        for _ in range(rank + 1):
+            aggregator.count(8)
+        metrics = {"loss": float(rank), "batch_loss": 10.0}
+
+        if rank != 0:
+            metrics["accuracy"] = 0.5
+        aggregated = aggregator.aggregate(metrics)
+        assert aggregated["loss"] == 1.0
+        # missing on rank 0
+        assert aggregated["accuracy"] == 0.5
+        assert "batch_loss" not in aggregated
+        assert aggregated["instances_per_second"] > 0
+        assert (
+            aggregated["seconds_per_batch_max"]
+            >= aggregated["seconds_per_batch"]
+        )
+        # the counters start over after every aggregation
+        assert aggregator._num_batches == 0
+
+        # the metrics of rank 0 are aggregated on all the workers
+        aggregator = RankAggregator()
+        metrics = {"loss": float(rank), "is_best": True}
+
+        if rank == 2:
+            metrics["extra_loss"] = 1.0
+        assert set(aggregator.aggregate(metrics)) == {
+            "loss",
+            "instances_per_second",
+            "seconds_per_batch",
+            "seconds_per_batch_max",
+        }
+        # and kept for the next calls
+        assert math.isnan(aggregator.aggregate({"other": 1.0})["loss"])
+    finally:
+        dist.destroy_process_group()
+
+
+def test_aggregation_across_ranks(tmp_path):
+    mp.spawn(
+        _worker, args=(str(tmp_path / "init"),), nprocs=WORLD_SIZE, join=True
+    )
+
+
+def _straggler_worker(rank, init_file):
+    dist.init_process_group(
+        "gloo",
+        init_method=f"file://{init_file}",
+        rank=rank,
+        world_size=WORLD_SIZE,
+    )
+
+    try:
+        summary = summarize_ranks(
+            {"step_time": 1.0 if rank == 1 else 0.25, "data_time": 0.1}
+        )
+        assert summary["step_time_max"] == 1.0
+        assert summary["step_time_min"] == 0.25
+        assert summary["step_time_mean"] == 0.5
+        assert summary["step_time_skew"] == 2.0
+        assert summary["step_time_slowest_rank"] == 1
+        assert math.isclose(summary["data_time_skew"], 1.0)
+    finally:
+        dist.destroy_process_group()
+
+
+def test_straggler_summary(tmp_path):
+    mp.spawn(
+        _straggler_worker,
+        args=(str(tmp_path / "init"),),
+        nprocs=WORLD_SIZE,
+        join=True,
+    )
+
+
+def test_straggler_summary_single_process():
+    summary = summarize_ranks({"step_time": 0.5})
+    assert summary["step_time_skew"] == 1.0
+    assert summary["step_time_slowest_rank"] == 0
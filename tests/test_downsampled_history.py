@@ -0,0 +1,60 @@
+import os
+import struct
+from wandb_allennlp.training.callbacks.history import DownsampledHistory
+from wandb_allennlp.training.callbacks.scalar_log import (
+    ScalarLogWriter,
+    SCALAR_LOG_NAME,
+    SCALAR_NAMES_NAME,
+    read_scalar_log,
+)
+
+
+def test_buckets_grow():
+    history = DownsampledHistory(bucket_size=2, points_per_resolution=2)
+    uploaded = [history.add({"train/loss": float(i)}) for i in range(12)]
+    points = [u for u in uploaded if u]
+    # 2 buckets of 2 values, then buckets of 4
+    assert [i for i, u in enumerate(uploaded) if u] == [1, 3, 7, 11]
+    assert points[0] == {
+        "train/loss": 0.5,
+        "train/loss_min": 0.0,
+        "train/loss_max": 1.0,
+    }
+    assert points[2]["train/loss"] == 5.5
+    assert history.add({"train/loss": 100.0}) == {}
+    assert history.flush() == {"train/loss": 100.0}
+    assert history.flush() == {}
+
+
+def test_scalar_log_writer(tmp_path):
+    writer = ScalarLogWriter(str(tmp_path))
+    writer.write(1, {"a": 1.0, "b": 2.0})
+    writer.close()
+    # recovering continues the same log
+    writer = ScalarLogWriter(str(tmp_path))
+    writer.write(2, {"b": 3.0, "c": 4.0})
+    writer.close()
+    with open(tmp_path / SCALAR_NAMES_NAME) as f:
+        assert f.read().split() == ["a", "b", "c"]
+    assert os.path.getsize(tmp_path / SCALAR_LOG_NAME) == 4 * 16
+    with open(tmp_path / SCALAR_LOG_NAME, "rb") as f:
+        records = list(struct.iter_unpack("<QIf", f.read()))
+    assert records == [(1, 0, 1.0), (1, 1, 2.0), (2, 1, 3.0), (2, 2, 4.0)]
+
+
+def test_read_scalar_log(tmp_path):
+    writer = ScalarLogWriter(str(tmp_path))
+
+    for step in range(5):
+        writer.write(step, {"loss": step / 2, "acc": 1.0})
+    writer.write(5, {"loss": 0.0})
+    writer.close()
+    # a record that was cut off by a crash
+    with open(tmp_path / SCALAR_LOG_NAME, "ab") as f:
+        f.write(b"\0" * 5)
+    log = read_scalar_log(str(tmp_path))
+    steps, values = log["loss"]
+    assert steps.tolist() == [0, 1, 2, 3, 4, 5]
+    assert values.tolist() == [0.0, 0.5, 1.0, 1.5, 2.0, 0.0]
+    assert log["acc"][1].tolist() == [1.0] * 5
+    assert list(read_scalar_log(str(tmp_path), names=["acc"])) == ["acc"]
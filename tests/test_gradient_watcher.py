@@ -0,0 +1,66 @@
+import math
+import torch
+from wandb_allennlp.training.callbacks.watch import GradientWatcher
+
+
+def make_model():
+    torch.manual_seed(0)
+
+    return torch.nn.Sequential(
+        torch.nn.Linear(4, 8), torch.nn.ReLU(), torch.nn.Linear(8, 1)
+    )
+
+
+def train_step(model, watcher, num_micro_batches=1):
+    model.zero_grad()
+
+    for _ in range(num_micro_batches):
+        model(torch.randn(5, 4)).sum().backward()
+
+    return watcher.step()
+
+
+def test_only_sampled_steps_are_hooked():
+    model = make_model()
+    watcher = GradientWatcher(model, modules=r"^2$", interval=3)
+    assert list(watcher.parameters) == ["2.weight", "2.bias"]
+    assert not watcher.is_armed
+    assert train_step(model, watcher) == {}
+    assert not watcher.is_armed
+    assert train_step(model, watcher) == {}
+    # the hooks are only registered for the third step
+    assert watcher.is_armed
+    stats = train_step(model, watcher)
+    assert not watcher.is_armed
+    assert set(stats) == {
+        f"{kind}/2.{p}/{stat}"
+        for p in ["weight", "bias"]
+        for kind, stat in [
+            ("gradients", "norm"),
+            ("gradients", "abs_max"),
+            ("gradients", "non_finite"),
+            ("parameters", "norm"),
+        ]
+    }
+    assert math.isclose(
+        stats["gradients/2.weight/norm"],
+        model[2].weight.grad.norm().item(),
+        rel_tol=1e-5,
+    )
+    assert math.isclose(
+        stats["parameters/2.bias/norm"], model[2].bias.norm().item()
+    )
+
+
+def test_micro_batches_are_accumulated():
+    model = make_model()
+    watcher = GradientWatcher(model, interval=1)
+    stats = train_step(model, watcher, num_micro_batches=3)
+    assert len(stats) == 4 * 4
+    assert stats["gradients/0.weight/non_finite"] == 0
+    # same as the accumulated gradient
+    assert math.isclose(
+        stats["gradients/0.weight/abs_max"],
+        model[0].weight.grad.abs().max().item(),
+        rel_tol=1e-5,
+    )
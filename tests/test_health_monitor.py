@@ -0,0 +1,110 @@
+import math
+import pytest
+import torch
+from wandb_allennlp.training.callbacks.health import (
+    SeriesStats,
+    gradient_norm,
+)
+
+
+@pytest.mark.parametrize("as_tensor", [False, True])
+def test_series_stats(as_tensor):
+    stats = SeriesStats(spike_factor=5.0, warmup=3)
+
+    for value in [1.0, 2.0, 1.0, float("nan"), 2.0, 100.0, float("inf")]:
+        stats.add(torch.tensor(value) if as_tensor else value)
+
+    assert stats.read() == {
+        "nonfinite": 2.0,
+        "spikes": 1.0,
+        "mean": pytest.approx(106 / 5),
+        "max": 100.0,
+    }
+    # reset, but the moving average is kept
+    assert stats.read() == {}
+    stats.add(30.0)
+    assert stats.read()["spikes"] == 0.0
+    stats.add(torch.tensor(1000.0))
+    assert stats.read()["spikes"] == 1.0
+
+
+def test_spikes_are_not_counted_during_warmup():
+    stats = SeriesStats(spike_factor=2.0, warmup=10)
+
+    for value in [1.0, 100.0, 1.0]:
+        stats.add(value)
+
+    assert stats.read()["spikes"] == 0.0
+
+
+def test_gradient_norm():
+    model = torch.nn.Sequential(torch.nn.Linear(4, 3), torch.nn.Linear(3, 1))
+    model(torch.randn(5, 4)).sum().backward()
+    expected = torch.nn.utils.clip_grad_norm_(model.parameters(), math.inf)
+
+    assert torch.allclose(gradient_norm(model.parameters()), expected)
+    assert torch.allclose(
+        gradient_norm(model.parameters(), scale=torch.tensor(4.0)),
+        expected / 4,
+    )
+    assert gradient_norm(torch.nn.Linear(2, 2).parameters()) is None
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="needs a GPU")
+def test_no_synchronization_per_value():
+    stats = SeriesStats(spike_factor=10.0, warmup=0)
+    model = torch.nn.Linear(8, 8).cuda()
+    model(torch.randn(4, 8, device="cuda")).sum().backward()
+    torch.cuda.set_sync_debug_mode("error")
+    try:
+        for _ in range(10):
+            stats.add(gradient_norm(model.parameters()))
+    finally:
+        torch.cuda.set_sync_debug_mode("default")
+
+    assert stats.read()["nonfinite"] == 0.0
+
+
+@pytest.mark.parametrize("grad_norm", [False, True])
+def test_gradient_norm_with_mixed_precision(grad_norm):
+    from types import SimpleNamespace
+    from wandb_allennlp.training.callbacks.subcallbacks import HealthMonitor
+
+    torch.manual_seed(0)
+    model = torch.nn.Linear(4, 1)
+    x = torch.randn(8, 4)
+    model(x).pow(2).mean().backward()
+    expected = gradient_norm(model.parameters()).item()
+    model.zero_grad()
+    # what the trainer does
+    scaler = torch.amp.GradScaler("cpu", init_scale=2.0**16)
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.0)
+    scaler.scale(model(x).pow(2).mean()).backward()
+    # with `grad_norm: true`, the norm of the scaled gradients
+    batch_grad_norm = (
+        gradient_norm(model.parameters()).item() if grad_norm else None
+    )
+    scaler.step(optimizer)
+    scaler.update()
+
+    monitor = HealthMonitor(interval=100)
+    trainer = SimpleNamespace(
+        _scaler=scaler,
+        _grad_norm=grad_norm,
+        model=model,
+        _total_batches_completed=1,
+    )
+    monitor.enabled = True
+    monitor.on_batch_(
+        None,
+        trainer,
+        [],
+        [],
+        {"batch_loss": 1.0},
+        0,
+        1,
+        True,
+        batch_grad_norm=batch_grad_norm,
+    )
+
+    assert monitor.grad_norm.read()["mean"] == pytest.approx(expected)
@@ -0,0 +1,56 @@
+from wandb_allennlp.training.callbacks.live_sync import LiveFileSync
+
+
+def read_chunks(paths):
+    data = b""
+
+    for path in paths:
+        with open(path, "rb") as f:
+            data += f.read()
+
+    return data
+
+
+def test_only_appended_bytes_are_uploaded(tmp_path):
+    log = tmp_path / "run" / "out.log"
+    log.parent.mkdir()
+    uploaded = []
+    sync = LiveFileSync(
+        str(tmp_path / "run"),
+        ["*.log"],
+        str(tmp_path / "upload"),
+        save=uploaded.append,
+    )
+    log.write_text("first\n")
+    assert sync.sync() == 6
+    assert sync.sync() == 0
+    with open(log, "a") as f:
+        f.write("second\n")
+    assert sync.sync() == 7
+    assert [p.rsplit("/", 1)[-1] for p in uploaded] == [
+        "out.log.000000",
+        "out.log.000001",
+    ]
+    assert read_chunks(uploaded) == b"first\nsecond\n"
+    # truncated files start over
+    log.write_text("new\n")
+    sync.sync()
+    assert read_chunks(uploaded[2:]) == b"new\n"
+
+
+def test_bandwidth_limit(tmp_path):
+    (tmp_path / "out.log").write_bytes(b"x" * 1000)
+    uploaded = []
+    sync = LiveFileSync(
+        str(tmp_path),
+        ["out.log"],
+        str(tmp_path / "upload"),
+        save=uploaded.append,
+        min_interval=1.0,
+        max_bytes_per_second=100,
+    )
+    assert sync.sync() == 100
+    # the rest is uploaded at the end
+    sync.stop()
+    assert sync.bytes_uploaded == 1000
+    assert read_chunks(uploaded) == b"x" * 1000
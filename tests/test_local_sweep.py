@@ -0,0 +1,58 @@
+import yaml
+from wandb_allennlp.sweep.controller import LocalSweepController
+from wandb_allennlp.sweep.scheduler import Trial
+
+
+def load_sweep_config():
+    with open("parameter-tying_sweep_v1.0.0.yaml") as f:
+        return yaml.safe_load(f)
+
+
+def test_grid(tmp_path):
+    config = load_sweep_config()
+    config["method"] = "grid"
+    config["parameters"]["env.a"] = {"values": [1.0, 2.0]}
+    controller = LocalSweepController(config, str(tmp_path / "store.jsonl"))
+    trials = []
+
+    while True:
+        trial = controller.next_trial()
+
+        if trial is None:
+            break
+        trials.append(trial)
+    # 2 values of a * 2 bool_values * 4 int_values
+    assert len(trials) == 16
+    assert "--env.bool_value=True" in trials[0].command
+    assert "--model.d=1" in trials[0].command
+
+
+def test_random_is_deterministic(tmp_path):
+    config = load_sweep_config()
+    config["method"] = "random"
+    params = [
+        LocalSweepController(
+            config, str(tmp_path / f"{i}.jsonl"), seed=0, count=5
+        ).sample_random()
+        for i in range(2)
+    ]
+    assert params[0] == params[1]
+    assert 1 <= params[0]["env.a"] <= 10
+
+
+def test_bayes_uses_results_and_resumes(tmp_path):
+    store = str(tmp_path / "store.jsonl")
+    controller = LocalSweepController(
+        load_sweep_config(), store, seed=0, num_initial_random=3
+    )
+
+    for i in range(6):
+        params = controller.next_params()
+        trial = Trial(str(i), [], params, {})
+        # fake the metric instead of reading it from a serialization dir
+        controller.read_metric = lambda trial_id: (params["env.a"] - 3) ** 2
+        controller.on_trial_end(trial, 0)
+    assert 1 <= controller.next_params()["env.a"] <= 10
+
+    resumed = LocalSweepController(load_sweep_config(), store)
+    assert len(resumed.history) == 6
@@ -0,0 +1,81 @@
+import os
+import pytest
+import torch
+from wandb_allennlp.mmap_archive import (
+    ALIGNMENT,
+    read_tensors,
+    write_mmap_archive,
+    write_tensors,
+)
+
+
+def test_tensors_round_trip(tmp_path):
+    tensors = {
+        "weight": torch.randn(3, 5),
+        "transposed": torch.randn(5, 3).t(),
+        "half": torch.randn(7, dtype=torch.float16),
+        "bfloat": torch.randn(2, 2).to(torch.bfloat16),
+        "steps": torch.tensor(12345678901, dtype=torch.int64),
+        "mask": torch.tensor([True, False, True]),
+        "empty": torch.zeros(0, 4),
+    }
+    write_tensors(tensors, str(tmp_path))
+    loaded = read_tensors(str(tmp_path))
+
+    assert list(loaded) == list(tensors)
+
+    for name, tensor in tensors.items():
+        assert loaded[name].dtype == tensor.dtype
+        assert torch.equal(loaded[name], tensor)
+        offset = loaded[name].storage_offset() * tensor.element_size()
+        assert offset % ALIGNMENT == 0
+    # copy-on-write: the archive does not change
+    loaded["weight"].zero_()
+    assert torch.equal(read_tensors(str(tmp_path))["weight"], tensors["weight"])
+
+
+def test_write_mmap_archive(tmp_path):
+    serialization_dir = tmp_path / "run"
+    (serialization_dir / "vocabulary").mkdir(parents=True)
+    (serialization_dir / "vocabulary" / "tokens.txt").write_text("a\n")
+    (serialization_dir / "config.json").write_text("{}")
+    (serialization_dir / "embeddings.txt").write_text("a 1.0\n")
+    state = {"linear.weight": torch.randn(2, 2)}
+    torch.save(state, serialization_dir / "best.th")
+
+    archive_dir = write_mmap_archive(
+        str(serialization_dir), include_in_archive=["*.txt"]
+    )
+
+    assert sorted(os.listdir(archive_dir)) == [
+        "config.json",
+        "embeddings.txt",
+        "vocabulary",
+        "weights.bin",
+        "weights.json",
+    ]
+    assert torch.equal(
+        read_tensors(archive_dir)["linear.weight"], state["linear.weight"]
+    )
+
+    with pytest.raises(FileNotFoundError):
+        write_mmap_archive(str(serialization_dir), weights="missing.th")
+
+
+def test_callback_skips_the_archive_without_best_weights(tmp_path, caplog):
+    from types import SimpleNamespace
+    from wandb_allennlp.training.callbacks.log_to_wandb import (
+        AllennlpWandbCallback,
+    )
+
+    callback = SimpleNamespace(
+        serialization_dir=str(tmp_path), include_in_archive=None
+    )
+    # training failed before best.th was written
+    AllennlpWandbCallback._write_mmap_archive(callback)
+    assert not (tmp_path / "model.mmap").exists()
+
+    # errors are logged, so that close() goes on
+    (tmp_path / "best.th").write_text("not a state dict")
+    AllennlpWandbCallback._write_mmap_archive(callback)
+    assert "Could not write the memory-mapped archive" in caplog.text
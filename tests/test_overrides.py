@@ -0,0 +1,279 @@
+import copy
+import json
+import pytest
+from wandb_allennlp.overrides import (
+    ResolvedConfigCache,
+    apply_overrides,
+    compatible_types,
+    compile_path,
+    evaluate_config,
+    validate_overrides,
+)
+
+CONFIG = {
+    "model": {
+        "type": "parameter-tying",
+        "a": 1,
+        "dropout": 0.1,
+        "bool_value": True,
+        "embedder": {"type": "basic"},
+        "encoder": None,
+    },
+    "data_loader": {"batch_size": 2},
+    "trainer": {
+        "optimizer": {"type": "adam", "lr": 0.001},
+        "callbacks": [{"type": "wandb_allennlp", "files_to_save": []}],
+    },
+}
+
+
+def test_valid_overrides():
+    new_keys = validate_overrides(
+        CONFIG,
+        {
+            "model.a": 2.5,
+            "model.dropout": 0,
+            "model.bool_value": False,
+            "model.embedder": "pass_through",
+            "model.encoder": {"type": "lstm"},
+            "model.new_key": 1,
+            "trainer.callbacks.0.files_to_save": ["*.th"],
+            "trainer.optimizer": {"type": "sgd"},
+        },
+    )
+
+    assert new_keys == ["model.new_key"]
+
+
+def test_invalid_overrides_are_all_reported():
+    with pytest.raises(ValueError) as excinfo:
+        validate_overrides(
+            CONFIG,
+            {
+                "modle.a": 1,
+                "trainer.callbacks.1.type": "other",
+                "trainer.callbacks.first.type": "other",
+                "model.a.value": 3,
+                "model.bool_value": 1,
+                "data_loader.batch_size": "large",
+            },
+        )
+    message = str(excinfo.value)
+
+    assert "modle.a: the config has no key 'modle'" in message
+    assert "'1' is not an index of trainer.callbacks" in message
+    assert "'first' is not an index of trainer.callbacks" in message
+    assert "model.a is of type int" in message
+    assert "model.bool_value: a value of type int" in message
+    assert "replace 2 of type int" in message
+
+
+def test_type_check_can_be_skipped():
+    validate_overrides(
+        CONFIG, {"data_loader.batch_size": "large"}, check_types=False
+    )
+
+    with pytest.raises(ValueError):
+        validate_overrides(CONFIG, {"modle.a": 1}, check_types=False)
+
+
+def test_compatible_types():
+    assert compatible_types(None, [1])
+    assert compatible_types(1, 0.5)
+    assert not compatible_types(True, 1)
+    assert not compatible_types(1, False)
+    assert compatible_types("basic", {"type": "basic"})
+    assert not compatible_types([1], {"0": 1})
+
+
+def test_compile_path():
+    assert compile_path("model.encoder.layers.-1.dropout") == (
+        "model",
+        "encoder",
+        "layers",
+        -1,
+        "dropout",
+    )
+    assert compile_path("trainer.callbacks.+") == ("trainer", "callbacks", "+")
+
+
+def test_list_overrides():
+    overrides = {
+        "trainer.callbacks.0.files_to_save": ["*.th"],
+        "trainer.callbacks.-1.type": "log_to_wandb",
+        "trainer.callbacks.+": {"type": "track_epoch_callback"},
+        "model.layers.+": 4,
+    }
+    config = copy.deepcopy(CONFIG)
+    config["model"]["layers"] = [1, 2]
+    validate_overrides(config, overrides)
+    apply_overrides(config, overrides)
+
+    assert config["trainer"]["callbacks"] == [
+        {"type": "log_to_wandb", "files_to_save": ["*.th"]},
+        {"type": "track_epoch_callback"},
+    ]
+    assert config["model"]["layers"] == [1, 2, 4]
+    assert CONFIG["trainer"]["callbacks"][0]["type"] == "wandb_allennlp"
+
+
+def test_invalid_list_overrides():
+    with pytest.raises(ValueError) as excinfo:
+        validate_overrides(
+            CONFIG,
+            {
+                "trainer.callbacks.-2.type": "other",
+                "trainer.callbacks.+.type": "other",
+                "trainer.optimizer.+": 1,
+                "model.+": 1,
+                "data_loader": {"batch_size": 3},
+                "data_loader.batch_size": 4,
+            },
+        )
+    message = str(excinfo.value)
+
+    assert "'-2' is not an index of trainer.callbacks" in message
+    assert "trainer.callbacks.+.type: '+' must be the last part" in message
+    assert "trainer.optimizer is of type dict, so it cannot be" in message
+    assert "model is of type dict" in message
+    assert "data_loader is overridden as a whole" in message
+
+
+def test_many_indexed_overrides():
+    layers = [
+        {"hidden_size": 64, "dropout": 0.1, "activation": "relu"}
+        for _ in range(500)
+    ]
+    config = {"model": {"encoder": {"layers": layers}}}
+    overrides = {
+        f"model.encoder.layers.{i}.{key}": value
+        for i in range(500)
+        for key, value in [("hidden_size", 128), ("dropout", 0.2)]
+    }
+    validate_overrides(config, overrides)
+    apply_overrides(config, overrides)
+
+    assert all(layer["hidden_size"] == 128 for layer in layers)
+    assert all(layer["dropout"] == 0.2 for layer in layers)
+    assert all(layer["activation"] == "relu" for layer in layers)
+
+
+def test_translate_list_indices():
+    from wandb_allennlp.commands.train_with_wandb import translate
+
+    _, overrides, env = translate(
+        [
+            "--model.layers.-1.dropout=0.5",
+            "--trainer.callbacks.+={type: track_epoch_callback}",
+            "--env.some-var=1",
+        ]
+    )
+
+    assert overrides == {
+        "model.layers.-1.dropout": 0.5,
+        "trainer.callbacks.+": {"type": "track_epoch_callback"},
+    }
+    assert env == {"some-var": "1"}
+
+
+def test_resolved_config_cache(tmp_path, monkeypatch):
+    evaluations = []
+
+    def evaluate_config(param_path, environment):
+        evaluations.append(environment.get("a"))
+
+        with open(param_path) as f:
+            return json.load(f), {"imports": [], "env_vars": ["a"]}
+
+    monkeypatch.setattr(
+        "wandb_allennlp.overrides.evaluate_config", evaluate_config
+    )
+    param_path = tmp_path / "config.json"
+    param_path.write_text(json.dumps(CONFIG))
+    cache = ResolvedConfigCache(str(tmp_path / "cache"))
+
+    config = cache.get(str(param_path), {"a": "1"})
+    assert config == CONFIG
+    # copies, which can be modified
+    config["model"]["a"] = 2
+    assert cache.get(str(param_path), {"a": "1"}) == CONFIG
+    assert evaluations == ["1"]
+    cache.get(str(param_path), {"a": "2"})
+    assert evaluations == ["1", "2"]
+
+    # another process finds it on disk
+    other = ResolvedConfigCache(str(tmp_path / "cache"))
+    assert other.get(str(param_path), {"a": "1"}) == CONFIG
+    assert evaluations == ["1", "2"]
+
+    # a changed file is evaluated again
+    param_path.write_text(json.dumps({"model": {}}))
+    assert other.get(str(param_path), {"a": "1"}) == {"model": {}}
+    assert evaluations == ["1", "2", "1"]
+
+
+def test_jsonnet_dependencies(tmp_path, monkeypatch):
+    pytest.importorskip("_jsonnet")
+    monkeypatch.delenv("DATA_PATH", raising=False)
+    (tmp_path / "lib.libsonnet").write_text(
+        "{ path: std.extVar('DATA_PATH') + '/train.jsonl' }"
+    )
+    param_path = tmp_path / "config.jsonnet"
+    param_path.write_text(
+        "local lib = import 'lib.libsonnet';\n"
+        "local name = 'LR';\n"
+        "{ train_data_path: lib.path, lr: std.parseJson(std.extVar(name)) }"
+    )
+    environment = {"DATA_PATH": "/data", "LR": "0.1", "UNUSED": "x"}
+
+    config, dependencies = evaluate_config(str(param_path), environment)
+
+    assert config == {"train_data_path": "/data/train.jsonl", "lr": 0.1}
+    assert dependencies == {
+        "imports": [str(tmp_path / "lib.libsonnet")],
+        # LR is found through the error about the undefined variable
+        "env_vars": ["DATA_PATH", "LR"],
+    }
+
+
+def test_cache_tracks_jsonnet_dependencies(tmp_path, monkeypatch):
+    pytest.importorskip("_jsonnet")
+    evaluations = []
+
+    def evaluate_and_count(param_path, environment):
+        evaluations.append(param_path)
+
+        return evaluate_config(param_path, environment)
+
+    monkeypatch.setattr(
+        "wandb_allennlp.overrides.evaluate_config", evaluate_and_count
+    )
+    monkeypatch.setenv("DATA_PATH", "/data")
+    lib = tmp_path / "lib.libsonnet"
+    lib.write_text("{ dropout: 0.1 }")
+    param_path = tmp_path / "config.jsonnet"
+    param_path.write_text(
+        "local lib = import 'lib.libsonnet';\n"
+        "{ path: std.extVar('DATA_PATH'),"
+        " a: std.parseJson(std.extVar('a')), dropout: lib.dropout }"
+    )
+    cache = ResolvedConfigCache(str(tmp_path / "cache"))
+    path = str(param_path)
+
+    assert cache.get(path, {"a": "1"})["a"] == 1
+    # variables that the config does not read do not matter
+    monkeypatch.setenv("WANDB_RUN_ID", "other")
+    assert cache.get(path, {"a": "1"})["a"] == 1
+    assert len(evaluations) == 1
+    assert cache.get(path, {"a": "2"})["a"] == 2
+    assert len(evaluations) == 2
+    # the variables that it reads do
+    monkeypatch.setenv("DATA_PATH", "/other")
+    assert cache.get(path, {"a": "2"})["path"] == "/other"
+    assert len(evaluations) == 3
+    # and so do imported files
+    lib.write_text("{ dropout: 0.5 }")
+    assert cache.get(path, {"a": "2"})["dropout"] == 0.5
+    assert len(evaluations) == 4
+    assert cache.get(path, {"a": "2"})["dropout"] == 0.5
+    assert len(evaluations) == 4
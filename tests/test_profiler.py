@@ -0,0 +1,70 @@
+import json
+import pytest
+import torch
+from wandb_allennlp.training.callbacks.profiling import (
+    ProfilerWindow,
+    profiler_activities,
+)
+
+
+def train_steps(window, model, num_steps):
+    open_steps = 0
+
+    for _ in range(num_steps):
+        model(torch.randn(8, 16)).sum().backward()
+        open_steps += 1
+
+        if not window.step():
+            break
+
+    return open_steps
+
+
+def test_profiler_window(tmp_path):
+    model = torch.nn.Linear(16, 16)
+    window = ProfilerWindow(
+        str(tmp_path),
+        "epoch_0",
+        wait=1,
+        warmup=1,
+        active=2,
+        repeat=2,
+        activities=["cpu"],
+    )
+
+    assert train_steps(window, model, 20) == 8
+    assert window.profiler is None
+    assert window.files == [
+        "epoch_0_4.pt.trace.json",
+        "epoch_0_4.txt",
+        "epoch_0_8.pt.trace.json",
+        "epoch_0_8.txt",
+    ]
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(window.files)
+
+    with open(tmp_path / "epoch_0_8.pt.trace.json") as f:
+        assert json.load(f)["traceEvents"]
+    table = (tmp_path / "epoch_0_8.txt").read_text()
+    assert "Self CPU" in table
+    assert "aten::addmm" in table
+
+
+def test_closing_during_active_steps_writes_the_profile(tmp_path):
+    window = ProfilerWindow(
+        str(tmp_path), "epoch_1", wait=0, warmup=1, active=10
+    )
+
+    assert train_steps(window, torch.nn.Linear(16, 16), 3) == 3
+    window.close()
+    window.close()
+
+    assert window.files == ["epoch_1_3.pt.trace.json", "epoch_1_3.txt"]
+
+
+def test_profiler_activities():
+    assert profiler_activities(["cpu"]) == [
+        torch.profiler.ProfilerActivity.CPU
+    ]
+
+    with pytest.raises(ValueError):
+        profiler_activities(["tpu"])
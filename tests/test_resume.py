@@ -0,0 +1,67 @@
+import os
+import torch
+from wandb_allennlp.run_index import RunIndex
+from wandb_allennlp.training.resume import (
+    CORRUPT_DIR,
+    checkpoint_files,
+    verify_checkpoints,
+)
+
+
+def write_checkpoints(directory, epochs):
+    for epoch in epochs:
+        for prefix in ["model_state", "training_state"]:
+            torch.save(
+                {"epoch": epoch},
+                os.path.join(directory, f"{prefix}_e{epoch}_b0.th"),
+            )
+
+
+def test_run_index_finds_runs_and_hashes_only_changed_files(tmp_path):
+    index = RunIndex(str(tmp_path / "index.sqlite"))
+    run_dir = tmp_path / "run-1"
+    run_dir.mkdir()
+    write_checkpoints(str(run_dir), [0, 1])
+    index.add_run("abc", str(run_dir))
+
+    assert index.find("abc") == str(run_dir)
+    assert index.find("missing") is None
+    names = checkpoint_files(str(run_dir))
+    assert index.record_files("abc", str(run_dir), names) == 4
+    assert index.record_files("abc", str(run_dir), names) == 0
+
+
+def test_verify_checkpoints_moves_broken_pairs(tmp_path):
+    index = RunIndex(str(tmp_path / "index.sqlite"))
+    run_dir = tmp_path / "run-1"
+    run_dir.mkdir()
+    write_checkpoints(str(run_dir), [0])
+    index.add_run("abc", str(run_dir))
+    index.record_files("abc", str(run_dir), checkpoint_files(str(run_dir)))
+    # the last checkpoint was cut off when the run was preempted
+    write_checkpoints(str(run_dir), [1])
+    with open(run_dir / "model_state_e1_b0.th", "r+b") as f:
+        f.truncate(10)
+
+    moved = verify_checkpoints(str(run_dir), "abc", index)
+
+    assert moved == ["model_state_e1_b0.th", "training_state_e1_b0.th"]
+    assert checkpoint_files(str(run_dir)) == [
+        "model_state_e0_b0.th",
+        "training_state_e0_b0.th",
+    ]
+    assert sorted(os.listdir(run_dir / CORRUPT_DIR)) == moved
+
+
+def test_run_path_falls_back_to_the_environment(monkeypatch):
+    from wandb_allennlp.commands.download_from_wandb import run_path
+
+    monkeypatch.delenv("WANDB_ENTITY", raising=False)
+    monkeypatch.delenv("WANDB_PROJECT", raising=False)
+    # the API fills in its defaults
+    assert run_path("abc") == "abc"
+    assert run_path("abc", project="p") == "p/abc"
+    monkeypatch.setenv("WANDB_ENTITY", "e")
+    monkeypatch.setenv("WANDB_PROJECT", "p")
+    assert run_path("abc") == "e/p/abc"
+    assert run_path("abc", "me", "mine") == "me/mine/abc"
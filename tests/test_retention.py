@@ -0,0 +1,121 @@
+import os
+import time
+import pytest
+from wandb_allennlp.retention import (
+    KEEP,
+    KEEP_ARCHIVE,
+    KEEP_METADATA,
+    RetentionPolicy,
+    apply_retention,
+    paths_to_delete,
+)
+from wandb_allennlp.run_index import RunIndex
+
+DAY = 86400
+
+
+def run(run_id, sweep_id="s", metric=None, status="finished", age=0.0):
+    return {
+        "run_id": run_id,
+        "sweep_id": sweep_id,
+        "metric": metric,
+        "status": status,
+        "updated": 1000 * DAY - age * DAY,
+    }
+
+
+def test_policy_keeps_top_k_per_sweep():
+    policy = RetentionPolicy(metric="-best_validation_loss", keep_top_k=1)
+    plan = policy.plan(
+        [
+            run("a", metric=0.5),
+            run("b", metric=0.2),
+            run("c", sweep_id="t", metric=0.9),
+            run("d", metric=0.1, status="running"),
+            run("e", sweep_id=None),
+        ],
+        now=1000 * DAY,
+    )
+
+    assert plan == {
+        "a": KEEP_METADATA,
+        "b": KEEP,
+        "c": KEEP,
+        "d": KEEP,
+        "e": KEEP,
+    }
+
+
+def test_policy_keeps_recent_runs_and_only_archives():
+    policy = RetentionPolicy(keep_days=2, archives_only=True)
+    plan = policy.plan([run("a", age=1), run("b", age=3)], now=1000 * DAY)
+
+    assert plan == {"a": KEEP_ARCHIVE, "b": KEEP_METADATA}
+
+    with pytest.raises(ValueError):
+        RetentionPolicy(keep_top_k=3)
+
+
+def make_run_dir(path, archive=True):
+    path.mkdir()
+    (path / "vocabulary").mkdir()
+    (path / "vocabulary" / "tokens.txt").write_text("a\nb\n")
+
+    for name in ["config.json", "metrics.json", "out.log", "best.th"]:
+        (path / name).write_text("{}")
+    (path / "model_state_e0_b0.th").write_bytes(b"x" * 1000)
+
+    if archive:
+        (path / "model.tar.gz").write_bytes(b"x" * 100)
+
+    return str(path)
+
+
+def test_paths_to_delete(tmp_path):
+    with_archive = make_run_dir(tmp_path / "a")
+    without_archive = make_run_dir(tmp_path / "b", archive=False)
+
+    def names(paths):
+        return sorted(os.path.basename(p) for p in paths)
+
+    assert paths_to_delete(with_archive, KEEP) == []
+    assert names(paths_to_delete(with_archive, KEEP_ARCHIVE)) == [
+        "best.th",
+        "model_state_e0_b0.th",
+        "vocabulary",
+    ]
+    assert names(paths_to_delete(without_archive, KEEP_ARCHIVE)) == [
+        "model_state_e0_b0.th",
+        "vocabulary",
+    ]
+    assert names(paths_to_delete(with_archive, KEEP_METADATA)) == [
+        "best.th",
+        "model.tar.gz",
+        "model_state_e0_b0.th",
+        "vocabulary",
+    ]
+
+
+def test_apply_retention_deletes_and_reports_bytes(tmp_path):
+    index = RunIndex(str(tmp_path / "index.sqlite"))
+
+    for run_id, accuracy in [("a", 0.5), ("b", 0.9), ("c", 0.1)]:
+        index.add_run(run_id, make_run_dir(tmp_path / run_id), sweep_id="s")
+        index.finish_run(
+            run_id, "finished", {"best_validation_accuracy": accuracy}
+        )
+    policy = RetentionPolicy(metric="+best_validation_accuracy", keep_top_k=1)
+
+    deleted, reclaimed = apply_retention(index, policy, dry_run=True)
+    assert sorted(deleted) == ["a", "c"]
+    assert os.path.exists(tmp_path / "a" / "model.tar.gz")
+
+    deleted, reclaimed = apply_retention(index, policy, exclude=["c"])
+    assert sorted(deleted) == ["a"]
+    assert reclaimed == 2 + 1000 + 100 + 4
+    assert sorted(os.listdir(tmp_path / "a")) == [
+        "config.json",
+        "metrics.json",
+        "out.log",
+    ]
+    assert os.path.exists(tmp_path / "b" / "model_state_e0_b0.th")
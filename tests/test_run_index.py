@@ -0,0 +1,104 @@
+import sqlite3
+from contextlib import closing
+import pytest
+from wandb_allennlp.run_index import RunIndex, parse_filter
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = RunIndex(str(tmp_path / "index.sqlite"))
+
+    for i, (sweep_id, lr, accuracy) in enumerate(
+        [("s1", 0.1, 0.5), ("s1", 0.01, 0.9), ("s2", 0.01, None)]
+    ):
+        run_dir = tmp_path / f"run-{i}"
+        run_dir.mkdir()
+        index.add_run(
+            f"r{i}",
+            str(run_dir),
+            sweep_id=sweep_id,
+            status="running",
+            config={"trainer.optimizer.lr": lr, "model.type": "tagger"},
+        )
+
+        if accuracy is not None:
+            index.finish_run(
+                f"r{i}", "finished", {"best_validation_accuracy": accuracy}
+            )
+
+    return index
+
+
+def test_parse_filter():
+    assert parse_filter("status=finished") == ("status", "=", "finished")
+    assert parse_filter("config.a.b<=0.1") == ("config.a.b", "<=", 0.1)
+    assert parse_filter("config.x!=null") == ("config.x", "!=", None)
+
+    with pytest.raises(ValueError):
+        parse_filter("status")
+
+
+def test_query_filters_on_runs_config_and_metrics(index):
+    def ids(*filters, **kwargs):
+        return [
+            run["run_id"]
+            for run in index.query([parse_filter(f) for f in filters], **kwargs)
+        ]
+
+    assert ids("sweep_id=s1", order_by="run_id") == ["r0", "r1"]
+    assert ids("config.trainer.optimizer.lr<0.05", order_by="run_id") == [
+        "r1",
+        "r2",
+    ]
+    assert ids("status=running") == ["r2"]
+    assert ids("metrics.best_validation_accuracy>0.6") == ["r1"]
+    # runs without the metric come last
+    assert ids(order_by="-metrics.best_validation_accuracy") == [
+        "r1",
+        "r0",
+        "r2",
+    ]
+    assert ids(order_by="-metrics.best_validation_accuracy", limit=1) == ["r1"]
+
+    with pytest.raises(ValueError):
+        index.query([("unknown", "=", 1)])
+
+
+def test_query_returns_fields(index):
+    (run,) = index.query(
+        [("run_id", "=", "r0")],
+        fields=["config.trainer.optimizer.lr", "metrics.missing"],
+    )
+
+    assert run["sweep_id"] == "s1"
+    assert run["config.trainer.optimizer.lr"] == 0.1
+    assert run["metrics.missing"] is None
+
+
+def test_add_run_keeps_unset_fields_and_remove_run(index):
+    index.add_run("r0", index.find("r0"))
+    (run,) = index.query([("run_id", "=", "r0")], fields=["config.model.type"])
+
+    assert run["sweep_id"] == "s1"
+    assert run["status"] == "finished"
+    assert run["config.model.type"] == "tagger"
+
+    index.remove_run("r0")
+    assert index.find("r0") is None
+
+
+def test_old_index_is_migrated(tmp_path):
+    path = str(tmp_path / "index.sqlite")
+    with closing(sqlite3.connect(path)) as connection, connection:
+        connection.execute(
+            "CREATE TABLE runs (run_id TEXT PRIMARY KEY, "
+            "serialization_dir TEXT, created REAL, updated REAL)"
+        )
+        connection.execute(
+            "INSERT INTO runs VALUES ('old', ?, 0, 0)", (str(tmp_path),)
+        )
+
+    index = RunIndex(path)
+
+    assert index.find("old") == str(tmp_path)
+    assert index.query()[0]["status"] is None
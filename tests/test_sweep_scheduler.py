@@ -0,0 +1,92 @@
+import sys
+from wandb_allennlp.sweep.scheduler import (
+    SweepScheduler,
+    ParameterSetTrialSource,
+    WandbAgentTrialSource,
+    build_command,
+    device_slots,
+)
+
+# exits with the value of --code
+TRIAL = [
+    sys.executable,
+    "-c",
+    "import sys; sys.exit(int(sys.argv[-1].split('=')[1]))",
+    "${args}",
+]
+
+
+def test_build_command():
+    command = build_command(
+        ["${program}", "train-with-wandb", "config.jsonnet", "${args}"],
+        {"env.a": 1, "model.d": True},
+    )
+    assert command == [
+        "allennlp",
+        "train-with-wandb",
+        "config.jsonnet",
+        "--env.a=1",
+        "--model.d=True",
+    ]
+
+
+def test_scheduler_runs_all_parameter_sets():
+    source = ParameterSetTrialSource(
+        [{"code": 0} for _ in range(5)], command=TRIAL
+    )
+    scheduler = SweepScheduler(
+        source, device_slots(cpu_slots=2), poll_interval=0.01
+    )
+    returncodes = scheduler.run()
+    assert len(returncodes) == 5
+    assert not any(returncodes.values())
+    assert source.results == returncodes
+
+
+def test_scheduler_restarts_failed_trials():
+    source = ParameterSetTrialSource(
+        [{"code": 0}, {"code": 3}], command=TRIAL
+    )
+    scheduler = SweepScheduler(
+        source,
+        device_slots(cpu_slots=2),
+        max_restarts=2,
+        poll_interval=0.01,
+    )
+    returncodes = scheduler.run()
+    assert sorted(returncodes.values()) == [0, 3]
+    assert list(scheduler.restarts.values()) == [2]
+
+
+def test_one_agent_per_slot():
+    def commands(source):
+        return [trial.command for trial in iter(source.next_trial, None)]
+
+    assert commands(WandbAgentTrialSource("e/p/s", num_agents=2)) == [
+        ["wandb", "agent", "e/p/s"],
+        ["wandb", "agent", "e/p/s"],
+    ]
+    assert commands(WandbAgentTrialSource("e/p/s", 3, count=7)) == [
+        ["wandb", "agent", "--count=3", "e/p/s"],
+        ["wandb", "agent", "--count=2", "e/p/s"],
+        ["wandb", "agent", "--count=2", "e/p/s"],
+    ]
+    assert len(commands(WandbAgentTrialSource("e/p/s", 4, count=2))) == 2
+
+
+def test_agents_are_not_restarted():
+    class FailingAgents(WandbAgentTrialSource):
+        def next_trial(self):
+            trial = super().next_trial()
+
+            return trial and trial._replace(command=TRIAL[:3] + ["--code=1"])
+
+    scheduler = SweepScheduler(
+        FailingAgents("e/p/s", num_agents=2),
+        device_slots(cpu_slots=2),
+        max_restarts=2,
+        poll_interval=0.01,
+    )
+
+    assert scheduler.run() == {"agent-1": 1, "agent-2": 1}
+    assert scheduler.restarts == {}
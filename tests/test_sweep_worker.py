@@ -0,0 +1,49 @@
+import argparse
+import os
+import pytest
+
+
+def test_sweep_worker(script_runner):
+
+    ret = script_runner.run(
+        "allennlp",
+        "wandb-sweep-worker",
+        "dhruveshpate/wandb-allennlp-wandb_allennlp_tests/fyntzj7v",
+        "configs/parameter_tying_v1.0.0.jsonnet",
+        "--include-package=models",
+        "--count=2",
+    )
+
+    assert ret.success
+    assert "Using cached vocabulary" in ret.stdout + ret.stderr
+    assert not (
+        "(failed 1)" in ret.stderr
+        or "wandb: Program failed with code 1" in ret.stderr
+    )
+
+
+def test_env_vars_of_a_trial_do_not_leak(monkeypatch):
+    from wandb_allennlp.commands import sweep_worker
+
+    monkeypatch.setenv("KEPT", "before")
+    monkeypatch.delenv("ADDED", raising=False)
+    seen = []
+
+    def run(args, overrides, env_vars):
+        seen.append((os.environ["KEPT"], os.environ["ADDED"]))
+        raise RuntimeError("the trial failed")
+
+    monkeypatch.setattr(
+        sweep_worker,
+        "read_sweep_params_from_env",
+        lambda: ["--env.KEPT=trial", "--env.ADDED=1", "--model.a=2"],
+    )
+    monkeypatch.setattr(sweep_worker, "_run_trial", run)
+
+    with pytest.raises(RuntimeError):
+        sweep_worker.run_trial(argparse.Namespace())
+
+    # the values are JSON, for std.parseJson
+    assert seen == [('"trial"', "1")]
+    assert os.environ["KEPT"] == "before"
+    assert "ADDED" not in os.environ